@@ -2,22 +2,37 @@
 import json
 
 from chalice import Chalice, Response
-import boto3 as boto3
-from jinja2 import Environment, FileSystemLoader, BaseLoader
-import markdown
+from jinja2 import Environment, FileSystemLoader
 
 from chalicelib.animation import animation_page_handler, load_img_handler
-from chalicelib.paginator_v2 import _unb64, list_articles
+from chalicelib.article_render import RENDERER_VERSION, get_article_html
+from chalicelib.assets import AssetRegistry, STATIC_ASSETS
+from chalicelib.aws_clients import aws
+from chalicelib.cache_policy import LISTING_CURSOR_PAGE, LISTING_FIRST_PAGE, cache_policies
+from chalicelib.paginator_v2 import PAGE_SIZE, _unb64, list_articles
 from chalicelib.threejs_dict import ANIMATIONS_DICT
-from chalicelib.caching import brotli_compress, create_response_headers, create_compressed_response
-from chalicelib.main import get_menu_items, get_s3_template, get_website_data
+from chalicelib.caching import create_response_headers, create_compressed_response, cache_control_for
+from chalicelib.caching import compress_body, negotiate_request_encoding
+from chalicelib.caching import fingerprint_etag, http_date, is_not_modified, not_modified_response, representation_etag
+from chalicelib.counters import page_count
+from chalicelib.incremental import REGENERATION_BATCH_WINDOW, regenerate_from_stream
+from chalicelib.fanout import Call, fan_out, stats as fan_out_stats
+from chalicelib.invalidation import article_key, listing_key, tag_key, template_key
+from chalicelib.main import listing_number_url, listing_page_url, listing_tag_url, get_s3_template
+from chalicelib.metadata_snapshot import build as build_metadata_snapshot, metadata_snapshots
+from chalicelib.page_cache import CachedPage, article_page_cache
+from chalicelib.page_fill import page_fill_stats
+from chalicelib.page_index import page_start_key, page_window, stats as page_index_stats
 from chalicelib.payments import stripe_webhook_handler, checkout_session_handler
-from chalicelib.threejs_helpers import populate_importmaps, grouped_nav_items
+from chalicelib.precompiled_templates import create_s3_env, load_manifest
+from chalicelib.site_config import site_config
+from chalicelib.tag_feed import TAG_MODES, parse_tags
+from chalicelib.template_store import template_store
+from chalicelib.threejs_helpers import create_threejs_data
 from chalicelib.utils import datetime_filter, url_to_descriptive, icon_to_descriptive
 
 DEBUG = True
 LOCAL = False
-THREEJS_VERSION = '0.169.0'
 
 
 
@@ -27,6 +42,15 @@ def debug(current_request):
     print("[DEBUG] Query Parameters:", current_request.query_params)
     print("[DEBUG] Path Parameters:", current_request.uri_params)
     print("[DEBUG] Request Method:", current_request.method)
+    print("[DEBUG] Template cache:", template_store.stats())
+    print("[DEBUG] Article page cache:", article_page_cache.stats())
+    print("[DEBUG] Cache policies:", cache_policies.stats())
+    print("[DEBUG] AWS clients:", aws.stats())
+    print("[DEBUG] Site config:", site_config.stats())
+    print("[DEBUG] Page fill:", page_fill_stats.stats())
+    print("[DEBUG] Page index:", page_index_stats())
+    print("[DEBUG] Metadata snapshot:", metadata_snapshots.stats())
+    print("[DEBUG] Fan-out:", fan_out_stats())
     # Log headers for debugging
     #print("[DEBUG] Headers:", current_request.headers)
 
@@ -55,17 +79,21 @@ from os.path import join
 
 env = Environment(loader=FileSystemLoader(join(cwd, 'chalicelib', 'frontend'), encoding='utf8'))
 
-s3_env = Environment(loader=BaseLoader())
+# Loads the templates precompiled at deploy time when present; see chalicelib/precompiled_templates.py.
+s3_env = create_s3_env()
+template_store.register_precompiled(os.environ.get('BUCKET_NAME'), load_manifest())
+
+# Read during Lambda's init phase, so a container's first requests neither wait on Parameter Store/DynamoDB nor get
+# the built-in defaults meanwhile. A failed load is logged and retried on the request path.
+cache_policies.refresh()
+site_config.refresh()
 
 
 env.filters['datetime'] = datetime_filter
-s3_env.filters['datetime'] = datetime_filter
 
 env.filters['url_to_descriptive'] = url_to_descriptive
-s3_env.filters['url_to_descriptive'] = url_to_descriptive
 
 env.filters['icon_to_descriptive'] = icon_to_descriptive
-s3_env.filters['icon_to_descriptive'] = icon_to_descriptive
 
 
 """
@@ -73,82 +101,115 @@ s3_env.filters['icon_to_descriptive'] = icon_to_descriptive
 """
 
 
-def create_threejs_data(animation: str, data_selected: str, fullscreen: bool = False, navbar: bool = False):
-    viz = ANIMATIONS_DICT.get(animation, ANIMATIONS_DICT['multiaxis'])
-    print('viz', viz, 'multiaxis', ANIMATIONS_DICT)
-
-    threejs_version = viz.get('threejs_version', THREEJS_VERSION)
-
-    # TODO: Too many imports by default, need to fix this.
-    importmap = populate_importmaps(animation, threejs_version)
-
-    threejs_template_data = dict(
-        threejs_version=THREEJS_VERSION,
-        threejs_drawings=viz,
-        data_selected=data_selected,
-        importmap=json.dumps(importmap, indent=4),
-        fullscreen=fullscreen,
-    )
-
-    if navbar:
-        nav_item_ordering = ['Special', 'Educational', 'Quantitative', 'Spatial', 'World Building', 'Experimental',
-                             'Component', 'Attribution', 'Work in Progress', 'Local']
-        ordered_grouped_nav_items = grouped_nav_items(nav_item_ordering)
-        threejs_template_data['grouped_nav_items'] = ordered_grouped_nav_items
-    else:
-        threejs_template_data['grouped_nav_items'] = dict()
-
-    return threejs_template_data
-
+def fetch_paginated(after, before, tag, threejs_template_data, article_type: str = 'ARTICLE', page_name: str = 'Blog',
+                    requested_version: str = None, tag_mode: str = 'or', page: str = None):
+    """
+    Render a listing page. The first page is cached briefly (it changes whenever something is published);
+    cursor pages whose `v` matches the current content version are cached as immutable, since a publish
+    bumps the version and with it every pagination link.
 
-def fetch_paginated(after, before, tag, threejs_template_data, article_type: str = 'ARTICLE', page_name: str = 'Blog'):
+    `page` (?page=N) is resolved to the cursor of page N through the listing's page index.
+    """
     try:
-        # Get menu items and parse query parameters
-        menu = get_menu_items()
+        # ?tag=aws,python&mode=and|or; the tags are normalised so equivalent URLs render (and cache) the same page
+        tags = parse_tags(tag)
+        tag = ','.join(tags) or None
+        tag_mode = tag_mode if tag_mode in TAG_MODES else 'or'
+
+        if before:
+            direction = 'newer'
+            cursor = before
+        else:
+            direction = 'older'
+            cursor = after
+
+        config = site_config.get(article_type, min_version=requested_version)
+        version = config.content_version(article_type)
+
+        # Deep links cost one Query: the page index gives the key page N starts after (not for multi-tag feeds).
+        page_number = int(page) if page and page.isdigit() and not cursor and len(tags) <= 1 else None
+        if page_number and page_number > 1:
+            cursor = page_start_key(page_number, PAGE_SIZE, article_type, tag, version)
+
+        # Links from an older version still work, they just aren't cached for long.
+        is_current_cursor_page = cursor is not None and requested_version == str(version)
+        page_kind = LISTING_CURSOR_PAGE if is_current_cursor_page else LISTING_FIRST_PAGE
+
+        # Validators come from the page's inputs, not its articles: every publish, edit or removal bumps the content
+        # version (and counters), so a revalidation is answered from memory before the template or page is read.
+        # A container that hasn't loaded the template yet can't know its ETag, so it answers after the reads.
+        def listing_etag():
+            template_etag = template_store.etag(os.environ['BUCKET_NAME'], 'frontend/index.html')
+            if template_etag is None and not LOCAL:
+                return None
+            return fingerprint_etag(
+                'listing', article_type, page_name, tag, tag_mode, direction, json.dumps(cursor, sort_keys=True, default=str),
+                page_number, template_etag, RENDERER_VERSION, json.dumps([config.social, config.menu], sort_keys=True, default=str),
+                json.dumps(threejs_template_data, sort_keys=True, default=str), version
+            )
 
-        # Get template from S3 and website data from DynamoDB
-        template = get_s3_template(s3_env, os.environ['BUCKET_NAME'], local=LOCAL)
-        website_data = get_website_data(os.environ['HOME_TABLE'])
+        # Compared as the representation create_compressed_response will send (its ETag carries the encoding).
+        encoding = negotiate_request_encoding(app.current_request.headers)
+        etag = listing_etag()
+        if etag and is_not_modified(app.current_request.headers, representation_etag(etag, encoding)):
+            return not_modified_response(representation_etag(etag, encoding),
+                                         cache_control_for('text/html; charset=UTF-8', page_kind))
 
-        # Query articles
+        # The template (S3) and the page of articles are independent, so fetch them together
         try:
-            if before:
-                direction = 'newer'
-                cursor = before
-            else:
-                direction = 'older'
-                cursor = after
-
-            items, next_key, prev_key = list_articles(
-                tag=tag,
-                start_key=cursor,
-                full_articles=False,
-                direction=direction,
-                article_type=article_type,
+            results = fan_out(
+                template=Call(get_s3_template, s3_env, os.environ['BUCKET_NAME'], local=LOCAL),
+                page=Call(list_articles, tag=tag, start_key=cursor, full_articles=False, direction=direction,
+                          article_type=article_type, tag_mode=tag_mode, min_version=requested_version),
             )
-
-            print(f"[DEBUG] Direction: {direction}, Tag: {tag}, After: {after}, Before: {before}, Cursor: {cursor}, Number of items: {len(items)}")
         except Exception as e:
-            print("Error querying DynamoDB:", e)
+            print("Error fetching listing page inputs:", e)
             return Response(str(e), status_code=500)
 
+        template = results['template']
+        items, next_key, prev_key = results['page']
+        total_count = config.total(article_type, tags)
+        pages = None if total_count is None else page_count(total_count, PAGE_SIZE)
+        current_page = page_number or (1 if cursor is None else None)
+        page_links = []
+        if pages and pages > 1 and len(tags) <= 1:
+            page_links = [dict(number=number, url=listing_number_url(article_type, number, version, tag=tag),
+                               current=number == current_page) for number in page_window(current_page or 1, pages)]
+        facets = [dict(tag=facet_tag, count=count, url=listing_tag_url(article_type, facet_tag))
+                  for facet_tag, count in config.tag_facets(article_type)]
+
+        print(f"[DEBUG] Direction: {direction}, Tag: {tag}, After: {after}, Before: {before}, Cursor: {cursor}, Number of items: {len(items)}")
+
         print('[DEBUG] Queried articles:', len(items), items)
 
         print('prev_key', prev_key)
         print('next_key', next_key)
 
+        if etag is None:
+            etag = listing_etag()
+            if is_not_modified(app.current_request.headers, representation_etag(etag, encoding)):
+                return not_modified_response(representation_etag(etag, encoding),
+                                             cache_control_for('text/html; charset=UTF-8', page_kind))
+
         # Render template
         template_data = {
-            'social': website_data['social'],
+            'social': config.social,
             'articles': items,
-            'menu': menu,
-            'prev_key': prev_key,
-            'next_key': next_key,
+            'menu': config.menu,
+            'prev_url': listing_page_url(article_type, 'before', prev_key, version, tag=tag, mode=tag_mode),
+            'next_url': listing_page_url(article_type, 'after', next_key, version, tag=tag, mode=tag_mode),
+            'total_count': total_count,
+            'page_count': pages,
+            'page_links': page_links,
+            'tag_facets': facets,
         }
         html_content = template.render(**template_data, **threejs_template_data, page_name=page_name)
 
         # Create and return response
-        return create_compressed_response(html_content, skip_caching=True)
+        surrogate_keys = [listing_key(article_type), template_key('frontend/index.html')] + [tag_key(t) for t in tags]
+        surrogate_keys += [article_key(article_type, item.get('SK')) for item in items]
+        return create_compressed_response(html_content, etag=etag, request_headers=app.current_request.headers, route=page_kind,
+                                          surrogate_keys=surrogate_keys)
 
     except Exception as e:
         print(f"Unexpected error in script_template: {e}")
@@ -166,13 +227,15 @@ def index():
     before = _unb64(query_params.get("before"))
 
     tag = query_params.get('tag') if query_params else None
+    mode = query_params.get('mode', 'or')
 
     animation = query_params.get('animation', 'multiaxis') if query_params else 'multiaxis'
     data_selected = query_params.get('data_selected', 'data') if query_params else 'data'
 
     threejs_template_data = create_threejs_data(animation, data_selected)
     
-    return fetch_paginated(after, before, tag, threejs_template_data)
+    return fetch_paginated(after, before, tag, threejs_template_data, requested_version=query_params.get('v'), tag_mode=mode,
+                           page=query_params.get('page'))
 
 
 @app.route('/index.html')
@@ -193,13 +256,15 @@ def projects():
     before = _unb64(query_params.get("before"))
 
     tag = query_params.get('tag') if query_params else None
+    mode = query_params.get('mode', 'or')
 
     animation = query_params.get('animation', 'multiaxis') if query_params else 'multiaxis'
     data_selected = query_params.get('data_selected', 'data') if query_params else 'data'
 
     threejs_template_data = create_threejs_data(animation, data_selected)
 
-    return fetch_paginated(after, before, tag, threejs_template_data, article_type='PROJECT', page_name='Projects')
+    return fetch_paginated(after, before, tag, threejs_template_data, article_type='PROJECT', page_name='Projects',
+                           requested_version=query_params.get('v'), tag_mode=mode, page=query_params.get('page'))
 
 
 @app.route('/work')
@@ -214,22 +279,26 @@ def work():
     before = _unb64(query_params.get("before"))
 
     tag = query_params.get('tag') if query_params else None
+    mode = query_params.get('mode', 'or')
 
     animation = query_params.get('animation', 'multiaxis') if query_params else 'multiaxis'
     data_selected = query_params.get('data_selected', 'data') if query_params else 'data'
 
     threejs_template_data = create_threejs_data(animation, data_selected)
 
-    return fetch_paginated(after, before, tag, threejs_template_data, article_type='WORK', page_name='Past Work')
+    return fetch_paginated(after, before, tag, threejs_template_data, article_type='WORK', page_name='Past Work',
+                           requested_version=query_params.get('v'), tag_mode=mode, page=query_params.get('page'))
 
 def serve_threejs_helper(animation: str = 'multiaxis', query_params: dict = None, fullscreen: bool = False):
     print('ABOUT TO SERVE THREEJS ANIMATION:', animation)
-    s3 = boto3.resource('s3')
 
     if LOCAL:
-        template_string = open(join(cwd, 'templates', 'threejs.html'), 'r').read()
+        template = s3_env.from_string(open(join(cwd, 'templates', 'threejs.html'), 'r').read())
+        template_etag = None
     else:
-        template_string = s3.Object(os.environ['BUCKET_NAME'], 'frontend/threejs.html').get()["Body"].read().decode('utf-8')
+        template_entry = template_store.get_entry(s3_env, os.environ['BUCKET_NAME'], 'frontend/threejs.html')
+        template = template_entry.template
+        template_etag = template_entry.etag
 
     animation = animation.replace('_fullscreen', '')
     viz = ANIMATIONS_DICT.get(animation, ANIMATIONS_DICT['multiaxis'])
@@ -241,9 +310,15 @@ def serve_threejs_helper(animation: str = 'multiaxis', query_params: dict = None
 
     threejs_template_data = create_threejs_data(animation, data_selected, navbar=not fullscreen, fullscreen=fullscreen)
 
-    html_content = s3_env.from_string(template_string).render(**threejs_template_data)
+    etag = fingerprint_etag('threejs', template_etag, json.dumps(threejs_template_data, sort_keys=True, default=str))
+    sent_etag = representation_etag(etag, negotiate_request_encoding(app.current_request.headers))
+    if is_not_modified(app.current_request.headers, sent_etag):
+        return not_modified_response(sent_etag, 'no-cache')
 
-    return create_compressed_response(html_content, skip_caching=True)
+    html_content = template.render(**threejs_template_data)
+
+    return create_compressed_response(html_content, skip_caching=True, etag=etag, request_headers=app.current_request.headers,
+                                      surrogate_keys=[template_key('frontend/threejs.html')])
 
 l = [
     'adventure1','adventure2','buildings','cards','cayley','clustering','data','experimental_1','experimental','familytree',
@@ -321,34 +396,19 @@ def data_fallback_to_s3():
 """
     JAVASCRIPT, JSON, AND CSS ENDPOINTS
 """
-@app.route('/style.css')
-def serve_css():
-    s3 = boto3.resource('s3')
-    if LOCAL:
-        css_content = open(join(cwd, 'templates', 'style.css'), 'r').read()
-    else:
-        css_content = s3.Object(os.environ['BUCKET_NAME'], 'frontend/style.css').get()["Body"].read().decode('utf-8')
-
-    compressed_css = brotli_compress(css_content.encode('utf-8'))
+static_assets = AssetRegistry(STATIC_ASSETS, bucket_name=os.environ.get('BUCKET_NAME'), local=LOCAL, base_dir=cwd)
 
-    return Response(
-        body=compressed_css,
-        headers=create_response_headers('text/css', compressed_css),
-        status_code=200
-    )
 
-@app.route('/static/styles/caption-labels.css')
-def serve_css():
-    s3 = boto3.resource('s3')
-    css_content = s3.Object(os.environ['BUCKET_NAME'], 'frontend/caption-labels.css').get()["Body"].read().decode('utf-8')
+def make_static_asset_view(asset_name: str):
+    def view():
+        return static_assets.response(asset_name, app.current_request.headers)
+    view.__name__ = asset_name
+    return view
 
-    compressed_css = brotli_compress(css_content.encode('utf-8'))
 
-    return Response(
-        body=compressed_css,
-        headers=create_response_headers('text/css', compressed_css),
-        status_code=200
-    )
+# One GET route per entry in the STATIC_ASSETS manifest (style.css, caption-labels.css, favicon.ico).
+for static_asset in STATIC_ASSETS:
+    app.route(static_asset['route'])(make_static_asset_view(static_asset['name']))
 
 """
     CONTACT FORM
@@ -358,8 +418,7 @@ def contact_form():
     import uuid
     import time
     from urllib.parse import parse_qs
-    db = boto3.resource('dynamodb')
-    table = db.Table(os.environ['CONTACT_TABLE'])
+    table = aws.table(os.environ['CONTACT_TABLE'])
     data = parse_qs(app.current_request.raw_body.decode('utf-8'))
     timestamp = int(time.time() * 1000)
     item = {'id': str(uuid.uuid1()), 'email': data['email'], 'message': data['message'], 'createdAt': timestamp, 'updatedAt': timestamp}
@@ -380,6 +439,15 @@ SECTIONS_DICT = {
     'services': 'SERVICE',
 }
 
+
+def load_article_template():
+    """The article template and its ETag (None locally, where it is read from disk)."""
+    if LOCAL:
+        return s3_env.from_string(open(join(cwd, 'templates', 'article.html'), 'r').read()), None
+    template_entry = template_store.get_entry(s3_env, os.environ['BUCKET_NAME'], 'frontend/article.html')
+    return template_entry.template, template_entry.etag
+
+
 @app.route('/{section}/{article}')
 def articles(section, article):
     if DEBUG:
@@ -388,22 +456,14 @@ def articles(section, article):
     if section == 'threejs':
         return serve_threejs(article)
 
-    s3 = boto3.resource('s3')
-    website_menu = get_menu_items()
-    non_index_menu = [dict(title=item['title'], url=f"/index.html{item['url']}") for item in website_menu]
+    non_index_menu = site_config.get().non_index_menu
     if section not in ['services', 'work', 'blog', 'projects', 'articles']:
-        html_content = s3_env.from_string(s3.Object(os.environ['BUCKET_NAME'], 'frontend/404.html').get()["Body"].read().decode('utf-8')).render(menu=non_index_menu)
+        html_content = template_store.get_template(s3_env, os.environ['BUCKET_NAME'], 'frontend/404.html').render(menu=non_index_menu)
 
-        compressed_html = brotli_compress(html_content.encode('utf-8'))
-
-        return Response(
-            body=compressed_html,
-            headers=create_response_headers('text/html; charset=UTF-8', compressed_html),
-            status_code=404
-        )
+        return create_compressed_response(html_content, request_headers=app.current_request.headers, status_code=404,
+                                          surrogate_keys=[template_key('frontend/404.html')])
 
-    db = boto3.resource('dynamodb')
-    article_table = db.Table(os.environ['ARTICLES_V2_TABLE'])
+    article_table = aws.table(os.environ['ARTICLES_V2_TABLE'])
 
     pk = SECTIONS_DICT.get(section, None)
     sk = article.split('-')[0] if '-' in article else None
@@ -412,18 +472,18 @@ def articles(section, article):
     except ValueError: sk = None
 
     if not pk or not sk:
-        html_content = s3_env.from_string(
-            s3.Object(os.environ['BUCKET_NAME'], 'frontend/404.html').get()["Body"].read().decode('utf-8')).render(
-            menu=non_index_menu)
-        compressed_html = brotli_compress(html_content.encode('utf-8'))
-        return Response(
-            body=compressed_html,
-            headers=create_response_headers('text/html; charset=UTF-8', compressed_html),
-            status_code=404
-        )
+        html_content = template_store.get_template(s3_env, os.environ['BUCKET_NAME'], 'frontend/404.html').render(menu=non_index_menu)
+
+        return create_compressed_response(html_content, request_headers=app.current_request.headers, status_code=404,
+                                          surrogate_keys=[template_key('frontend/404.html')])
 
     print("[DEBUG] Fetching article with PK:", pk, "and SK:", sk)
-    article_data = article_table.get_item(Key={'PK': pk, 'SK': sk}).get('Item', None)
+    # The article and its template are independent, so fetch them together
+    results = fan_out(
+        article=Call(article_table.get_item, Key={'PK': pk, 'SK': sk}),
+        template=Call(load_article_template),
+    )
+    article_data = results['article'].get('Item', None)
 
     if DEBUG:
         print(f"[DEBUG] PK: {pk}. SK: {sk}.")
@@ -433,35 +493,89 @@ def articles(section, article):
         print("[DEBUG] Article:", article_data)
 
     if article_data:
-        if LOCAL:
-            full_article_html_string = open(join(cwd, 'templates', 'article.html'), 'r').read()
-        else:
-            full_article_html_string = s3.Object(os.environ['BUCKET_NAME'], 'frontend/article.html').get()["Body"].read().decode('utf-8')
-        full_article_html = s3_env.from_string(full_article_html_string).render(section=section, article=article_data, menu=non_index_menu)
+        article_template, template_etag = results['template']
 
-        md_content = article_data['body']
+        # The get_item above is the only read a conditional request pays for.
+        etag = fingerprint_etag('article', pk, sk, article_data.get('updatedAt'), template_etag, RENDERER_VERSION)
+        last_modified = http_date(article_data.get('updatedAt'))
+        # Article pages are compressed once and then served from the page cache, so they use the static tier.
+        encoding = negotiate_request_encoding(app.current_request.headers)
+        if is_not_modified(app.current_request.headers, representation_etag(etag, encoding), last_modified):
+            return not_modified_response(representation_etag(etag, encoding),
+                                         cache_control_for('text/html; charset=UTF-8', app.current_request.path), last_modified)
 
-        html_content = markdown.markdown(md_content, extensions=["fenced_code", "codehilite", "tables", "toc", "md_mermaid"])
+        page_cache_key = None if LOCAL else (pk, sk, article_data.get('updatedAt'), template_etag, encoding)
+        cached_page = article_page_cache.get(page_cache_key) if page_cache_key else None
+        if cached_page:
+            # Cache-Control is re-read so policy changes apply to pages cached before them.
+            headers = dict(cached_page.headers, **{'Cache-Control': cache_control_for('text/html; charset=UTF-8', app.current_request.path)})
+            return Response(body=cached_page.body, headers=headers, status_code=cached_page.status_code)
+
+        full_article_html = article_template.render(section=section, article=article_data, menu=non_index_menu)
+
+        # Rendered at write time; only re-rendered (and stored back) when RENDERER_VERSION changes.
+        html_content = get_article_html(article_data, article_table)
 
         full_article_html = full_article_html.replace('___ARTICLE___', html_content)
 
-        compressed_html = brotli_compress(full_article_html.encode('utf-8'))
+        compressed_html = compress_body(full_article_html.encode('utf-8'), encoding, tier='static')
+        surrogate_keys = [article_key(pk, sk), template_key('frontend/article.html')]
+        surrogate_keys += [tag_key(tag) for tag in article_data.get('tags', [])]
+        headers = create_response_headers('text/html; charset=UTF-8', compressed_html, etag=etag, last_modified=last_modified,
+                                          content_encoding=encoding, route=app.current_request.path, surrogate_keys=surrogate_keys)
+
+        if page_cache_key:
+            article_page_cache.put(page_cache_key, CachedPage(compressed_html, headers, 200))
 
         return Response(
             body=compressed_html,
-            headers=create_response_headers('text/html; charset=UTF-8', compressed_html),
+            headers=headers,
             status_code=200
         )
     else:
-        html_content = s3_env.from_string(s3.Object(os.environ['BUCKET_NAME'], 'frontend/404.html').get()["Body"].read().decode('utf-8')).render(menu=non_index_menu)
+        html_content = template_store.get_template(s3_env, os.environ['BUCKET_NAME'], 'frontend/404.html').render(menu=non_index_menu)
 
-        compressed_html = brotli_compress(html_content.encode('utf-8'))
+        return create_compressed_response(html_content, request_headers=app.current_request.headers, status_code=404,
+                                          surrogate_keys=[template_key('frontend/404.html')])
+
+
+"""
+    INCREMENTAL STATIC-SITE REGENERATION
+"""
+def on_stream_record(stream_arn_variable: str, handler):
+    """
+    Subscribe `handler` to the stream in `stream_arn_variable`, if it is configured (deployments without it are
+    unchanged). Chalice points the Lambda at `app.<handler name>`, so bind the result to that name: it is the
+    wrapper that turns (event, context) into the DynamoDBEvent the handler expects.
+    """
+    if not os.environ.get(stream_arn_variable):
+        return handler
+    return app.on_dynamodb_record(
+        stream_arn=os.environ[stream_arn_variable],
+        name=handler.__name__,
+        batch_size=100,
+        maximum_batching_window_in_seconds=REGENERATION_BATCH_WINDOW
+    )(handler)
+
+
+def regenerate_articles_v2(event):
+    regenerate_from_stream([record.to_dict() for record in event])
 
-        return Response(
-            body=compressed_html,
-            headers=create_response_headers('text/html; charset=UTF-8', compressed_html),
-            status_code=404
-        )
+
+def regenerate_tag_index(event):
+    regenerate_from_stream([record.to_dict() for record in event])
+
+
+regenerate_articles_v2 = on_stream_record('ARTICLES_V2_STREAM_ARN', regenerate_articles_v2)
+regenerate_tag_index = on_stream_record('TAG_INDEX_STREAM_ARN', regenerate_tag_index)
+
+
+def rebuild_metadata_snapshot(event):
+    build_metadata_snapshot()
+
+
+# Any article write makes the listing snapshot stale; listings are read from DynamoDB until the rebuild is published.
+rebuild_metadata_snapshot = on_stream_record('ARTICLES_V2_STREAM_ARN', rebuild_metadata_snapshot)
 
 
 """
@@ -502,27 +616,9 @@ def animation():
 
     return animation_page_handler(animation_name, background_image_url, show_path_bool, dot_size, dot_color, image_top_padding, image_bottom_padding)
 
-@app.route('/favicon.ico')
-def favicon():
-    s3 = boto3.resource('s3')
-    favicon_content = s3.Object(os.environ['BUCKET_NAME'], 'frontend/favicon.ico').get()["Body"].read()
-
-    compressed_favicon = brotli_compress(favicon_content)
-
-    try:
-        return Response(
-            body=compressed_favicon,
-            headers=create_response_headers('image/x-icon', compressed_favicon),
-            status_code=200
-        )
-    except Exception as e:
-        print(f"Error serving favicon: {e}")
-        return Response(body='Error serving favicon', status_code=500)
-
 @app.route('/sitemap.xml')
 def sitemap():
-    s3 = boto3.resource('s3')
-    myString = s3.Object(os.environ['BUCKET_NAME'], 'sitemap.xml').get()["Body"].read().decode('utf-8')
+    myString = aws.resource('s3').Object(os.environ['BUCKET_NAME'], 'sitemap.xml').get()["Body"].read().decode('utf-8')
     return Response(myString, headers={'Content-Type': 'application/xml'}, status_code=200)
 
 '''
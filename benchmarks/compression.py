@@ -0,0 +1,92 @@
+"""
+Bytes-vs-CPU tradeoffs of the compression levels used in chalicelib/caching.py.
+
+Usage:
+    python -m benchmarks.compression                      # templates/ only
+    python -m benchmarks.compression --pages pages/       # plus captured pages, e.g.
+        curl -s --compressed https://www.darrenmackenzie.com/ > pages/home.html
+    python -m benchmarks.compression --output bench_output.txt
+"""
+import argparse
+import glob
+import gzip
+import os
+import statistics
+import time
+from os.path import basename, dirname, join
+
+import brotli
+
+from chalicelib.caching import COMPRESSION_TIERS
+
+
+ROOT = dirname(dirname(__file__))
+
+LEVELS = [('br', q) for q in (1, 4, 5, 6, 9, 11)] + [('gzip', l) for l in (1, 6, 9)]
+
+
+def compress(data: bytes, encoding: str, level: int) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def time_compression(data: bytes, encoding: str, level: int, runs: int) -> (int, float):
+    timings = []
+    size = 0
+    for _ in range(runs):
+        start = time.perf_counter()
+        size = len(compress(data, encoding, level))
+        timings.append((time.perf_counter() - start) * 1000)
+    return size, statistics.median(timings)
+
+
+def load_pages(pages_dir: str or None) -> dict:
+    paths = sorted(glob.glob(join(ROOT, 'templates', '*.html')) + glob.glob(join(ROOT, 'templates', '*.css'))
+                   + glob.glob(join(ROOT, 'templates', '*.js')))
+    if pages_dir:
+        paths += sorted(glob.glob(join(pages_dir, '*')))
+
+    pages = {}
+    for path in paths:
+        with open(path, 'rb') as f:
+            pages[basename(path)] = f.read()
+    return pages
+
+
+def run(pages: dict, runs: int) -> list:
+    tiers = {(enc, level): name for name, levels in COMPRESSION_TIERS.items() for enc, level in levels.items()}
+
+    lines = [f"{'page':<20} {'raw':>8} {'encoding':>9} {'bytes':>8} {'ratio':>6} {'ms':>8}  tier"]
+    totals = {}
+    for name, data in pages.items():
+        for encoding, level in LEVELS:
+            size, ms = time_compression(data, encoding, level, runs)
+            total = totals.setdefault((encoding, level), [0, 0, 0.0])
+            total[0] += len(data)
+            total[1] += size
+            total[2] += ms
+            lines.append(f"{name:<20} {len(data):>8} {f'{encoding}-{level}':>9} {size:>8} {size / len(data):>6.3f} "
+                         f"{ms:>8.3f}  {tiers.get((encoding, level), '')}")
+        lines.append('')
+
+    lines.append('TOTAL')
+    for (encoding, level), (raw, size, ms) in totals.items():
+        lines.append(f"{'all pages':<20} {raw:>8} {f'{encoding}-{level}':>9} {size:>8} {size / raw:>6.3f} "
+                     f"{ms:>8.3f}  {tiers.get((encoding, level), '')}")
+    return lines
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', help='directory of captured pages to include')
+    parser.add_argument('--runs', type=int, default=20, help='timed runs per page and level (median is reported)')
+    parser.add_argument('--output', help='also write the table to this file')
+    args = parser.parse_args()
+
+    report = '\n'.join(run(load_pages(args.pages), args.runs))
+    print(report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
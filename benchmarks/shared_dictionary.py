@@ -0,0 +1,57 @@
+"""
+Size/latency of dictionary-compressed responses (dcz) against the current brotli output.
+
+Usage:
+    python -m benchmarks.shared_dictionary                   # templates/ (what the dictionary was trained on)
+    python -m benchmarks.shared_dictionary --pages pages/    # captured pages, the fair comparison
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.compression import load_pages
+from chalicelib.caching import COMPRESSION_TIERS, brotli_compress, compress_body
+from chalicelib.shared_dictionary import load_shared_dictionary
+
+
+def timed(fn, data: bytes, runs: int) -> (int, float):
+    timings = []
+    size = 0
+    for _ in range(runs):
+        start = time.perf_counter()
+        size = len(fn(data))
+        timings.append((time.perf_counter() - start) * 1000)
+    return size, statistics.median(timings)
+
+
+def run(pages: dict, runs: int) -> list:
+    dictionary = load_shared_dictionary()
+    if dictionary is None:
+        return ['No shared dictionary (run `python -m chalicelib.shared_dictionary` and install zstandard).']
+
+    variants = [
+        ('brotli_compress', brotli_compress),
+        ('br-dynamic', lambda d: compress_body(d, 'br', 'dynamic')),
+        ('dcz-dynamic', lambda d: dictionary.compress_dcz(d, COMPRESSION_TIERS['dynamic']['dcz'])),
+        ('dcz-static', lambda d: dictionary.compress_dcz(d, COMPRESSION_TIERS['static']['dcz'])),
+    ]
+
+    lines = [f"dictionary: {len(dictionary.data)} bytes {dictionary.available_dictionary}",
+             f"{'page':<20} {'raw':>8} {'variant':>16} {'bytes':>8} {'vs br11':>8} {'ms':>8}"]
+    for name, data in pages.items():
+        baseline = None
+        for label, fn in variants:
+            size, ms = timed(fn, data, runs)
+            baseline = baseline or size
+            lines.append(f"{name:<20} {len(data):>8} {label:>16} {size:>8} {size / baseline:>8.3f} {ms:>8.3f}")
+        lines.append('')
+    return lines
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', help='directory of captured pages to include')
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    print('\n'.join(run(load_pages(args.pages), args.runs)))
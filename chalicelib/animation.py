@@ -2,9 +2,9 @@
 import json
 import os
 
-import boto3
 from chalice import Response
 
+from chalicelib.aws_clients import aws
 from chalicelib.caching import create_compressed_response
 from chalicelib.main import get_s3_template
 
@@ -68,7 +68,7 @@ def load_img_handler(img_url):
     if not img_url.startswith('static/'):
         return Response(body='Image URL must start with `static/`.', status_code=400)
 
-    s3 = boto3.resource('s3')
+    s3 = aws.resource('s3')
 
     try:
         presigned_url = s3.meta.client.generate_presigned_url('get_object', Params={'Bucket': os.environ['BUCKET_NAME'], 'Key': img_url}, ExpiresIn=3600)
@@ -0,0 +1,93 @@
+""""""
+import markdown
+from botocore.exceptions import ClientError
+
+
+# Bump this whenever the markdown pipeline below changes output (extensions, config, highlighting)
+# so stored HTML gets re-rendered lazily on the next view.
+RENDERER_VERSION = '1'
+
+# chalicelib.highlight produces the same markup as fenced_code + codehilite, with lexers/formatters
+# reused per language and highlighted blocks cached by content hash. chalicelib.mermaid replaces md_mermaid,
+# whose extension still uses the Markdown 2 signature and fails to load on Markdown 3.
+MARKDOWN_EXTENSIONS = ["fenced_code", "codehilite", "chalicelib.highlight", "tables", "toc", "chalicelib.mermaid"]
+
+
+def article_source(article_data: dict) -> str:
+    """
+    The markdown source of an article. Every write path (add_article_to_v2, update_article_content, ingest)
+    stores and edits `content`, so it wins over a legacy `body` that edits would leave stale.
+    """
+    return article_data.get('content') or article_data.get('body') or ''
+
+
+def render_markdown(md_content: str) -> (str, str):
+    """Render markdown to (html, toc)."""
+    md = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+    html = md.convert(md_content)
+    return html, getattr(md, 'toc', '')
+
+
+def rendered_fields(md_content: str) -> dict:
+    """The attributes stored next to an article's source by the write path."""
+    html, toc = render_markdown(md_content)
+    return {'html': html, 'toc': toc, 'rendererVersion': RENDERER_VERSION}
+
+
+def try_rendered_fields(md_content: str) -> dict:
+    """
+    rendered_fields for the write path, or {} if rendering fails: a renderer bug must not block a publish.
+    The article is stored without HTML and get_article_html renders it on read (after the fix is deployed).
+    """
+    try:
+        return rendered_fields(md_content)
+    except Exception as e:
+        print("Error rendering article markdown; storing it unrendered:", e)
+        return {}
+
+
+def is_render_current(article_data: dict) -> bool:
+    return article_data.get('rendererVersion') == RENDERER_VERSION and 'html' in article_data
+
+
+def get_article_html(article_data: dict, article_table=None) -> str:
+    """
+    Return the article's HTML, preferring what was rendered at write time.
+    If it was rendered by an older renderer (or never), render now and, when a table is given,
+    store the result back so the next cold read doesn't pay for it again.
+    """
+    if is_render_current(article_data):
+        return article_data['html']
+
+    fields = rendered_fields(article_source(article_data))
+    article_data.update(fields)
+
+    if article_table is not None:
+        store_rendered_fields(article_table, article_data, fields)
+
+    return fields['html']
+
+
+def store_rendered_fields(article_table, article_data: dict, fields: dict):
+    """Write rendered fields back, unless the article was edited since we read it."""
+    kwargs = dict(
+        Key={'PK': article_data['PK'], 'SK': article_data['SK']},
+        UpdateExpression='SET html = :html, toc = :toc, rendererVersion = :rendererVersion',
+        ExpressionAttributeValues={
+            ':html': fields['html'],
+            ':toc': fields['toc'],
+            ':rendererVersion': fields['rendererVersion'],
+        },
+    )
+
+    if 'updatedAt' in article_data:
+        kwargs['ConditionExpression'] = 'updatedAt = :updatedAt'
+        kwargs['ExpressionAttributeValues'][':updatedAt'] = article_data['updatedAt']
+    else:
+        kwargs['ConditionExpression'] = 'attribute_not_exists(updatedAt)'
+
+    try:
+        article_table.update_item(**kwargs)
+    except ClientError as e:
+        # A concurrent edit wins; it will have rendered its own HTML.
+        print("Error storing rendered article:", e)
@@ -1,22 +1,42 @@
 """"""
 import datetime
+import hashlib
+import json
 import os
 
-import boto3
+from chalicelib import page_index
+from chalicelib.article_render import try_rendered_fields
+from chalicelib.aws_clients import aws
+from chalicelib.counters import counter_deltas, counter_update_action
+from chalicelib.invalidation import listing_cursor_queries, plan_article_invalidation, run_invalidation
+from chalicelib.main import content_version, content_version_action, get_website_data
+from chalicelib.site_config import site_config
+from chalicelib.tag_feed import write_article, write_tag_entries
 
 
-def add_article_to_v2(unique_id: int, content: str, tags: [str], removed: int = 0, description: str = '', slug: str = '',
-                      title: str = '', url: str = '', thumbnail: str = ''):
-    dynamodb = boto3.resource('dynamodb')
-    articles = dynamodb.Table(os.environ['ARTICLES_V2_TABLE'])
-    tag_index = dynamodb.Table(os.environ['TAG_INDEX_TABLE'])
+# The fields an author supplies; their hash tells a re-run of an import whether an article changed.
+SOURCE_FIELDS = ('content', 'tags', 'removed', 'description', 'slug', 'title', 'url', 'thumbnail')
+# Hashed only when set, so articles without them keep the hash they were stored with.
+OPTIONAL_SOURCE_FIELDS = ('date_created',)
+
 
+def content_hash(doc: dict) -> str:
+    source = {field: doc.get(field) for field in SOURCE_FIELDS}
+    source.update({field: doc[field] for field in OPTIONAL_SOURCE_FIELDS if doc.get(field) is not None})
+    source['PK'] = doc.get('PK')
+    return hashlib.sha256(json.dumps(source, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def build_article_doc(unique_id: int, content: str, tags: [str], removed: int = 0, description: str = '', slug: str = '',
+                      title: str = '', url: str = '', thumbnail: str = '', article_type: str = 'ARTICLE',
+                      created_at: int = None) -> dict:
+    now = int(datetime.datetime.now().timestamp() * 1000)  # milliseconds
     doc = {
         'content': content,
         'tags': tags,
         'removed': removed,
-        'createdAt': int(datetime.datetime.now().timestamp() * 1000),  # milliseconds
-        'updatedAt': int(datetime.datetime.now().timestamp() * 1000),  # milliseconds
+        'createdAt': created_at or now,
+        'updatedAt': now,
         'description': description,
         'slug': slug,
         'title': title,
@@ -24,9 +44,83 @@ def add_article_to_v2(unique_id: int, content: str, tags: [str], removed: int =
         'thumbnail': thumbnail
     }
 
-    doc['PK'] = 'ARTICLE'
+    # Render markdown once here rather than on every view (html, toc and rendererVersion).
+    doc.update(try_rendered_fields(content))
+
+    doc['PK'] = article_type
     doc['SK'] = unique_id
-    articles.put_item(Item=doc)
+    doc['contentHash'] = content_hash(doc)
+    return doc
+
+
+def add_article_to_v2(unique_id: int, content: str, tags: [str], removed: int = 0, description: str = '', slug: str = '',
+                      title: str = '', url: str = '', thumbnail: str = ''):
+    doc = build_article_doc(unique_id, content, tags, removed, description, slug, title, url, thumbnail)
+
+    # Cursor pages as currently cached, before this write shifts them.
+    version = content_version(get_website_data(os.environ['HOME_TABLE']), doc['PK'])
+    cursor_queries = listing_cursor_queries(doc['PK'], version)
+
+    articles = aws.table(os.environ['ARTICLES_V2_TABLE'])
+    previous = articles.get_item(Key={'PK': doc['PK'], 'SK': unique_id}, ProjectionExpression='#PK, tags, removed',
+                                 ExpressionAttributeNames={'#PK': 'PK'}).get('Item', {})
+
+    # The article, its tag index entries (which carry its listing fields), the type/tag counters, the listings'
+    # page index and the content version change in one transaction. The new version gives the listing pages new
+    # links, so cursor pages cached under the old one are no longer reachable.
+    deltas = counter_deltas(previous or None, doc)
+    extra_actions = [counter_update_action(deltas), content_version_action(os.environ['HOME_TABLE'], doc['PK'])]
+    write_article(doc, previous_tags=previous.get('tags', []),
+                  extra_actions=extra_actions + page_index.page_index_actions(deltas, unique_id))
+    page_index.invalidate()
+    # At least this; a concurrent write may have bumped it further.
+    site_config.note_version(doc['PK'], version + 1)
+
+    run_invalidation(plan_article_invalidation(
+        doc['PK'], unique_id, tags=doc['tags'], previous_tags=previous.get('tags', []), cursor_queries=cursor_queries
+    ))
+
+
+def update_article_content(unique_id: int, content: str, article_type: str = 'ARTICLE'):
+    """Replace an article's markdown, re-rendering the stored HTML alongside it."""
+    articles = aws.table(os.environ['ARTICLES_V2_TABLE'])
+
+    fields = try_rendered_fields(content)
+
+    version = content_version(get_website_data(os.environ['HOME_TABLE']), article_type)
+    cursor_queries = listing_cursor_queries(article_type, version)
+
+    values = {
+        ':content': content,
+        ':updatedAt': int(datetime.datetime.now().timestamp() * 1000),  # milliseconds
+    }
+    if fields:
+        update = 'SET content = :content, html = :html, toc = :toc, rendererVersion = :rendererVersion, updatedAt = :updatedAt '
+        values.update({':html': fields['html'], ':toc': fields['toc'], ':rendererVersion': fields['rendererVersion']})
+        remove = 'REMOVE contentHash'
+    else:
+        # Rendering failed: drop the HTML of the previous content so the read path renders the new one.
+        update = 'SET content = :content, updatedAt = :updatedAt '
+        remove = 'REMOVE contentHash, html, toc, rendererVersion'
+
+    # The edit and the content version bump commit together (see add_article_to_v2).
+    aws.resource('dynamodb').meta.client.transact_write_items(TransactItems=[
+        {'Update': dict(
+            TableName=os.environ['ARTICLES_V2_TABLE'],
+            Key={'PK': article_type, 'SK': unique_id},
+            # The stored hash no longer describes the source, so the next import rewrites the article.
+            UpdateExpression=update + remove,
+            ExpressionAttributeValues=values,
+        )},
+        content_version_action(os.environ['HOME_TABLE'], article_type),
+    ])
+    updated = articles.get_item(Key={'PK': article_type, 'SK': unique_id}, ConsistentRead=True).get('Item', {})
+
+    # Tag pages are served from the entries, so they need the new updatedAt too.
+    write_tag_entries([updated])
+
+    site_config.note_version(article_type, version + 1)
 
-    for tag in doc.get('tags', []):
-        tag_index.put_item(Item={'tag': tag, 'uniqueId': unique_id, 'removed': doc.get('removed', 0)})
+    run_invalidation(plan_article_invalidation(
+        article_type, unique_id, tags=updated.get('tags', []), cursor_queries=cursor_queries
+    ))
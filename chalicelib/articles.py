@@ -3,10 +3,10 @@ import json
 import os
 from typing import List
 
-import boto3
 import brotli
 from chalice import Response
 
+from chalicelib.aws_clients import aws
 from chalicelib.caching import create_response_headers
 
 """
@@ -14,8 +14,7 @@ from chalicelib.caching import create_response_headers
 """
 def get_articles_list(limit: int, cursor: int, tags: List[str], newer_than=None, older_than=None):
     ## Backward pagination (like “previous page”) is inherently awkward in DynamoDB. Often you do an additional query with reversed ordering or you simply remember the entire “previous” set of items in the client.
-    db = boto3.resource('dynamodb')
-    article_table = db.Table(os.environ['ARTICLE_LIST_TABLE'])
+    article_table = aws.table(os.environ['ARTICLE_LIST_TABLE'])
 
     if newer_than:
         if tags:
@@ -0,0 +1,115 @@
+""""""
+import hashlib
+import threading
+from os.path import join
+
+from chalice import Response
+
+from chalicelib.aws_clients import aws
+from chalicelib.caching import SUPPORTED_ENCODINGS, cache_control_for, compress_body, is_compressible, negotiate_encoding
+from chalicelib.caching import VARY, is_not_modified, not_modified_response, representation_etag, request_header
+from chalicelib.invalidation import SURROGATE_KEY_HEADER, asset_key
+from chalicelib.shared_dictionary import DICTIONARY_ROUTE, shared_dictionary
+
+
+# Declarative manifest of static assets served straight from memory.
+# Each entry becomes a GET route in app.py; `local_path` is used when running with LOCAL=True.
+STATIC_ASSETS = [
+    dict(name='serve_css', route='/style.css', key='frontend/style.css',
+         local_path='templates/style.css', content_type='text/css'),
+    dict(name='serve_caption_labels_css', route='/static/styles/caption-labels.css', key='frontend/caption-labels.css',
+         content_type='text/css'),
+    # Served as-is: an .ico is mostly PNG data that brotli/gzip barely shrink.
+    dict(name='favicon', route='/favicon.ico', key='frontend/favicon.ico', content_type='image/x-icon', compress=False),
+]
+
+if shared_dictionary:
+    # Shipped in the deployment package (see chalicelib/shared_dictionary.py) rather than fetched from S3.
+    STATIC_ASSETS.append(
+        dict(name='serve_shared_dictionary', route=DICTIONARY_ROUTE, bundled_path='chalicelib/dictionaries/site.dict',
+             content_type='application/octet-stream',
+             headers={'Use-As-Dictionary': 'match="/*", match-dest=("document")'})
+    )
+
+
+class StaticAsset:
+    def __init__(self, name: str, content_type: str, body: bytes, compress: bool = True, headers: dict = None,
+                 route: str = None):
+        self.name = name
+        self.route = route
+        self.content_type = content_type
+        self.extra_headers = headers or {}
+        self.etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        self.variants = {'identity': body}
+
+        if compress and is_compressible(content_type):
+            # Static bodies are compressed once per container, so they get the maximum levels.
+            for encoding in SUPPORTED_ENCODINGS:
+                self.variants[encoding] = compress_body(body, encoding, tier='static')
+
+    def pick_encoding(self, accept_encoding: str) -> str:
+        return negotiate_encoding(accept_encoding, available=[e for e in SUPPORTED_ENCODINGS if e in self.variants])
+
+    def response(self, request_headers=None) -> Response:
+        encoding = self.pick_encoding(request_header(request_headers, 'Accept-Encoding'))
+        etag = representation_etag(self.etag, encoding)
+        if is_not_modified(request_headers, etag):
+            return not_modified_response(etag, cache_control_for(self.content_type, self.route))
+
+        headers = {
+            'Content-Type': self.content_type,
+            'Cache-Control': cache_control_for(self.content_type, self.route),
+            'ETag': etag,
+            'Vary': VARY,
+            SURROGATE_KEY_HEADER: asset_key(self.name),
+            **self.extra_headers
+        }
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+
+        return Response(body=self.variants[encoding], headers=headers, status_code=200)
+
+
+class AssetRegistry:
+    """Loads each manifest entry once per container and keeps its precompressed variants in memory."""
+    def __init__(self, manifest: list, bucket_name: str = None, local: bool = False, base_dir: str = '.'):
+        self.manifest = {entry['name']: entry for entry in manifest}
+        self.bucket_name = bucket_name
+        self.local = local
+        self.base_dir = base_dir
+        self._assets = {}
+        self._lock = threading.Lock()
+
+    def _read(self, entry: dict) -> bytes:
+        if entry.get('bundled_path'):
+            with open(join(self.base_dir, entry['bundled_path']), 'rb') as f:
+                return f.read()
+        if self.local and entry.get('local_path'):
+            with open(join(self.base_dir, entry['local_path']), 'rb') as f:
+                return f.read()
+        return aws.resource('s3').Object(self.bucket_name, entry['key']).get()["Body"].read()
+
+    def get(self, name: str) -> StaticAsset:
+        asset = self._assets.get(name)
+        if asset:
+            return asset
+
+        with self._lock:
+            if name not in self._assets:
+                entry = self.manifest[name]
+                self._assets[name] = StaticAsset(
+                    name=name,
+                    content_type=entry['content_type'],
+                    body=self._read(entry),
+                    compress=entry.get('compress', True),
+                    headers=entry.get('headers'),
+                    route=entry.get('route')
+                )
+            return self._assets[name]
+
+    def response(self, name: str, request_headers=None) -> Response:
+        try:
+            return self.get(name).response(request_headers)
+        except Exception as e:
+            print(f"Error serving static asset {name}: {e}")
+            return Response(body=f'Error serving {name}', status_code=500)
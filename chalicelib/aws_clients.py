@@ -0,0 +1,92 @@
+""""""
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+
+
+# One pool per client, shared by every handler (and the fan-out threads) of a container.
+AWS_MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', '25'))
+AWS_CONNECT_TIMEOUT = float(os.environ.get('AWS_CONNECT_TIMEOUT', '1'))
+AWS_READ_TIMEOUT = float(os.environ.get('AWS_READ_TIMEOUT', '3'))
+AWS_MAX_ATTEMPTS = int(os.environ.get('AWS_MAX_ATTEMPTS', '3'))
+
+# Short timeouts so a slow call fails (and is retried) well inside the API Gateway timeout;
+# adaptive retries back off client-side when DynamoDB/S3 throttle.
+CLIENT_CONFIG = Config(
+    max_pool_connections=AWS_MAX_POOL_CONNECTIONS,
+    connect_timeout=AWS_CONNECT_TIMEOUT,
+    read_timeout=AWS_READ_TIMEOUT,
+    retries={'max_attempts': AWS_MAX_ATTEMPTS, 'mode': 'adaptive'},
+    tcp_keepalive=True
+)
+
+
+def _connection_pools(client):
+    """urllib3 pools behind a botocore client (best effort: these are botocore internals)."""
+    try:
+        manager = client._endpoint.http_session._manager
+        return [manager.pools[key] for key in manager.pools.keys()]
+    except (AttributeError, KeyError, TypeError):
+        return []
+
+
+class AWSClients:
+    """
+    Per-container registry of boto3 resources and clients, created lazily on first use with CLIENT_CONFIG.
+    Handlers call `aws.table(name)` / `aws.resource('s3')` instead of constructing a resource (and a new
+    connection pool) on every request.
+    """
+    def __init__(self, config: Config = CLIENT_CONFIG):
+        self.config = config
+        self._resources = {}
+        self._clients = {}
+        # Creating boto3 sessions/resources isn't thread-safe, using them afterwards is.
+        self._lock = threading.Lock()
+        self.counters = dict(created=0, reused=0)
+
+    def _get(self, cache: dict, service: str, factory):
+        instance = cache.get(service)
+        if instance is not None:
+            self.counters['reused'] += 1
+            return instance
+        with self._lock:
+            instance = cache.get(service)
+            if instance is None:
+                instance = cache[service] = factory(service, config=self.config)
+                self.counters['created'] += 1
+            else:
+                self.counters['reused'] += 1
+        return instance
+
+    def resource(self, service: str):
+        return self._get(self._resources, service, boto3.resource)
+
+    def client(self, service: str):
+        return self._get(self._clients, service, boto3.client)
+
+    def table(self, table_name: str):
+        return self.resource('dynamodb').Table(table_name)
+
+    def reset(self):
+        with self._lock:
+            self._resources.clear()
+            self._clients.clear()
+            self.counters = dict(created=0, reused=0)
+
+    def stats(self) -> dict:
+        """Registry counters plus, per service, HTTP requests sent vs connections opened by its pool."""
+        pools = {}
+        low_level = {f'resource:{name}': resource.meta.client for name, resource in self._resources.items()}
+        low_level.update({f'client:{name}': client for name, client in self._clients.items()})
+        for name, client in low_level.items():
+            connection_pools = _connection_pools(client)
+            requests = sum(getattr(pool, 'num_requests', 0) for pool in connection_pools)
+            connections = sum(getattr(pool, 'num_connections', 0) for pool in connection_pools)
+            pools[name] = dict(requests=requests, connections=connections,
+                               reused=max(requests - connections, 0))
+        return dict(self.counters, pools=pools)
+
+
+aws = AWSClients()
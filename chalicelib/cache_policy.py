@@ -0,0 +1,244 @@
+""""""
+import fnmatch
+import json
+import os
+import threading
+import time
+
+
+APP_NAME = 'darrenmackenzie'
+
+# How long (in seconds) loaded policies are trusted before the next request reloads them from Parameter Store.
+CACHE_POLICY_TTL = int(os.environ.get('CACHE_POLICY_TTL', '30'))
+
+# Named durations accepted by the `update-*-cache` Makefile targets.
+DURATIONS = dict(DAY=86400, WEEK=604800, HOUR=3600, MINUTE=60)
+
+# Parameter name -> content-type rule it controls.
+CONTENT_TYPE_PARAMS = {
+    f'/{APP_NAME}_cache-control-duration-html': 'html',
+    f'/{APP_NAME}_cache-control-duration-css-and-js': 'css_and_js',
+    f'/{APP_NAME}_cache-control-duration-json': 'json',
+    f'/{APP_NAME}_cache-control-duration-fallback': 'fallback',
+}
+
+# JSON object of {route pattern: policy}, matched against the Chalice resource path (e.g. "/{section}/{article}").
+ROUTES_PARAM = f'/{APP_NAME}_cache-control-routes'
+
+DEFAULT_CONTENT_TYPE_POLICIES = dict(html='DAY', css_and_js='WEEK', json='HOUR', fallback='MINUTE')
+
+# Page kinds that are not Chalice routes; the routes parameter can override them like any other route.
+# Listing cursor pages are immutable for the content version in their URL, while the first page changes on publish.
+LISTING_FIRST_PAGE = 'listing:first'
+LISTING_CURSOR_PAGE = 'listing:cursor'
+
+DEFAULT_ROUTE_POLICIES = {
+    LISTING_FIRST_PAGE: 'max-age=60, s-maxage=300, stale-while-revalidate=DAY, stale-if-error=WEEK',
+    LISTING_CURSOR_PAGE: 'max-age=HOUR, s-maxage=WEEK, stale-if-error=WEEK',
+}
+
+CONTENT_TYPE_RULES = {
+    'text/html': 'html',
+    'application/json': 'json',
+    'text/css': 'css_and_js',
+    'application/javascript': 'css_and_js',
+}
+
+
+class CachePolicy:
+    def __init__(self, max_age: int, s_maxage: int = None, stale_while_revalidate: int = 0, stale_if_error: int = 0,
+                 public: bool = True, no_cache: bool = False):
+        """
+        :param max_age: browser freshness lifetime in seconds
+        :param s_maxage: shared (CloudFront) freshness lifetime; defaults to max_age
+        :param stale_while_revalidate: seconds a stale response may be served while it is refetched
+        :param stale_if_error: seconds a stale response may be served when the origin errors
+        """
+        self.max_age = max_age
+        self.s_maxage = max_age if s_maxage is None else s_maxage
+        self.stale_while_revalidate = stale_while_revalidate
+        self.stale_if_error = stale_if_error
+        self.public = public
+        self.no_cache = no_cache
+
+    def header(self) -> str:
+        directives = ['public' if self.public else 'private']
+        if self.no_cache:
+            directives.append('no-cache')
+        if self.public:
+            directives.append(f's-maxage={self.s_maxage}')
+        directives.append(f'max-age={self.max_age}')
+        if self.stale_while_revalidate:
+            directives.append(f'stale-while-revalidate={self.stale_while_revalidate}')
+        if self.stale_if_error:
+            directives.append(f'stale-if-error={self.stale_if_error}')
+        return ', '.join(directives)
+
+    def __eq__(self, other):
+        return isinstance(other, CachePolicy) and vars(self) == vars(other)
+
+    def __repr__(self):
+        return f'CachePolicy({self.header()!r})'
+
+
+def parse_policy(value: str) -> CachePolicy:
+    """
+    Parse a parameter value: either a named duration (DAY, WEEK, HOUR, MINUTE) or a list of
+    Cache-Control directives, e.g. "max-age=60, s-maxage=3600, stale-while-revalidate=86400".
+    Raises ValueError for anything else.
+    """
+    value = (value or '').strip()
+    if value.upper() in DURATIONS:
+        return CachePolicy(max_age=DURATIONS[value.upper()])
+
+    seconds = {}
+    flags = set()
+    for directive in value.split(','):
+        name, _, amount = directive.strip().lower().partition('=')
+        if not name:
+            continue
+        if amount:
+            amount = amount.strip()
+            seconds[name] = DURATIONS[amount.upper()] if amount.upper() in DURATIONS else int(amount)
+        else:
+            flags.add(name)
+
+    if 'max-age' not in seconds:
+        raise ValueError(f"Cache policy needs a duration name or max-age: {value!r}")
+
+    unknown = (set(seconds) - {'max-age', 's-maxage', 'stale-while-revalidate', 'stale-if-error'}) | (flags - {'public', 'private', 'no-cache'})
+    if unknown:
+        raise ValueError(f"Unsupported cache directives {sorted(unknown)} in {value!r}")
+
+    return CachePolicy(
+        max_age=seconds['max-age'],
+        s_maxage=seconds.get('s-maxage'),
+        stale_while_revalidate=seconds.get('stale-while-revalidate', 0),
+        stale_if_error=seconds.get('stale-if-error', 0),
+        public='private' not in flags,
+        no_cache='no-cache' in flags
+    )
+
+
+class PolicySet:
+    """Policies for one snapshot of the parameters: route rules first, then content-type rules."""
+    def __init__(self, content_types: dict, routes: dict = None):
+        self.content_types = content_types
+        self.routes = routes or {}
+
+    def lookup(self, content_type: str, route: str = None) -> CachePolicy:
+        if route:
+            policy = self.routes.get(route)
+            if policy:
+                return policy
+            for pattern, policy in self.routes.items():
+                if fnmatch.fnmatchcase(route, pattern):
+                    return policy
+
+        media_type = content_type.split(';')[0].strip().lower()
+        return self.content_types.get(CONTENT_TYPE_RULES.get(media_type, 'fallback'), self.content_types['fallback'])
+
+
+def build_policy_set(values: dict, routes: dict = None) -> PolicySet:
+    """Build a PolicySet from raw parameter values, falling back to the defaults for anything invalid."""
+    content_types = {}
+    for rule, default in DEFAULT_CONTENT_TYPE_POLICIES.items():
+        try:
+            content_types[rule] = parse_policy(values.get(rule, default))
+        except ValueError as e:
+            print(f"Warning: {e}; using {default} for {rule}.")
+            content_types[rule] = parse_policy(default)
+
+    route_policies = {}
+    for pattern, value in {**DEFAULT_ROUTE_POLICIES, **(routes or {})}.items():
+        try:
+            route_policies[pattern] = parse_policy(value)
+        except ValueError as e:
+            print(f"Warning: {e}; ignoring route rule {pattern}.")
+
+    return PolicySet(content_types, route_policies)
+
+
+DEFAULT_POLICY_SET = build_policy_set({})
+
+
+def load_cache_control_params() -> PolicySet:
+    """
+    Load cache control policies from AWS Parameter Store.
+    Raises on AWS errors so the caller can keep serving the policies it already has.
+    """
+    from chalicelib.aws_clients import aws
+
+    ssm = aws.client('ssm')
+
+    response = ssm.get_parameters(Names=list(CONTENT_TYPE_PARAMS) + [ROUTES_PARAM], WithDecryption=False)
+
+    values, routes = {}, {}
+    for param in response['Parameters']:
+        if param['Name'] == ROUTES_PARAM:
+            try:
+                routes = json.loads(param['Value'])
+            except ValueError as e:
+                print(f"Warning: {ROUTES_PARAM} is not valid JSON: {e}")
+        elif param['Name'] in CONTENT_TYPE_PARAMS:
+            values[CONTENT_TYPE_PARAMS[param['Name']]] = param['Value']
+
+    return build_policy_set(values, routes)
+
+
+class CachePolicyEngine:
+    """
+    Serves Cache-Control headers from an in-memory PolicySet, loaded once when app.py is imported (Lambda's init phase)
+    and reloaded inline by the first request that finds it older than the TTL. Not on a background thread: Lambda freezes the container between invocations, so a
+    refresh started after the response would only run (or hold its lock) whenever the next request thaws it.
+
+    Requests arriving during a reload keep the current policies; if a reload fails the last good ones stay in place.
+    """
+    def __init__(self, loader=load_cache_control_params, ttl: int = CACHE_POLICY_TTL):
+        self.loader = loader
+        self.ttl = ttl
+        self._policies = DEFAULT_POLICY_SET
+        self._loaded_at = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self.counters = dict(refreshes=0, errors=0)
+
+    def refresh(self):
+        try:
+            policies = self.loader()
+        except Exception as e:
+            self.counters['errors'] += 1
+            print(f"Error loading cache control policies: {e}")
+            policies = None
+
+        with self._lock:
+            if policies is not None:
+                self._policies = policies
+                self.counters['refreshes'] += 1
+            # Failures also restart the TTL, so an unreachable Parameter Store isn't hammered.
+            self._loaded_at = time.monotonic()
+            self._refreshing = False
+
+    def _maybe_refresh(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl:
+                return
+            self._refreshing = True
+
+        self.refresh()
+
+    def policy_for(self, content_type: str, route: str = None) -> CachePolicy:
+        self._maybe_refresh()
+        return self._policies.lookup(content_type, route)
+
+    def header_for(self, content_type: str, route: str = None) -> str:
+        return self.policy_for(content_type, route).header()
+
+    def stats(self) -> dict:
+        age = None if self._loaded_at is None else round(time.monotonic() - self._loaded_at, 1)
+        return dict(self.counters, age=age, routes=sorted(self._policies.routes))
+
+
+cache_policies = CachePolicyEngine()
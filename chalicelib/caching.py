@@ -1,159 +1,249 @@
 """"""
 import datetime
+import email.utils
+import gzip
 import hashlib
 
 import brotli
 from chalice import Response
 
-APP_NAME = 'darrenmackenzie'
+from chalicelib.cache_policy import cache_policies
+from chalicelib.invalidation import SURROGATE_KEY_HEADER, surrogate_key_header
+from chalicelib.shared_dictionary import DICTIONARY_ROUTE, shared_dictionary
 
 
-# Cache for 24 hours
-CACHE_CONTROL_ONE_DAY = 'public, s-maxage=86400, max-age=86400'
+# Compression levels per tier. Dynamic pages are compressed on every request, where brotli 11 costs far
+# more CPU than it saves in bytes; bodies compressed once and then reused (static assets, page-cached
+# articles) get the maximum levels. benchmarks/compression.py compares levels on captured pages.
+COMPRESSION_TIERS = dict(
+    dynamic=dict(br=5, gzip=6, dcz=6),
+    static=dict(br=11, gzip=9, dcz=19),
+)
+
+# Content types that are already compressed; re-compressing them only burns CPU.
+ALREADY_COMPRESSED_TYPES = {
+    'image/x-icon', 'image/png', 'image/jpeg', 'image/gif', 'image/webp', 'image/avif',
+    'font/woff', 'font/woff2', 'application/zip', 'application/gzip',
+}
+
+SUPPORTED_ENCODINGS = ('br', 'gzip')
+
+VARY = 'Accept-Encoding, Available-Dictionary' if shared_dictionary else 'Accept-Encoding'
+
+
+def brotli_compress(data, quality: int = COMPRESSION_TIERS['static']['br']):
+    return brotli.compress(data, quality=quality)
 
-# Cache for 1 week
-CACHE_CONTROL_ONE_WEEK = 'public, s-maxage=604800, max-age=604800'
 
-# Cache for 1 hour
-CACHE_CONTROL_ONE_HOUR = 'public, s-maxage=3600, max-age=3600'
+def compress_body(data: bytes, encoding: str, tier: str = 'dynamic') -> bytes:
+    if encoding == 'dcz':
+        return shared_dictionary.compress_dcz(data, level=COMPRESSION_TIERS[tier]['dcz'])
+    if encoding == 'br':
+        return brotli.compress(data, quality=COMPRESSION_TIERS[tier]['br'])
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=COMPRESSION_TIERS[tier]['gzip'], mtime=0)
+    return data
 
-# Cache for 1 minute
-CACHE_CONTROL_ONE_MINUTE = 'public, s-maxage=60, max-age=60'
 
+def is_compressible(content_type: str) -> bool:
+    return content_type.split(';')[0].strip().lower() not in ALREADY_COMPRESSED_TYPES
 
-def load_cache_control_params():
+
+def negotiate_encoding(accept_encoding: str or None, available=SUPPORTED_ENCODINGS) -> str:
     """
-    Load cache control parameters from AWS Parameter Store.
-    Returns a dictionary with cache control settings for different content types.
+    Pick the best of `available` for an Accept-Encoding header, honouring q-values (including q=0)
+    and `*`. Ties go to the order of `available`, so br wins over gzip. Falls back to 'identity'.
     """
-    import boto3
-    from botocore.exceptions import ClientError
-
-    # Initialize parameter store client
-    ssm = boto3.client('ssm')
-
-    # Define parameter names (you can prefix these with your application name if needed)
-    param_names = [
-        f'/{APP_NAME}_cache-control-duration-html',
-        f'/{APP_NAME}_cache-control-duration-css-and-js',
-        f'/{APP_NAME}_cache-control-duration-json',
-        f'/{APP_NAME}_cache-control-duration-fallback'
-    ]
-
-    param_names_conversion_dict = {
-        f'/{APP_NAME}_cache-control-duration-html': 'HTML_CACHE_CONTROL_DURATION',
-        f'/{APP_NAME}_cache-control-duration-css-and-js': 'CSS_AND_JS_CACHE_CONTROL_DURATION',
-        f'/{APP_NAME}_cache-control-duration-json': 'JSON_CACHE_CONTROL_DURATION',
-        f'/{APP_NAME}_cache-control-duration-fallback': 'FALLBACK_CACHE_CONTROL_DURATION'
-    }
+    if not accept_encoding:
+        return 'identity'
+
+    weights = {}
+    for token in accept_encoding.split(','):
+        parts = [p.strip() for p in token.split(';')]
+        coding = parts[0].lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            if param.lower().startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        weights[coding] = q
+
+    best, best_q = 'identity', 0.0
+    for encoding in available:
+        q = weights.get(encoding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def negotiate_request_encoding(request_headers, content_type: str = 'text/html; charset=UTF-8') -> str:
+    """
+    The encoding to use for this request. dcz (zstd against our shared dictionary) is preferred,
+    but only when the client advertises the exact dictionary we hold; plain br/gzip otherwise.
+    """
+    if not is_compressible(content_type):
+        return 'identity'
 
-    # Initialize result dictionary with defaults
-    params = {
-        'HTML_CACHE_CONTROL_DURATION': 'DAY',
-        'CSS_AND_JS_CACHE_CONTROL_DURATION': 'WEEK',
-        'JSON_CACHE_CONTROL_DURATION': 'HOUR',
-        'FALLBACK_CACHE_CONTROL_DURATION': 'MINUTE'
-    }
+    available = SUPPORTED_ENCODINGS
+    if shared_dictionary and shared_dictionary.matches(request_header(request_headers, 'Available-Dictionary')):
+        available = ('dcz',) + SUPPORTED_ENCODINGS
 
-    try:
-        # Get parameters in a single API call (more efficient)
-        response = ssm.get_parameters(
-            Names=param_names,
-            WithDecryption=False  # Set to True if your parameters are encrypted
-        )
-
-        # Process found parameters
-        for param in response['Parameters']:
-            param_name = param['Name']
-            param_value = param['Value']
-
-            # Update the params dictionary with the value
-            if param_name in param_names_conversion_dict:
-                params[param_names_conversion_dict[param_name]] = param_value
-                print(f"Loaded parameter: {param_name} = {param_value}")
-            else:
-                print(f"Warning: Unexpected parameter name {param_name} found.")
-
-        # Log missing parameters if any
-        if response['InvalidParameters']:
-            print(f"Warning: Could not find these parameters: {response['InvalidParameters']}")
-
-    except ClientError as e:
-        print(f"Error accessing Parameter Store: {e}")
-        # Continue with defaults if there's an error
-
-    return params
-
-
-cache_control_values_dict = dict(
-    DAY=CACHE_CONTROL_ONE_DAY,
-    WEEK=CACHE_CONTROL_ONE_WEEK,
-    HOUR=CACHE_CONTROL_ONE_HOUR,
-    MINUTE=CACHE_CONTROL_ONE_MINUTE
-)
+    return negotiate_encoding(request_header(request_headers, 'Accept-Encoding'), available=available)
 
-cache_control_params = load_cache_control_params()
-
-CACHE_CONTROL_DICT = dict(
-    HTML_CACHE_CONTROL_DURATION=cache_control_values_dict.get(
-        cache_control_params.get('HTML_CACHE_CONTROL_DURATION', 'DAY'), CACHE_CONTROL_ONE_MINUTE),
-    CSS_AND_JS_CACHE_CONTROL_DURATION=cache_control_values_dict.get(
-        cache_control_params.get('CSS_AND_JS_CACHE_CONTROL_DURATION', 'WEEK'), CACHE_CONTROL_ONE_MINUTE),
-    JSON_CACHE_CONTROL_DURATION=cache_control_values_dict.get(
-        cache_control_params.get('JSON_CACHE_CONTROL_DURATION', 'HOUR'), CACHE_CONTROL_ONE_MINUTE),
-    FALLBACK_CACHE_CONTROL_DURATION=cache_control_values_dict.get(
-        cache_control_params.get('FALLBACK_CACHE_CONTROL_DURATION', 'MINUTE'), CACHE_CONTROL_ONE_MINUTE)
-)
 
-print("DEBUGGING CACHE CONTROL PARAMS:", cache_control_params, CACHE_CONTROL_DICT)
+def compress_for_request(data: bytes, content_type: str, request_headers=None, tier: str = 'dynamic') -> (bytes, str):
+    """Compress `data` with the encoding negotiated for this request; returns (body, encoding)."""
+    encoding = negotiate_request_encoding(request_headers, content_type)
+    return compress_body(data, encoding, tier), encoding
+
 
+def encoding_headers(content_type: str, encoding: str) -> dict:
+    """Content-Encoding/Vary, plus the Link that lets browsers fetch the shared dictionary from HTML pages."""
+    headers = {'Vary': VARY}
+    if encoding and encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    if shared_dictionary and content_type.startswith('text/html'):
+        headers['Link'] = f'<{DICTIONARY_ROUTE}>; rel="compression-dictionary"'
+    return headers
 
-def brotli_compress(data):
-    return brotli.compress(data)
 
+def cache_control_for(content_type: str, route: str = None) -> str:
+    """The current policy for `route` (a Chalice resource path, e.g. "/{section}/{article}"), else for the content type."""
+    return cache_policies.header_for(content_type, route)
 
-def create_response_headers(content_type: str, content: str):
-    try:
-        etag_value = hashlib.md5(content).hexdigest()
-    except TypeError:
-        etag_value = hashlib.md5(content.encode('utf-8')).hexdigest()
 
-    last_modified = datetime.datetime.now().strftime('%a, %d %b %Y %H:%M:%S GMT')
+def fingerprint_etag(*parts) -> str:
+    """
+    Deterministic ETag derived from the inputs of a response (article updatedAt, template ETag,
+    renderer version, cursor...) rather than from its body, so it can be checked before rendering.
+    """
+    digest = hashlib.sha256('\x1f'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return f'"{digest[:32]}"'
+
 
-    if content_type == 'text/html' or content_type == 'text/html; charset=UTF-8':
-        cache_control = CACHE_CONTROL_DICT['HTML_CACHE_CONTROL_DURATION']
-    elif content_type == 'application/json':
-        cache_control = CACHE_CONTROL_DICT['JSON_CACHE_CONTROL_DURATION']
-    elif content_type in ['text/css', 'application/javascript']:
-        cache_control = CACHE_CONTROL_DICT['CSS_AND_JS_CACHE_CONTROL_DURATION']
+def representation_etag(etag: str or None, encoding: str) -> str or None:
+    """
+    The ETag of one content-coding of a response. Strong validators must differ between representations,
+    so '"abc"' sent as br becomes '"abc-br"'; the identity representation keeps the plain value.
+    """
+    if not etag or not encoding or encoding == 'identity':
+        return etag
+    weak = 'W/' if etag.startswith('W/') else ''
+    opaque = etag.removeprefix('W/').strip('"')
+    return f'{weak}"{opaque}-{encoding}"'
+
+
+def http_date(value) -> str or None:
+    """Format a datetime or an epoch-milliseconds timestamp (int/Decimal/str) as an HTTP date."""
+    if value is None:
+        return None
+    if not isinstance(value, datetime.datetime):
+        try:
+            value = datetime.datetime.fromtimestamp(int(value) / 1_000.0, tz=datetime.timezone.utc)
+        except (TypeError, ValueError):
+            return None
+    return email.utils.format_datetime(value.astimezone(datetime.timezone.utc), usegmt=True)
+
+
+def request_header(headers, name: str) -> str or None:
+    if not headers:
+        return None
+    value = headers.get(name) or headers.get(name.lower())
+    if value is None:
+        for key, val in headers.items():
+            if key.lower() == name.lower():
+                return val
+    return value
+
+
+def is_not_modified(request_headers, etag: str, last_modified: str = None) -> bool:
+    """Evaluate If-None-Match (which takes precedence) and If-Modified-Since against our validators."""
+    if_none_match = request_header(request_headers, 'If-None-Match')
+    if if_none_match:
+        if if_none_match.strip() == '*':
+            return True
+        # Weak comparison: W/"x" matches "x" (CloudFront may weaken ETags when it compresses).
+        candidates = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        return etag is not None and etag.removeprefix('W/') in candidates
+
+    if_modified_since = request_header(request_headers, 'If-Modified-Since')
+    if if_modified_since and last_modified:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since)
+            modified = email.utils.parsedate_to_datetime(last_modified)
+        except (TypeError, ValueError):
+            return False
+        return modified <= since
+
+    return False
+
+
+def not_modified_response(etag: str, cache_control: str, last_modified: str = None) -> Response:
+    headers = {'ETag': etag, 'Cache-Control': cache_control, 'Vary': VARY}
+    if last_modified:
+        headers['Last-Modified'] = last_modified
+    return Response(body='', headers=headers, status_code=304)
+
+
+def create_response_headers(content_type: str, content: str, etag: str = None, last_modified: str = None,
+                            content_encoding: str = 'br', route: str = None, surrogate_keys=None):
+    """
+    Build response headers. Pass `etag`/`last_modified` derived from the response inputs where known;
+    otherwise the ETag falls back to a hash of the body and Last-Modified is omitted. Either way the ETag
+    sent is the one of the `content_encoding` representation.
+    """
+    if etag:
+        etag_value = etag
     else:
-        cache_control = CACHE_CONTROL_DICT['FALLBACK_CACHE_CONTROL_DURATION']
+        try:
+            etag_value = hashlib.md5(content).hexdigest()
+        except TypeError:
+            etag_value = hashlib.md5(content.encode('utf-8')).hexdigest()
+        etag_value = f'"{etag_value}"'
+    etag_value = representation_etag(etag_value, content_encoding)
+
+    cache_control = cache_control_for(content_type, route)
 
-    return {
+    headers = {
         'Content-Type': content_type,
-        'Content-Encoding': 'br',
         'Cache-Control': cache_control,
         'ETag': etag_value,
-        'Last-Modified': last_modified
+        **encoding_headers(content_type, content_encoding)
     }
+    if last_modified:
+        headers['Last-Modified'] = last_modified
+    if surrogate_keys:
+        headers[SURROGATE_KEY_HEADER] = surrogate_key_header(surrogate_keys)
+    return headers
 
 
-def create_compressed_response(html_content, skip_caching=False):
-    """Create a compressed HTTP response."""
-    # NOTE that caching fucks with pagination, so we will be disabling it in the case of the home page endpoint.
+def create_compressed_response(html_content, skip_caching=False, etag: str = None, last_modified: str = None,
+                               request_headers=None, tier: str = 'dynamic', status_code: int = 200, route: str = None,
+                               surrogate_keys=None):
+    """Create an HTTP response compressed with the encoding the client accepts."""
+    # skip_caching is for pages that must never be stored; listing pages vary by cursor and content version instead.
 
-    compressed_html = brotli_compress(html_content.encode('utf-8'))
+    compressed_html, encoding = compress_for_request(html_content.encode('utf-8'), 'text/html; charset=UTF-8', request_headers, tier)
 
-    headers = create_response_headers('text/html; charset=UTF-8', html_content) if not skip_caching else {
+    headers = create_response_headers('text/html; charset=UTF-8', html_content, etag=etag, last_modified=last_modified,
+                                      content_encoding=encoding, route=route, surrogate_keys=surrogate_keys) if not skip_caching else {
         'Content-Type': 'text/html; charset=UTF-8',
-        'Content-Encoding': 'br',
         'Cache-Control': 'no-cache, no-store, must-revalidate, max-age=0',
         'Pragma': 'no-cache',
-        'Expires': '0'
+        'Expires': '0',
+        **encoding_headers('text/html; charset=UTF-8', encoding)
     }
+    if skip_caching and etag:
+        headers['ETag'] = representation_etag(etag, encoding)
+    if skip_caching and surrogate_keys:
+        headers[SURROGATE_KEY_HEADER] = surrogate_key_header(surrogate_keys)
 
     return Response(
         body=compressed_html,
         headers=headers,
-        status_code=200
+        status_code=status_code
     )
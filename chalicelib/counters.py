@@ -0,0 +1,139 @@
+""""""
+import argparse
+import collections
+import json
+import math
+import os
+
+from chalicelib.aws_clients import aws
+from chalicelib.tag_feed import scan_all_articles
+
+
+# The HOME_TABLE item holding every counter, next to website_data.
+COUNTERS_SECTION = 'counters'
+
+# Visible (not removed) articles of a type, and of a type carrying a tag.
+TYPE_COUNTER = 'type:{article_type}'
+TAG_COUNTER = 'tag:{article_type}:{tag}'
+
+# How many tags a listing page offers as facets.
+TAG_FACET_LIMIT = int(os.environ.get('TAG_FACET_LIMIT', '20'))
+
+
+def is_visible(article: dict or None) -> bool:
+    return bool(article) and not article.get('removed')
+
+
+def article_counters(article: dict or None) -> list:
+    """The counters an article is counted in: its type and each of its tags, or none while it is removed."""
+    if not is_visible(article):
+        return []
+    article_type = article['PK']
+    tags = dict.fromkeys(article.get('tags') or [])
+    return [TYPE_COUNTER.format(article_type=article_type)] + \
+           [TAG_COUNTER.format(article_type=article_type, tag=tag) for tag in tags]
+
+
+def counter_deltas(previous: dict or None, doc: dict or None) -> dict:
+    """
+    {counter: change} for replacing `previous` (None for a new article) by `doc` (None for a deleted one).
+    Publishing, removing, restoring and retagging all reduce to this.
+    """
+    deltas = collections.Counter(article_counters(doc))
+    deltas.subtract(article_counters(previous))
+    return {name: delta for name, delta in deltas.items() if delta}
+
+
+def merge_deltas(all_deltas) -> dict:
+    total = collections.Counter()
+    for deltas in all_deltas:
+        total.update(deltas)
+    return {name: delta for name, delta in total.items() if delta}
+
+
+def _update_arguments(deltas: dict) -> dict:
+    names, values, clauses = {}, {}, []
+    for i, (name, delta) in enumerate(sorted(deltas.items())):
+        names[f'#c{i}'] = name
+        values[f':c{i}'] = delta
+        clauses.append(f'#c{i} :c{i}')
+    return dict(Key={'section': COUNTERS_SECTION}, UpdateExpression='ADD ' + ', '.join(clauses),
+                ExpressionAttributeNames=names, ExpressionAttributeValues=values)
+
+
+def counter_update_action(deltas: dict) -> dict or None:
+    """A TransactWriteItems action applying `deltas`, so counters change in the same transaction as the article."""
+    if not deltas:
+        return None
+    return {'Update': dict(TableName=os.environ['HOME_TABLE'], **_update_arguments(deltas))}
+
+
+def apply_deltas(deltas: dict):
+    """Apply `deltas` in one atomic update, for writes that can't join a transaction (batch imports)."""
+    if deltas:
+        aws.table(os.environ['HOME_TABLE']).update_item(**_update_arguments(deltas))
+
+
+def get_counters(table_name: str) -> dict:
+    item = aws.table(table_name).get_item(Key={'section': COUNTERS_SECTION}).get('Item', {})
+    return {name: int(value) for name, value in item.items() if name != 'section'}
+
+
+"""
+    READING
+"""
+def type_total(counts: dict, article_type: str = 'ARTICLE') -> int:
+    return counts.get(TYPE_COUNTER.format(article_type=article_type), 0)
+
+
+def tag_total(counts: dict, article_type: str, tag: str) -> int:
+    return counts.get(TAG_COUNTER.format(article_type=article_type, tag=tag), 0)
+
+
+def tag_facets(counts: dict, article_type: str = 'ARTICLE', limit: int = TAG_FACET_LIMIT) -> list:
+    """[(tag, count)] of a type's tags, most used first."""
+    prefix = TAG_COUNTER.format(article_type=article_type, tag='')
+    facets = [(name[len(prefix):], count) for name, count in counts.items() if name.startswith(prefix) and count > 0]
+    return sorted(facets, key=lambda facet: (-facet[1], facet[0]))[:limit]
+
+
+def page_count(total: int, page_size: int) -> int:
+    return max(math.ceil(total / page_size), 1)
+
+
+"""
+    RECONCILIATION
+"""
+def count_articles(articles: list) -> dict:
+    counts = collections.Counter()
+    for article in articles:
+        counts.update(article_counters(article))
+    return dict(counts)
+
+
+def reconcile(dry_run: bool = False) -> dict:
+    """
+    Recount every counter from a full scan of the articles table and replace the counters item with the result.
+    Returns {counter: (stored, actual)} for the counters that had drifted.
+    """
+    table_name = os.environ['HOME_TABLE']
+    actual = count_articles(scan_all_articles('#PK, tags, removed', {'#PK': 'PK'}))
+    stored = get_counters(table_name)
+
+    drift = {name: (stored.get(name, 0), actual.get(name, 0))
+             for name in sorted(set(stored) | set(actual)) if stored.get(name, 0) != actual.get(name, 0)}
+    if drift and not dry_run:
+        aws.table(table_name).put_item(Item=dict(actual, section=COUNTERS_SECTION))
+    return drift
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Maintain the article counters.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    reconcile_parser = commands.add_parser('reconcile', help='recompute every counter from a full scan')
+    reconcile_parser.add_argument('--dry-run', action='store_true', help='report drift without writing')
+    args = parser.parse_args()
+
+    drift = reconcile(dry_run=args.dry_run)
+    print(json.dumps({name: dict(stored=stored, actual=actual) for name, (stored, actual) in drift.items()}, indent=2))
+    print(f"[reconcile] {len(drift)} counters {'would be' if args.dry_run else 'were'} corrected")
@@ -0,0 +1,87 @@
+""""""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+
+# Threads shared by every request in the container; a handler rarely issues more than three calls at once.
+FAN_OUT_WORKERS = int(os.environ.get('FAN_OUT_WORKERS', '8'))
+
+# Default per-call deadline in seconds, kept under the API Gateway integration timeout.
+FAN_OUT_TIMEOUT = float(os.environ.get('FAN_OUT_TIMEOUT', '5'))
+
+
+class FanOutTimeout(TimeoutError):
+    def __init__(self, name: str, timeout: float):
+        super().__init__(f"{name} did not complete within {timeout}s")
+        self.name = name
+        self.timeout = timeout
+
+
+class Call:
+    def __init__(self, fn, *args, timeout: float = None, **kwargs):
+        """
+        :param fn: the blocking call to run on the pool
+        :param timeout: seconds, measured from when the fan-out starts, this call may take
+        """
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.timeout = FAN_OUT_TIMEOUT if timeout is None else timeout
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Set on the pool's own threads, so a fan-out started from one of them knows it is nested.
+_worker = threading.local()
+
+_counters = dict(fan_outs=0, inline=0, last_ms=None)
+
+
+def _mark_worker():
+    _worker.in_pool = True
+
+
+def executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=FAN_OUT_WORKERS, thread_name_prefix='fan-out',
+                                               initializer=_mark_worker)
+    return _executor
+
+
+def fan_out(**calls: Call) -> dict:
+    """
+    Run independent calls concurrently and return {name: result}, so the caller waits for the slowest call
+    rather than the sum of them. The first failure (or missed deadline, as FanOutTimeout) is raised;
+    a call that overruns its deadline is abandoned and left to finish on its thread.
+
+    Called from a pool thread (e.g. batch gets inside a fanned-out listing query), the calls run inline instead:
+    workers blocked on work queued behind them could otherwise starve the pool. The outer call's deadline still applies.
+    """
+    start = time.perf_counter()
+    if getattr(_worker, 'in_pool', False):
+        _counters['inline'] += 1
+        results = {name: call.fn(*call.args, **call.kwargs) for name, call in calls.items()}
+    else:
+        futures = {name: executor().submit(call.fn, *call.args, **call.kwargs) for name, call in calls.items()}
+
+        results = {}
+        for name, future in futures.items():
+            remaining = calls[name].timeout - (time.perf_counter() - start)
+            try:
+                results[name] = future.result(timeout=max(remaining, 0))
+            except FutureTimeoutError:
+                raise FanOutTimeout(name, calls[name].timeout) from None
+
+    _counters['fan_outs'] += 1
+    _counters['last_ms'] = round((time.perf_counter() - start) * 1000, 1)
+    return results
+
+
+def stats() -> dict:
+    return dict(_counters)
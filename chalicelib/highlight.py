@@ -0,0 +1,173 @@
+""""""
+import functools
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from markdown.extensions import Extension
+from markdown.extensions.codehilite import CodeHilite, CodeHiliteExtension, parse_hl_lines
+from markdown.extensions.fenced_code import FencedBlockPreprocessor
+from markdown.preprocessors import Preprocessor
+from pygments import highlight
+from pygments.formatters import get_formatter_by_name
+from pygments.lexers import get_lexer_by_name, guess_lexer
+from pygments.util import ClassNotFound
+
+
+# Number of highlighted code blocks kept per container.
+HIGHLIGHT_CACHE_SIZE = int(os.environ.get('HIGHLIGHT_CACHE_SIZE', '2048'))
+
+
+class HighlightCache:
+    """LRU of highlighted HTML keyed by a content hash of (language, code, formatter options)."""
+    def __init__(self, max_entries: int = HIGHLIGHT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = dict(hits=0, misses=0)
+
+    @staticmethod
+    def key(lang: str or None, src: str, options: dict) -> str:
+        payload = json.dumps([lang, src, sorted((k, str(v)) for k, v in options.items())])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> str or None:
+        with self._lock:
+            html = self._entries.get(key)
+            if html is None:
+                self.counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return html
+
+    def put(self, key: str, html: str):
+        with self._lock:
+            self._entries[key] = html
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return dict(self.counters, entries=len(self._entries))
+
+
+highlight_cache = HighlightCache()
+
+
+@functools.lru_cache(maxsize=128)
+def _lexer_for(lang: str):
+    """Lexers are stateless once built, so one instance per language is enough."""
+    return get_lexer_by_name(lang)
+
+
+@functools.lru_cache(maxsize=32)
+def _formatter_for(frozen_options: tuple):
+    options = dict(frozen_options)
+    if options.get('hl_lines'):
+        options['hl_lines'] = list(options['hl_lines'])
+    try:
+        return get_formatter_by_name('html', **options)
+    except ClassNotFound:  # pragma: no cover
+        return get_formatter_by_name('html')
+
+
+def _freeze(options: dict) -> tuple:
+    return tuple(sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in options.items()))
+
+
+class CachedCodeHilite(CodeHilite):
+    """
+    CodeHilite that produces the same markup, but reuses lexer/formatter instances per
+    language/style and memoizes the highlighted HTML by content hash.
+    """
+    def hilite(self, shebang: bool = True) -> str:
+        self.src = self.src.strip('\n')
+
+        if not self.use_pygments or not isinstance(self.pygments_formatter, str) or self.pygments_formatter != 'html':
+            return super().hilite(shebang)
+
+        key = highlight_cache.key(self.lang, self.src, self.options)
+        html = highlight_cache.get(key)
+        if html is not None:
+            return html
+
+        lexer = None
+        if self.lang:
+            try:
+                lexer = _lexer_for(self.lang)
+            except ClassNotFound:
+                lexer = None
+        if lexer is None:
+            try:
+                lexer = guess_lexer(self.src) if self.guess_lang else _lexer_for('text')
+            except ClassNotFound:  # pragma: no cover
+                lexer = _lexer_for('text')
+
+        html = highlight(self.src, lexer, _formatter_for(_freeze(self.options)))
+        highlight_cache.put(key, html)
+        return html
+
+
+class CachedFencedBlockPreprocessor(Preprocessor):
+    """
+    Highlights ```lang fenced blocks through CachedCodeHilite ahead of the stock fenced_code
+    preprocessor. Blocks using the {attrs} syntax are left alone for fenced_code to handle.
+    """
+    FENCED_BLOCK_RE = FencedBlockPreprocessor.FENCED_BLOCK_RE
+
+    def __init__(self, md):
+        super().__init__(md)
+        self.codehilite_conf = None
+
+    def run(self, lines: list) -> list:
+        if self.codehilite_conf is None:
+            self.codehilite_conf = {}
+            for ext in self.md.registeredExtensions:
+                if isinstance(ext, CodeHiliteExtension):
+                    self.codehilite_conf = ext.getConfigs()
+
+        if not self.codehilite_conf or not self.codehilite_conf.get('use_pygments', True):
+            return lines
+
+        text = "\n".join(lines)
+        index = 0
+        while True:
+            m = self.FENCED_BLOCK_RE.search(text, index)
+            if not m:
+                break
+
+            lang = m.group('lang') or None
+            if m.group('attrs') or lang == 'mermaid':
+                index = m.end()
+                continue
+
+            local_config = self.codehilite_conf.copy()
+            if m.group('hl_lines'):
+                local_config['hl_lines'] = parse_hl_lines(m.group('hl_lines'))
+
+            code = CachedCodeHilite(
+                m.group('code'),
+                lang=lang,
+                style=local_config.pop('pygments_style', 'default'),
+                **local_config
+            ).hilite(shebang=False)
+
+            placeholder = self.md.htmlStash.store(code)
+            text = f'{text[:m.start()]}\n{placeholder}\n{text[m.end():]}'
+            index = m.start() + 1 + len(placeholder)
+
+        return text.split("\n")
+
+
+class CachedHighlightExtension(Extension):
+    def extendMarkdown(self, md):
+        md.registerExtension(self)
+        # Just ahead of fenced_code (25), after mermaid (35) has taken its blocks.
+        md.preprocessors.register(CachedFencedBlockPreprocessor(md), 'cached_fenced_code_block', 26)
+
+
+def makeExtension(**kwargs):  # pragma: no cover
+    return CachedHighlightExtension(**kwargs)
@@ -0,0 +1,267 @@
+""""""
+import os
+import time
+
+from boto3.dynamodb.types import TypeDeserializer
+
+from chalicelib.aws_clients import aws
+from chalicelib.counters import page_count
+from chalicelib.invalidation import LISTING_ROUTES, InvalidationPlan, minimal_paths, run_invalidation
+from chalicelib.main import get_website_data
+from chalicelib.precompiled_templates import PRECOMPILED_TEMPLATES, create_s3_env, load_manifest, s3_key_for
+from chalicelib.site_generator import NEIGHBOUR_VARIABLES, LISTING_PAGE_NAMES, SiteGenerator, StageTimer
+from chalicelib.site_generator import article_path, is_listed, listing_page_path, listings
+from chalicelib.site_generator import paginate, scan_articles, tag_path, writer_for
+from chalicelib.template_store import template_store
+
+
+# Stream batches are held for up to this many seconds, so a burst of edits is regenerated once.
+REGENERATION_BATCH_WINDOW = int(os.environ.get('REGENERATION_BATCH_WINDOW', '60'))
+
+# Only the attributes listing pages render, so indexing the site doesn't read every article body.
+LISTING_PROJECTION = '#PK, #SK, tags, removed, date_created, createdAt, updatedAt, description, slug, title, #url, thumbnail'
+LISTING_ATTRIBUTE_NAMES = {'#PK': 'PK', '#SK': 'SK', '#url': 'url'}
+
+_deserializer = TypeDeserializer()
+
+
+def deserialize_image(image: dict or None) -> dict or None:
+    if not image:
+        return None
+    return {name: _deserializer.deserialize(value) for name, value in image.items()}
+
+
+def table_name_from_arn(arn: str) -> str:
+    # arn:aws:dynamodb:us-east-1:123456789012:table/<name>/stream/<label>
+    return arn.split(':table/', 1)[-1].split('/', 1)[0]
+
+
+class ArticleChange:
+    def __init__(self, key: tuple, old: dict = None, new: dict = None):
+        """
+        :param key: (PK, SK) of the article
+        :param old: the image before the first record of the batch touching it (None if it was created)
+        :param new: the image after the last record of the batch touching it (None if it was deleted)
+        """
+        self.key = key
+        self.old = old
+        self.new = new
+
+
+class TagChange:
+    def __init__(self, tag: str, unique_id, event_name: str):
+        self.tag = tag
+        self.unique_id = unique_id
+        self.event_name = event_name
+
+
+def coalesce_records(records: list, articles_table: str, tag_index_table: str) -> (list, list):
+    """
+    Collapse a batch of raw stream records (as delivered to Lambda) into one change per article and per tag entry:
+    a burst of edits to the same article becomes a single old -> new transition.
+    """
+    articles, tags = {}, {}
+    for record in records:
+        table = table_name_from_arn(record.get('eventSourceARN', ''))
+        stream = record['dynamodb']
+        old, new = deserialize_image(stream.get('OldImage')), deserialize_image(stream.get('NewImage'))
+        keys = deserialize_image(stream.get('Keys'))
+
+        if table == articles_table:
+            key = (keys['PK'], keys['SK'])
+            if key in articles:
+                articles[key].new = new
+            else:
+                articles[key] = ArticleChange(key, old, new)
+        elif table == tag_index_table:
+            image = new or old or keys
+            tag, unique_id = image.get('tag', image.get('PK')), image.get('uniqueId', image.get('SK'))
+            tags[(tag, unique_id)] = TagChange(tag, unique_id, record['eventName'])
+        else:
+            print(f"Warning: stream record from unexpected table {table}")
+
+    return list(articles.values()), list(tags.values())
+
+
+def position_of(items: list, sort_key) -> int:
+    """Index an article with `sort_key` has (or would have) in a newest-first listing."""
+    return sum(1 for item in items if item['SK'] > sort_key)
+
+
+def shifted_pages(base: str, position: int, old_length: int, new_length: int, page_size: int) -> (set, set):
+    """
+    Pages of a listing to render and to delete after an article entered or left it at `position`:
+    every page from the one holding `position` onwards shifts by one; trailing pages may appear or disappear.
+    """
+    first = position // page_size + 1
+    new_pages, old_pages = page_count(new_length, page_size), page_count(old_length, page_size)
+    render = {('listing', base, n) for n in range(first, new_pages + 1)}
+    delete = {('delete', listing_page_path(base, n)) for n in range(new_pages + 1, old_pages + 1)}
+    return render, delete
+
+
+def listing_nodes(base: str, items: list, sort_key, was_in: bool, is_in: bool, page_size: int) -> set:
+    position = position_of(items, sort_key)
+    if was_in and is_in:
+        return {('listing', base, position // page_size + 1)}
+    if is_in:
+        render, delete = shifted_pages(base, position, len(items) - 1, len(items), page_size)
+        return render | delete
+    if was_in:
+        render, delete = shifted_pages(base, position, len(items) + 1, len(items), page_size)
+        return render | delete
+    return set()
+
+
+def dependency_graph(change: ArticleChange, current: dict, page_size: int, uses_neighbours: bool = False) -> set:
+    """
+    Output nodes depending on one article change, given the current listings ({base: (page name, items)}):
+    ('article', key), ('listing', base, page number), ('delete', path) and ('sitemap',).
+    """
+    old, new = change.old if is_listed(change.old) else None, change.new if is_listed(change.new) else None
+    article_type, sort_key = change.key
+    nodes = set()
+
+    if new:
+        nodes.add(('article', change.key))
+    if old and (not new or article_path(old) != article_path(new)):
+        nodes.add(('delete', article_path(old)))
+
+    type_base = listing_page_path_for_type(article_type)
+    if type_base:
+        items = current.get(type_base, (None, []))[1]
+        nodes |= listing_nodes(type_base, items, sort_key, bool(old), bool(new), page_size)
+
+        if bool(old) != bool(new):
+            nodes.add(('sitemap',))
+            if uses_neighbours:
+                # The article sits at `position` after an insert; after a removal its old neighbours closed the gap.
+                position = position_of(items, sort_key)
+                for neighbour in items[max(position - 1, 0):position + (2 if new else 1)]:
+                    if neighbour['SK'] != sort_key:
+                        nodes.add(('article', (neighbour['PK'], neighbour['SK'])))
+
+    if old and new and article_path(old) != article_path(new):
+        nodes.add(('sitemap',))
+
+    old_tags = set(old.get('tags', [])) if old else set()
+    new_tags = set(new.get('tags', [])) if new else set()
+    for tag in old_tags | new_tags:
+        base = tag_path(tag)
+        items = current.get(base, (None, []))[1]
+        nodes |= listing_nodes(base, items, sort_key, tag in old_tags, tag in new_tags, page_size)
+
+    return nodes
+
+
+def tag_dependency_graph(change: TagChange, current: dict, page_size: int) -> set:
+    """Tag index entries only affect their tag's listing (article records cover the rest)."""
+    base = tag_path(change.tag)
+    items = current.get(base, (None, []))[1]
+    return listing_nodes(base, items, change.unique_id, change.event_name != 'INSERT', change.event_name != 'REMOVE', page_size)
+
+
+def listing_page_path_for_type(article_type: str) -> str or None:
+    return LISTING_ROUTES.get(article_type) if article_type in LISTING_PAGE_NAMES else None
+
+
+def plan_regeneration(article_changes: list, tag_changes: list, current: dict, page_size: int,
+                      uses_neighbours: bool = False) -> set:
+    """The union of every change's dependencies, so outputs shared by several changes are rendered once."""
+    nodes = set()
+    for change in article_changes:
+        nodes |= dependency_graph(change, current, page_size, uses_neighbours)
+    for change in tag_changes:
+        nodes |= tag_dependency_graph(change, current, page_size)
+
+    # A page that is rendered again must not also be deleted.
+    rendered_paths = {listing_page_path(node[1], node[2]) for node in nodes if node[0] == 'listing'}
+    return {node for node in nodes if not (node[0] == 'delete' and node[1] in rendered_paths)}
+
+
+def regenerate(nodes: set, generator: SiteGenerator, writer, current: dict, fetch_article, listed_articles: list) -> list:
+    """Render the planned outputs, delete the dropped ones, and return the paths touched."""
+    timer = StageTimer()
+    article_keys = sorted(node[1] for node in nodes if node[0] == 'article')
+    listing_jobs = sorted(node[1:] for node in nodes if node[0] == 'listing')
+    deleted = sorted(node[1] for node in nodes if node[0] == 'delete')
+
+    neighbours = {}
+    for base in {listing_page_path_for_type(key[0]) for key in article_keys} - {None}:
+        items = current.get(base, (None, []))[1]
+        for i, item in enumerate(items):
+            neighbours[(item['PK'], item['SK'])] = (items[i - 1] if i > 0 else None, items[i + 1] if i + 1 < len(items) else None)
+
+    def render_article(key):
+        article = fetch_article(key)
+        if not is_listed(article):
+            return None
+        newer, older = neighbours.get(key, (None, None))
+        return generator.render_article(article, newer_article=newer, older_article=older)
+
+    def render_listing(job):
+        base, page_number = job
+        page_name, items = current.get(base, (base, []))
+        return generator.render_listing(base, page_name, paginate(items, generator.page_size), page_number)
+
+    pages = [page for page in timer.run('articles', generator._map, render_article, article_keys) if page]
+    pages += timer.run('listings', generator._map, render_listing, listing_jobs)
+    if ('sitemap',) in nodes:
+        pages += timer.run('sitemap', generator.render_sitemap, listed_articles)
+
+    timer.run('compress+write', generator._map, writer.write, pages)
+    timer.run('delete', generator._map, writer.delete, deleted)
+
+    return [page.path for page in pages] + deleted
+
+
+def deployed_templates(bucket_name: str) -> dict:
+    """
+    {name: CachedTemplate} of the templates the live site renders with. templates/ isn't deployed, so they come
+    from the bundle compiled at deploy time while its source is current, else from S3, via the shared template store.
+    """
+    env = create_s3_env()
+    template_store.register_precompiled(bucket_name, load_manifest())
+    return {name: template_store.get_entry(env, bucket_name, s3_key_for(name), preprocess=preprocess)
+            for name, preprocess in PRECOMPILED_TEMPLATES.items()}
+
+
+def uses_neighbours(article_template) -> bool:
+    # Unknown (a bundle built before variables were recorded): assume it does, which only re-renders two neighbours.
+    return article_template.variables is None or bool(article_template.variables & NEIGHBOUR_VARIABLES)
+
+
+def regenerate_from_stream(records: list, writer=None, invalidator=None) -> list:
+    """Entry point for the stream handler: coalesce, plan, re-render the affected outputs and invalidate them."""
+    from chalicelib.paginator_v2 import PAGE_SIZE
+
+    if writer is None:
+        # Where regenerated pages go, as bucket[/prefix]; without it records are acknowledged and ignored.
+        if not os.environ.get('STATIC_SITE_TARGET'):
+            print("STATIC_SITE_TARGET is not set; skipping incremental regeneration.")
+            return []
+        writer = writer_for(s3_target=os.environ['STATIC_SITE_TARGET'])
+
+    article_changes, tag_changes = coalesce_records(records, os.environ['ARTICLES_V2_TABLE'], os.environ['TAG_INDEX_TABLE'])
+    if not article_changes and not tag_changes:
+        return []
+
+    start = time.perf_counter()
+    table = aws.table(os.environ['ARTICLES_V2_TABLE'])
+    listed_articles = scan_articles(table, LISTING_PROJECTION, LISTING_ATTRIBUTE_NAMES)
+    current = listings(listed_articles)
+
+    templates = deployed_templates(os.environ['BUCKET_NAME'])
+    nodes = plan_regeneration(article_changes, tag_changes, current, PAGE_SIZE,
+                              uses_neighbours=uses_neighbours(templates['article.html']))
+    print(f"[regenerate] {len(records)} records -> {len(article_changes)} articles, {len(tag_changes)} tag entries "
+          f"-> {len(nodes)} outputs (planned in {(time.perf_counter() - start) * 1000:.1f} ms)")
+
+    generator = SiteGenerator({name: entry.template for name, entry in templates.items()},
+                              get_website_data(os.environ['HOME_TABLE']), PAGE_SIZE)
+    paths = regenerate(nodes, generator, writer, current,
+                       fetch_article=lambda key: table.get_item(Key={'PK': key[0], 'SK': key[1]}).get('Item'),
+                       listed_articles=listed_articles)
+
+    run_invalidation(InvalidationPlan(paths=minimal_paths(paths)), invalidator)
+    return paths
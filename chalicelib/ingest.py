@@ -0,0 +1,266 @@
+""""""
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os.path import basename, isdir, join
+
+from chalicelib.article_utils import build_article_doc, content_hash
+from chalicelib.aws_clients import aws
+from chalicelib.counters import apply_deltas, counter_deltas, merge_deltas
+from chalicelib.invalidation import InvalidationPlan, minimal_paths, plan_article_invalidation, run_invalidation
+from chalicelib.main import bump_content_version
+from chalicelib.metadata_snapshot import build as build_metadata_snapshot
+from chalicelib.page_index import apply_membership_changes
+from chalicelib.tag_feed import batch_get_ordered, tag_index_item
+
+
+DEFAULT_INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', '4'))
+
+# Articles per write step: one BatchWriteItem's worth.
+WRITE_CHUNK = 25
+
+# Error codes DynamoDB answers with when a table (or its partitions) is over capacity.
+THROTTLING_CODES = {'ProvisionedThroughputExceededException', 'ThrottlingException', 'RequestLimitExceeded'}
+
+# "42-my-article.md" -> unique id 42, slug "my-article"
+FILENAME_PATTERN = re.compile(r'^(?P<unique_id>\d+)-(?P<slug>.+)\.md$')
+
+ARTICLE_FIELDS = ('unique_id', 'content', 'tags', 'removed', 'description', 'slug', 'title', 'url', 'thumbnail', 'article_type')
+
+
+"""
+    SOURCES
+"""
+def parse_markdown(text: str, filename: str = '') -> dict:
+    """An article from a markdown file with an optional YAML front matter block (`---` ... `---`)."""
+    import yaml
+
+    article = {}
+    if text.startswith('---'):
+        _, front_matter, text = re.split(r'^---\s*$', text, maxsplit=2, flags=re.MULTILINE)
+        article = yaml.safe_load(front_matter) or {}
+    article['content'] = text.lstrip('\n')
+
+    match = FILENAME_PATTERN.match(basename(filename))
+    if match:
+        article.setdefault('unique_id', int(match['unique_id']))
+        article.setdefault('slug', match['slug'])
+    if 'id' in article:
+        article.setdefault('unique_id', article.pop('id'))
+    if isinstance(article.get('tags'), str):
+        article['tags'] = [tag.strip() for tag in article['tags'].split(',') if tag.strip()]
+    return article
+
+
+def read_source(path: str) -> list:
+    """Articles from a directory of markdown files or from a JSONL file (one article object per line)."""
+    if isdir(path):
+        articles = []
+        for name in sorted(os.listdir(path)):
+            if name.endswith('.md'):
+                with open(join(path, name), 'r', encoding='utf-8') as f:
+                    articles.append(parse_markdown(f.read(), name))
+        return articles
+
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# build_article_doc's defaults, so a source hashes the same before and after it is built into a document.
+ARTICLE_DEFAULTS = dict(tags=[], removed=0, description='', slug='', title='', url='', thumbnail='', article_type='ARTICLE')
+
+
+def article_fields(article: dict) -> dict:
+    unknown = set(article) - set(ARTICLE_FIELDS) - {'date_created'}
+    if unknown:
+        print(f"Warning: ignoring unknown fields {sorted(unknown)} of article {article.get('unique_id')}")
+    return dict(ARTICLE_DEFAULTS, **{field: article[field] for field in ARTICLE_FIELDS if field in article})
+
+
+def source_hash(article: dict, fields: dict) -> str:
+    """The contentHash to_doc would store, without rendering the markdown."""
+    return content_hash(dict(fields, PK=fields['article_type'], date_created=article.get('date_created')))
+
+
+def to_doc(article: dict, created_at: int = None) -> dict:
+    doc = build_article_doc(created_at=created_at, **article_fields(article))
+    if 'date_created' in article:
+        doc['date_created'] = article['date_created']
+        doc['contentHash'] = content_hash(doc)
+    return doc
+
+
+"""
+    WRITING
+"""
+class IngestReport:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = dict(read=0, unchanged=0, changed=0, written=0, failed=0, tag_entries=0, tag_entries_deleted=0,
+                             batch_requests=0, unprocessed_items=0, throttled=0)
+        self.failed = []
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    def add(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def fail(self, docs: list, error: Exception):
+        print(f"Error writing {len(docs)} articles: {error}")
+        with self._lock:
+            self.counters['failed'] += len(docs)
+            self.failed += [[doc['PK'], doc['SK']] for doc in docs]
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.started
+
+    def summary(self) -> dict:
+        seconds = self.seconds or (time.perf_counter() - self.started)
+        writes = self.counters['written'] + self.counters['tag_entries'] + self.counters['tag_entries_deleted']
+        return dict(self.counters, failed_articles=sorted(self.failed), seconds=round(seconds, 2),
+                    articles_per_second=round(self.counters['written'] / seconds, 1) if seconds else None,
+                    writes_per_second=round(writes / seconds, 1) if seconds else None)
+
+
+def watch_batch_writes(client, report: IngestReport):
+    """
+    batch_writer re-sends UnprocessedItems and botocore retries throttled calls without telling anyone,
+    so count both from the client's events. Returns a function that stops counting.
+    """
+    def after_call(parsed=None, **kwargs):
+        report.add('batch_requests')
+        unprocessed = sum(len(requests) for requests in (parsed or {}).get('UnprocessedItems', {}).values())
+        if unprocessed:
+            report.add('unprocessed_items', unprocessed)
+
+    def needs_retry(response=None, **kwargs):
+        if response and response[1].get('Error', {}).get('Code') in THROTTLING_CODES:
+            report.add('throttled')
+
+    handlers = [('after-call.dynamodb.BatchWriteItem', after_call), ('needs-retry.dynamodb.BatchWriteItem', needs_retry)]
+    for event, handler in handlers:
+        client.meta.events.register(event, handler)
+    return lambda: [client.meta.events.unregister(event, handler) for event, handler in handlers]
+
+
+def existing_articles(keys: list) -> dict:
+    """{(PK, SK): item} of what is already stored, for hash comparison, createdAt, dropped tags and counters."""
+    items = batch_get_ordered(os.environ['ARTICLES_V2_TABLE'], keys, '#PK, #SK, contentHash, createdAt, tags, removed',
+                              {'#PK': 'PK', '#SK': 'SK'})
+    return {(item['PK'], item['SK']): item for item in items}
+
+
+def write_docs(docs: list, previous: dict, report: IngestReport) -> list:
+    """
+    One worker's share, WRITE_CHUNK articles at a time: their tag index entries, then the articles, each through a
+    batch_writer. Entries go first so that an article (and its new contentHash) is only stored once they are; a re-run
+    rewrites anything a failure left half done. A failure stops the share and is reported; returns the docs written.
+    """
+    articles = aws.table(os.environ['ARTICLES_V2_TABLE'])
+    tag_index = aws.table(os.environ['TAG_INDEX_TABLE'])
+
+    written = []
+    try:
+        for start in range(0, len(docs), WRITE_CHUNK):
+            chunk = docs[start:start + WRITE_CHUNK]
+            with tag_index.batch_writer(overwrite_by_pkeys=['PK', 'SK']) as batch:
+                for doc in chunk:
+                    tags = list(dict.fromkeys(doc.get('tags', [])))
+                    for tag in tags:
+                        batch.put_item(Item=tag_index_item(tag, doc))
+                        report.add('tag_entries')
+                    for tag in dict.fromkeys(previous.get((doc['PK'], doc['SK']), {}).get('tags', [])):
+                        if tag not in tags:
+                            batch.delete_item(Key={'PK': tag, 'SK': doc['SK']})
+                            report.add('tag_entries_deleted')
+
+            with articles.batch_writer(overwrite_by_pkeys=['PK', 'SK']) as batch:
+                for doc in chunk:
+                    batch.put_item(Item=doc)
+            report.add('written', len(chunk))
+            written += chunk
+    except Exception as e:
+        report.fail(docs[len(written):], e)
+    return written
+
+
+def ingest(articles: list, workers: int = DEFAULT_INGEST_WORKERS, dry_run: bool = False, invalidator=None) -> IngestReport:
+    """
+    Load many articles at once. Articles whose content hash matches what is stored are skipped, so re-running
+    an import only writes what changed; changed articles keep their original createdAt. Articles that fail to be
+    written are listed in the report's `failed` and picked up by the next run.
+    """
+    report = IngestReport()
+    report.add('read', len(articles))
+
+    sources = [(article, article_fields(article)) for article in articles]
+    previous = existing_articles([{'PK': fields['article_type'], 'SK': fields['unique_id']} for _, fields in sources])
+
+    # Only changed articles are rendered and written.
+    changed = []
+    for article, fields in sources:
+        stored = previous.get((fields['article_type'], fields['unique_id']))
+        if stored and stored.get('contentHash') == source_hash(article, fields):
+            report.add('unchanged')
+            continue
+        changed.append(to_doc(article, created_at=stored and stored.get('createdAt')))
+    report.add('changed', len(changed))
+
+    if dry_run or not changed:
+        report.finish()
+        return report
+
+    stop_watching = watch_batch_writes(aws.resource('dynamodb').meta.client, report)
+    try:
+        shares = [changed[i::workers] for i in range(min(workers, len(changed)))]
+        with ThreadPoolExecutor(max_workers=len(shares), thread_name_prefix='ingest') as pool:
+            written = [doc for share in pool.map(lambda share: write_docs(share, previous, report), shares) for doc in share]
+    finally:
+        stop_watching()
+
+    if not written:
+        report.finish()
+        return report
+
+    # Batch writes can't join a transaction, so the counter and page index changes of the articles that were written
+    # are applied afterwards (failed ones are left for a re-run, which sees them as changed).
+    changes = [(counter_deltas(previous.get((doc['PK'], doc['SK'])), doc), doc['SK']) for doc in written]
+    apply_deltas(merge_deltas(deltas for deltas, _ in changes))
+    apply_membership_changes(changes)
+
+    # One version bump per listing and one invalidation batch for the whole import.
+    paths = []
+    for article_type in sorted({doc['PK'] for doc in written}):
+        bump_content_version(os.environ['HOME_TABLE'], article_type)
+
+    # Batch writes can't carry the version bump, so the rebuilds their stream records trigger may read the versions
+    # from before it; their snapshot would never be current. This one starts after the bump.
+    try:
+        build_metadata_snapshot()
+    except Exception as e:
+        print(f"Warning: listing snapshot not rebuilt ({e}); run make build-metadata-snapshot")
+    for doc in written:
+        previous_tags = previous.get((doc['PK'], doc['SK']), {}).get('tags', [])
+        paths += plan_article_invalidation(doc['PK'], doc['SK'], doc.get('tags', []), previous_tags).paths
+    run_invalidation(InvalidationPlan(paths=minimal_paths(paths)), invalidator)
+
+    report.finish()
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bulk-load articles from a directory of markdown files or a JSONL file.')
+    parser.add_argument('source', help='directory of *.md files (YAML front matter) or a .jsonl file')
+    parser.add_argument('--workers', type=int, default=DEFAULT_INGEST_WORKERS)
+    parser.add_argument('--dry-run', action='store_true', help='report what would be written without writing')
+    args = parser.parse_args()
+
+    report = ingest(read_source(args.source), workers=args.workers, dry_run=args.dry_run)
+    print(json.dumps(report.summary(), indent=2))
+    if report.failed:
+        raise SystemExit(1)
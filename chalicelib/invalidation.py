@@ -0,0 +1,179 @@
+""""""
+import os
+import time
+import uuid
+from urllib.parse import quote
+
+from chalicelib.aws_clients import aws
+
+
+# Responses carry the keys they were built from, e.g. "article:ARTICLE:42 tag:aws listing:ARTICLE template:frontend/index.html".
+# CloudFront can't purge by key, so the planner below maps keys back to the paths that carry them.
+SURROGATE_KEY_HEADER = 'Surrogate-Key'
+
+# Sections (the first path segment of an article URL) per article type, mirroring SECTIONS_DICT in app.py.
+SECTIONS_BY_TYPE = {
+    'ARTICLE': ['articles', 'blog'],
+    'PROJECT': ['projects'],
+    'WORK': ['work'],
+    'SERVICE': ['services'],
+}
+
+# The listing route of each article type.
+LISTING_ROUTES = {
+    'ARTICLE': '/',
+    'PROJECT': '/projects',
+    'WORK': '/work',
+}
+
+# How many listing pages (the first page plus cursor pages) are invalidated on publish.
+LISTING_PAGES_TO_INVALIDATE = int(os.environ.get('LISTING_PAGES_TO_INVALIDATE', '3'))
+
+# CloudFront rejects invalidation batches with more paths than this.
+MAX_PATHS_PER_INVALIDATION = 3000
+
+
+def article_key(article_type: str, unique_id) -> str:
+    return f'article:{article_type}:{unique_id}'
+
+
+def tag_key(tag: str) -> str:
+    return f'tag:{tag}'
+
+
+def listing_key(article_type: str) -> str:
+    return f'listing:{article_type}'
+
+
+def template_key(template_name: str) -> str:
+    return f'template:{template_name}'
+
+
+def asset_key(asset_name: str) -> str:
+    return f'asset:{asset_name}'
+
+
+def surrogate_key_header(keys) -> str:
+    # Keys can't contain spaces, so tags like "machine learning" are percent-encoded.
+    return ' '.join(dict.fromkeys(quote(str(key), safe=':/_.-') for key in keys if key))
+
+
+class InvalidationPlan:
+    def __init__(self, keys: set = None, paths: list = None):
+        """
+        :param keys: the surrogate keys affected by the change
+        :param paths: the minimal set of CDN paths serving those keys
+        """
+        self.keys = keys or set()
+        self.paths = paths or []
+
+    def __repr__(self):
+        return f'InvalidationPlan(keys={sorted(self.keys)}, paths={self.paths})'
+
+
+def listing_path(article_type: str, query: str = '') -> str or None:
+    route = LISTING_ROUTES.get(article_type)
+    if route is None:
+        return None
+    return f'{route}?{query}' if query else route
+
+
+def minimal_paths(paths) -> list:
+    """Dedupe and drop paths already covered by a wildcard path in the same batch."""
+    unique = sorted(set(paths))
+    wildcards = [path[:-1] for path in unique if path.endswith('*')]
+    return [path for path in unique if not any(path != prefix + '*' and path.startswith(prefix) for prefix in wildcards)]
+
+
+def plan_article_invalidation(article_type: str, unique_id, tags=(), previous_tags=(), cursor_queries=()) -> InvalidationPlan:
+    """
+    Paths to invalidate after an article is published or edited: its page (under every section alias,
+    any slug), the tag pages it is or was listed on, and the first listing pages of its type.
+
+    :param cursor_queries: query strings of the listing's cursor pages as they were cached before the change
+                           (see listing_cursor_queries)
+    """
+    affected_tags = sorted(set(tags or ()) | set(previous_tags or ()))
+
+    keys = {article_key(article_type, unique_id), listing_key(article_type)} | {tag_key(tag) for tag in affected_tags}
+
+    paths = [f'/{section}/{unique_id}-*' for section in SECTIONS_BY_TYPE.get(article_type, [])]
+
+    first_page = listing_path(article_type)
+    if first_page:
+        paths.append(first_page)
+        paths.extend(listing_path(article_type, f'tag={quote(tag)}') for tag in affected_tags)
+        paths.extend(listing_path(article_type, query) for query in cursor_queries)
+
+    return InvalidationPlan(keys, minimal_paths(paths))
+
+
+def listing_cursor_queries(article_type: str, version: int, pages: int = LISTING_PAGES_TO_INVALIDATE) -> list:
+    """
+    Query strings of cursor pages 2..`pages` of a listing at `version`, i.e. the URLs the pager links to.
+    Call it before writing so the cursors are the ones already cached.
+    """
+    from chalicelib.main import listing_page_url
+    from chalicelib.paginator_v2 import _unb64, list_articles
+
+    queries, cursor = [], None
+    for _ in range(pages - 1):
+        _, next_key, _ = list_articles(start_key=cursor, full_articles=False, direction='older', article_type=article_type)
+        if not next_key:
+            break
+        queries.append(listing_page_url(article_type, 'after', next_key, version).split('?', 1)[1])
+        cursor = _unb64(next_key)
+    return queries
+
+
+class CloudFrontInvalidator:
+    def __init__(self, distribution_id: str, client=None):
+        self.distribution_id = distribution_id
+        self.client = client or aws.client('cloudfront')
+
+    def invalidate(self, paths: list) -> str or None:
+        """Send all paths as one invalidation batch; returns the invalidation id."""
+        if not paths:
+            return None
+        if len(paths) > MAX_PATHS_PER_INVALIDATION:
+            print(f"Warning: {len(paths)} paths to invalidate, falling back to /*")
+            paths = ['/*']
+
+        response = self.client.create_invalidation(
+            DistributionId=self.distribution_id,
+            InvalidationBatch={
+                'Paths': {'Quantity': len(paths), 'Items': paths},
+                'CallerReference': f'{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}'
+            }
+        )
+        return response['Invalidation']['Id']
+
+
+class LocalInvalidator:
+    """Stand-in used locally and in tests: records each batch instead of calling CloudFront."""
+    def __init__(self):
+        self.batches = []
+
+    def invalidate(self, paths: list) -> str or None:
+        if not paths:
+            return None
+        self.batches.append(list(paths))
+        print("[LOCAL] Would invalidate:", paths)
+        return f'local-{len(self.batches)}'
+
+
+def default_invalidator():
+    distribution_id = os.environ.get('DISTRIBUTION_ID')
+    return CloudFrontInvalidator(distribution_id) if distribution_id else LocalInvalidator()
+
+
+def run_invalidation(plan: InvalidationPlan, invalidator=None) -> str or None:
+    """Invalidate a plan's paths, logging rather than raising: a failed purge must not fail the publish."""
+    invalidator = invalidator or default_invalidator()
+    try:
+        invalidation_id = invalidator.invalidate(plan.paths)
+        print(f"Invalidation {invalidation_id}: {plan}")
+        return invalidation_id
+    except Exception as e:
+        print(f"Error invalidating {plan}: {e}")
+        return None
@@ -1,9 +1,11 @@
 """"""
 from decimal import Decimal
+from urllib.parse import quote
 
-import boto3
-
+from chalicelib.aws_clients import aws
+from chalicelib.invalidation import LISTING_ROUTES
 from chalicelib.paginator import Paginator
+from chalicelib.template_store import template_store
 from chalicelib.utils import build_url
 
 DEFAULT_PAGE_LIMIT = 30
@@ -20,24 +22,93 @@ def get_menu_items():
     ]
 
 
+def non_index_menu_items(menu: list) -> list:
+    """The menu as linked from pages other than the index, where anchors must point back at /index.html."""
+    return [dict(title=item['title'], url=f"/index.html{item['url']}") for item in menu]
+
+
+def inject_threejs_version(template_string: str) -> str:
+    return template_string.replace('__THREEJS_VERSION__', '0.172.0')
+
+
 def get_s3_template(s3_env, bucket_name, template_name: str = 'frontend/index.html', local: bool = False):
-    """Retrieve and process the HTML template from S3."""
-    s3 = boto3.resource('s3')
+    """Retrieve and process the HTML template from S3 (compiled templates are cached per container)."""
     if local:
         # For local development, read the file from the local filesystem
-        myString = open(template_name.replace('frontend', 'templates'), 'r').read().replace('__THREEJS_VERSION__', '0.172.0')
-    else:
-        myString = s3.Object(bucket_name, template_name).get()["Body"].read().decode('utf-8').replace('__THREEJS_VERSION__', '0.172.0')
-    return s3_env.from_string(myString)
+        myString = inject_threejs_version(open(template_name.replace('frontend', 'templates'), 'r').read())
+        return s3_env.from_string(myString)
+    return template_store.get_template(s3_env, bucket_name, template_name, preprocess=inject_threejs_version)
 
 
 def get_website_data(table_name):
     """Retrieve website data from DynamoDB."""
-    db = boto3.resource('dynamodb')
-    table = db.Table(table_name)
+    table = aws.table(table_name)
     return table.get_item(Key={'section': 'website_data'})['Item']
 
 
+# Kept on the website_data item, one counter per article type.
+CONTENT_VERSION_ATTRIBUTE = 'contentVersion_{article_type}'
+
+
+def content_version(website_data: dict, article_type: str = 'ARTICLE') -> int:
+    """
+    Version of the `article_type` listing, bumped whenever an article of that type is published or edited.
+    Pagination links carry it as `v`, which is what lets cursor pages be cached as immutable.
+    """
+    return int(website_data.get(CONTENT_VERSION_ATTRIBUTE.format(article_type=article_type), 0))
+
+
+def listing_page_url(article_type: str, direction: str, cursor: str or None, version: int, tag: str = None,
+                     mode: str = None) -> str or None:
+    """
+    Pager link of a listing page: `direction` is 'after' (older) or 'before' (newer), `cursor` the b64 key.
+    A tag feed's links keep its `tag` (and, for several tags, the `mode`).
+    """
+    if not cursor:
+        return None
+    url = f"{LISTING_ROUTES.get(article_type, '/')}?{direction}={quote(cursor)}&v={version}"
+    if tag:
+        url += f"&tag={quote(tag)}"
+        if mode and ',' in tag:
+            url += f"&mode={mode}"
+    return url
+
+
+def listing_tag_url(article_type: str, tag: str) -> str:
+    """First page of a type's listing filtered to `tag` (the tag facet links)."""
+    return f"{LISTING_ROUTES.get(article_type, '/')}?tag={quote(tag)}"
+
+
+def listing_number_url(article_type: str, page: int, version: int, tag: str = None) -> str:
+    """Numbered pager link (?page=N), resolved through the listing's page index."""
+    route = LISTING_ROUTES.get(article_type, '/')
+    query = f"page={page}&v={version}" if page > 1 else ''
+    if tag:
+        query = '&'.join(filter(None, [query, f"tag={quote(tag)}"]))
+    return f"{route}?{query}" if query else route
+
+
+def _content_version_update(article_type: str) -> dict:
+    return dict(Key={'section': 'website_data'}, UpdateExpression='ADD #version :one',
+                ExpressionAttributeNames={'#version': CONTENT_VERSION_ATTRIBUTE.format(article_type=article_type)},
+                ExpressionAttributeValues={':one': 1})
+
+
+def bump_content_version(table_name, article_type: str = 'ARTICLE') -> int:
+    """Atomically increment the listing version of `article_type` and return the new value."""
+    table = aws.table(table_name)
+    response = table.update_item(ReturnValues='UPDATED_NEW', **_content_version_update(article_type))
+    return int(response['Attributes'][CONTENT_VERSION_ATTRIBUTE.format(article_type=article_type)])
+
+
+def content_version_action(table_name, article_type: str = 'ARTICLE') -> dict:
+    """
+    The version bump as a TransactWriteItems action, so it commits with the article write: anything the write
+    triggers (the snapshot rebuild on its stream record) then reads the bumped version.
+    """
+    return {'Update': dict(TableName=table_name, **_content_version_update(article_type))}
+
+
 def build_paginator_from_query_params(query_params, default_page_limit=DEFAULT_PAGE_LIMIT):
     """Build a paginator from query parameters."""
     paginator = Paginator.from_query_params(query_params)
@@ -47,8 +118,7 @@ def build_paginator_from_query_params(query_params, default_page_limit=DEFAULT_P
 
 def query_articles(table_name, paginator, tags=None):
     """Query articles from DynamoDB with pagination."""
-    db = boto3.resource('dynamodb')
-    article_list_table = db.Table(table_name)
+    article_list_table = aws.table(table_name)
     kwargs = paginator.build_query_kwargs(tags=tags)
 
     response = article_list_table.query(**kwargs)
@@ -0,0 +1,47 @@
+""""""
+import re
+
+from markdown.extensions import Extension
+from markdown.preprocessors import Preprocessor
+
+
+# ```mermaid or ~~~mermaid opens a diagram; the same fence closes it.
+MERMAID_START = re.compile(r'^(?P<fence>[~`]{3})[ \t]*[Mm]ermaid[ \t]*$')
+
+MERMAID_INIT = '<script>mermaid.initialize({startOnLoad:true});</script>'
+
+
+class MermaidPreprocessor(Preprocessor):
+    """Turn mermaid fences into `<div class="mermaid">` blocks (the markup md_mermaid produced)."""
+    def run(self, lines: list) -> list:
+        new_lines, fence, found = [], None, False
+        for line in lines:
+            if fence is None:
+                match = MERMAID_START.match(line)
+                if match:
+                    fence, found = match['fence'], True
+                    if new_lines and new_lines[-1].strip():
+                        new_lines.append('')
+                    new_lines.append('<div class="mermaid">')
+                else:
+                    new_lines.append(line)
+            elif re.match(rf'^{re.escape(fence)}[ \t]*$', line):
+                fence = None
+                new_lines += ['</div>', '']
+            else:
+                new_lines.append(line.strip())
+
+        if found:
+            new_lines += ['', MERMAID_INIT]
+        return new_lines
+
+
+class MermaidExtension(Extension):
+    def extendMarkdown(self, md):
+        md.registerExtension(self)
+        # Ahead of the fenced code preprocessors, which would otherwise highlight the diagram as code.
+        md.preprocessors.register(MermaidPreprocessor(md), 'mermaid', 35)
+
+
+def makeExtension(**kwargs):  # pragma: no cover
+    return MermaidExtension(**kwargs)
@@ -0,0 +1,242 @@
+""""""
+import argparse
+import bisect
+import gzip
+import json
+import os
+import threading
+import time
+from decimal import Decimal
+
+from botocore.exceptions import ClientError
+
+from chalicelib.aws_clients import aws
+from chalicelib.invalidation import LISTING_ROUTES
+from chalicelib.main import content_version, get_website_data
+from chalicelib.site_config import site_config
+from chalicelib.tag_feed import LISTING_FIELDS, scan_all_articles
+
+
+# The listing metadata of every article, gzipped JSON in BUCKET_NAME; one object per generation.
+SNAPSHOT_KEY = os.environ.get('METADATA_SNAPSHOT_KEY', 'snapshots/listing-metadata/{generation}.json.gz')
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_FIELDS = ('PK', 'SK') + LISTING_FIELDS
+
+# Kept on the website_data item, so containers learn of a new snapshot with the site config they already cache.
+GENERATION_ATTRIBUTE = 'metadataSnapshotGeneration'
+
+# Builds that lose the publish to a concurrent one start over this many times (see build).
+SNAPSHOT_BUILD_ATTEMPTS = int(os.environ.get('SNAPSHOT_BUILD_ATTEMPTS', '3'))
+
+# Seconds before a snapshot that failed to load is tried again (listings are read from DynamoDB meanwhile).
+SNAPSHOT_RETRY_AFTER = int(os.environ.get('SNAPSHOT_RETRY_AFTER', '60'))
+
+
+def _plain(value):
+    if isinstance(value, Decimal):
+        return int(value) if value % 1 == 0 else float(value)
+    if isinstance(value, set):
+        return sorted(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def encode(articles: list, versions: dict, generation: int) -> bytes:
+    """Rows of SNAPSHOT_FIELDS rather than objects, so the field names are stored once."""
+    payload = dict(format=SNAPSHOT_FORMAT, generation=generation, builtAt=int(time.time() * 1000), versions=versions,
+                   fields=SNAPSHOT_FIELDS, rows=[[article.get(field) for field in SNAPSHOT_FIELDS] for article in articles])
+    return gzip.compress(json.dumps(payload, separators=(',', ':'), default=_plain).encode('utf-8'))
+
+
+class Snapshot:
+    """
+    Listing metadata in memory. Per type, the visible articles newest first with their negated SKs as a sorted
+    array for bisect, and per tag a posting list of positions into them; a page is a slice of either.
+    """
+    def __init__(self, payload: dict):
+        self.generation = payload['generation']
+        self.versions = payload['versions']
+        self.built_at = payload['builtAt']
+
+        by_type = {}
+        for row in payload['rows']:
+            item = {field: value for field, value in zip(payload['fields'], row) if value is not None}
+            if not item.get('removed'):
+                by_type.setdefault(item['PK'], []).append(item)
+
+        self.items, self.keys, self.postings = {}, {}, {}
+        for article_type, items in by_type.items():
+            items.sort(key=lambda item: item['SK'], reverse=True)
+            self.items[article_type] = items
+            self.keys[article_type] = [-item['SK'] for item in items]
+            for position, item in enumerate(items):
+                for tag in dict.fromkeys(item.get('tags') or []):
+                    self.postings.setdefault((article_type, tag), []).append(position)
+
+    @classmethod
+    def decode(cls, data: bytes) -> 'Snapshot':
+        payload = json.loads(gzip.decompress(data))
+        if payload.get('format') != SNAPSHOT_FORMAT:
+            raise ValueError(f"Unsupported snapshot format {payload.get('format')}")
+        return cls(payload)
+
+    def is_current(self, article_type: str, version: int) -> bool:
+        """Whether the snapshot was built after every publish up to content `version` of `article_type`."""
+        return self.versions.get(article_type, -1) >= version
+
+    def positions(self, article_type: str, tags: list = (), mode: str = 'or') -> list:
+        if not tags:
+            return list(range(len(self.items.get(article_type, []))))
+        postings = [set(self.postings.get((article_type, tag), ())) for tag in tags]
+        return sorted(set.intersection(*postings) if mode == 'and' else set.union(*postings))
+
+    def page(self, article_type: str, page_size: int, tags: list = (), mode: str = 'or', start_key: dict = None,
+             direction: str = 'older') -> (list, dict or None, dict or None):
+        """
+        (items, next_key, prev_key) with the same cursors and semantics as the DynamoDB-backed listing:
+        'older' continues below start_key; 'newer' reads from start_key upwards, newest first.
+        """
+        items, keys = self.items.get(article_type, []), self.keys.get(article_type, [])
+        positions = self.positions(article_type, tags, mode)
+        cursor_pk = (tags[0] if len(tags) == 1 else None) if tags else article_type
+
+        def key_at(position: int) -> dict:
+            return {'PK': cursor_pk, 'SK': items[position]['SK']} if cursor_pk else {'SK': items[position]['SK']}
+
+        if direction == 'newer' and start_key:
+            # Positions newer than or at the cursor, the last page_size of them (dropping the oldest on a full read).
+            end = bisect.bisect_left(positions, bisect.bisect_right(keys, -start_key['SK']))
+            start = max(end - page_size - 1, 0)
+            chosen = positions[start:end]
+            if len(chosen) > page_size:
+                chosen = chosen[:-1]
+            return [items[p] for p in chosen], start_key, key_at(positions[start]) if start > 0 else None
+
+        first = bisect.bisect_left(positions, bisect.bisect_right(keys, -start_key['SK'])) if start_key else 0
+        chosen = positions[first:first + page_size]
+        more = first + page_size < len(positions)
+        return [items[p] for p in chosen], key_at(chosen[-1]) if more else None, start_key
+
+
+class SnapshotCache:
+    """The newest snapshot this container has loaded; reloaded only when the published generation moves on."""
+    def __init__(self, loader=None):
+        self.loader = loader or load_snapshot
+        self._snapshot = None
+        self._failed = {}
+        self._lock = threading.Lock()
+        self.counters = dict(hits=0, loads=0, stale=0, errors=0)
+
+    def get(self, generation) -> Snapshot or None:
+        if generation is None:
+            return None
+        generation = int(generation)
+        snapshot = self._snapshot
+        if snapshot and snapshot.generation >= generation:
+            self.counters['hits'] += 1
+            return snapshot
+        if time.monotonic() - self._failed.get(generation, -SNAPSHOT_RETRY_AFTER) < SNAPSHOT_RETRY_AFTER:
+            return snapshot
+
+        # One load per container at a time; requests arriving meanwhile wait for it rather than loading it too.
+        with self._lock:
+            if self._snapshot and self._snapshot.generation >= generation:
+                return self._snapshot
+            try:
+                self._snapshot = Snapshot.decode(self.loader(generation))
+                self.counters['loads'] += 1
+            except Exception as e:
+                self.counters['errors'] += 1
+                self._failed = {generation: time.monotonic()}
+                print(f"Error loading metadata snapshot {generation}: {e}")
+        return self._snapshot
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return dict(self.counters, generation=snapshot and snapshot.generation)
+
+
+def load_snapshot(generation: int) -> bytes:
+    s3_object = aws.resource('s3').Object(os.environ['BUCKET_NAME'], SNAPSHOT_KEY.format(generation=generation))
+    return s3_object.get()['Body'].read()
+
+
+metadata_snapshots = SnapshotCache()
+
+
+def snapshot_page(article_type: str, page_size: int, tags: list = (), mode: str = 'or', start_key: dict = None,
+                  direction: str = 'older', min_version=None):
+    """
+    A listing page served from memory, or None when this container has no snapshot at least as new as the
+    listing's content version (right after a publish, until the rebuilt snapshot is published).
+    """
+    config = site_config.get(article_type, min_version=min_version)
+    snapshot = metadata_snapshots.get(config.website_data.get(GENERATION_ATTRIBUTE))
+    if snapshot is None or not snapshot.is_current(article_type, config.content_version(article_type)):
+        metadata_snapshots.counters['stale'] += 1
+        return None
+    return snapshot.page(article_type, page_size, tags, mode, start_key, direction)
+
+
+"""
+    BUILDING
+"""
+def build() -> int or None:
+    """
+    Scan the listing fields of every article into a new snapshot generation, upload it, then publish its number.
+
+    A build that loses the publish to a concurrent one starts over: the winner may have read older versions than
+    this build did, and left alone its snapshot would stay behind the current version (so unused) until the next
+    write. Returns the generation, or None if every attempt was superseded.
+    """
+    for _ in range(SNAPSHOT_BUILD_ATTEMPTS):
+        generation = _build_once()
+        if generation is not None:
+            return generation
+    return None
+
+
+def _build_once() -> int or None:
+    table_name = os.environ['HOME_TABLE']
+    website_data = get_website_data(table_name)
+    # Versions are read before the scan, so the snapshot never claims to be newer than its contents.
+    article_types = set(LISTING_ROUTES) | {name.split('_', 1)[1] for name in website_data
+                                           if name.startswith('contentVersion_')}
+    versions = {article_type: content_version(website_data, article_type) for article_type in sorted(article_types)}
+
+    names = {f'#{field}': field for field in SNAPSHOT_FIELDS}
+    articles = scan_all_articles(', '.join(names), names)
+
+    generation = int(website_data.get(GENERATION_ATTRIBUTE, 0)) + 1
+    body = encode(articles, versions, generation)
+    s3 = aws.client('s3')
+    s3.put_object(Bucket=os.environ['BUCKET_NAME'], Key=SNAPSHOT_KEY.format(generation=generation), Body=body,
+                  ContentType='application/gzip')
+
+    try:
+        aws.table(table_name).update_item(
+            Key={'section': 'website_data'},
+            UpdateExpression='SET #generation = :generation',
+            ConditionExpression='attribute_not_exists(#generation) OR #generation < :generation',
+            ExpressionAttributeNames={'#generation': GENERATION_ATTRIBUTE},
+            ExpressionAttributeValues={':generation': generation},
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        print(f"[snapshot] generation {generation} was superseded by a concurrent build")
+        return None
+
+    # Containers may still be loading the previous generation; the one before it is unreachable.
+    if generation > 2:
+        s3.delete_object(Bucket=os.environ['BUCKET_NAME'], Key=SNAPSHOT_KEY.format(generation=generation - 2))
+    print(f"[snapshot] generation {generation}: {len(articles)} articles, {len(body)} bytes")
+    return generation
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Maintain the listing metadata snapshot.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('build', help='build and publish a new snapshot generation')
+    args = parser.parse_args()
+
+    build()
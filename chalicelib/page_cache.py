@@ -0,0 +1,75 @@
+""""""
+import os
+import threading
+from collections import OrderedDict
+
+
+# Upper bound on the compressed bytes kept per container (Lambda memory is shared with everything else).
+PAGE_CACHE_MAX_BYTES = int(os.environ.get('PAGE_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+
+
+class CachedPage:
+    def __init__(self, body: bytes, headers: dict, status_code: int = 200):
+        self.body = body
+        self.headers = headers
+        self.status_code = status_code
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(k) + len(str(v)) for k, v in self.headers.items())
+
+
+class PageCache:
+    """
+    Bounded LRU cache of fully rendered, compressed response bodies.
+
+    Keys are expected to capture everything the page depends on, e.g. (PK, SK, updatedAt, template ETag),
+    so entries never need explicit invalidation: a new article version or template simply misses.
+    Eviction is by total size in bytes rather than entry count, since article pages vary a lot in size.
+    """
+    def __init__(self, max_bytes: int = PAGE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = dict(hits=0, misses=0, evictions=0)
+
+    def get(self, key) -> CachedPage or None:
+        with self._lock:
+            page = self._entries.get(key)
+            if page is None:
+                self.counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return page
+
+    def put(self, key, page: CachedPage):
+        size = page.size
+        if size > self.max_bytes:
+            # Never let one huge page flush the whole cache.
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous.size
+
+            self._entries[key] = page
+            self.current_bytes += size
+
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted.size
+                self.counters['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict:
+        return dict(self.counters, entries=len(self._entries), bytes=self.current_bytes)
+
+
+article_page_cache = PageCache()
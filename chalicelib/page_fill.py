@@ -0,0 +1,78 @@
+""""""
+import math
+import os
+import threading
+
+
+# Upper bounds on the work one page may cost when most of a partition is filtered out.
+PAGE_FILL_MAX_LIMIT = int(os.environ.get('PAGE_FILL_MAX_LIMIT', '100'))
+PAGE_FILL_MAX_QUERIES = int(os.environ.get('PAGE_FILL_MAX_QUERIES', '10'))
+
+
+class PageFillStats:
+    """Read amplification of filtered queries: items DynamoDB evaluated per item a page returned."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = dict(pages=0, queries=0, read=0, returned=0)
+
+    def record(self, queries: int, read: int, returned: int):
+        with self._lock:
+            self.counters['pages'] += 1
+            self.counters['queries'] += queries
+            self.counters['read'] += read
+            self.counters['returned'] += returned
+
+    def stats(self) -> dict:
+        returned = self.counters['returned']
+        return dict(self.counters, read_per_item=round(self.counters['read'] / returned, 2) if returned else None)
+
+
+page_fill_stats = PageFillStats()
+
+
+def next_limit(needed: int, read: int, returned: int) -> int:
+    """Size the next Limit by the selectivity seen so far, so a sparse filter needs fewer round trips."""
+    if not read:
+        return min(needed, PAGE_FILL_MAX_LIMIT)
+    if not returned:
+        # Nothing has passed the filter yet: widen the window.
+        return min(max(read * 2, needed), PAGE_FILL_MAX_LIMIT)
+    return min(math.ceil(needed * read / returned), PAGE_FILL_MAX_LIMIT)
+
+
+def fill_page(query, page_size: int, start_key: dict = None, key_attributes=('PK', 'SK'),
+              max_queries: int = PAGE_FILL_MAX_QUERIES) -> (list, dict or None):
+    """
+    Page through a filtered query until `page_size` items pass the filter or the partition is exhausted.
+    DynamoDB applies Limit before FilterExpression, so a single query can come back short or empty.
+
+    :param query: called with Limit (and ExclusiveStartKey) on top of its own key condition and filter
+    :param key_attributes: the table (or index) key, used as the cursor when a page ends mid-response
+    :return: (items, the exact ExclusiveStartKey of the next page, or None if there is none)
+    """
+    items, cursor = [], start_key
+    queries = read = 0
+
+    while True:
+        kwargs = dict(Limit=next_limit(page_size - len(items), read, len(items)))
+        if cursor:
+            kwargs['ExclusiveStartKey'] = cursor
+        response = query(**kwargs)
+        queries += 1
+        read += response.get('ScannedCount', len(response['Items']))
+
+        for i, item in enumerate(response['Items']):
+            items.append(item)
+            if len(items) == page_size:
+                if i + 1 < len(response['Items']):
+                    # Resume right after the last item returned, not after the last item read.
+                    cursor = {name: item[name] for name in key_attributes}
+                else:
+                    cursor = response.get('LastEvaluatedKey')
+                page_fill_stats.record(queries, read, len(items))
+                return items, cursor
+
+        cursor = response.get('LastEvaluatedKey')
+        if not cursor or queries >= max_queries:
+            page_fill_stats.record(queries, read, len(items))
+            return items, cursor
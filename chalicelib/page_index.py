@@ -0,0 +1,157 @@
+""""""
+import argparse
+import collections
+import functools
+import os
+
+from chalicelib.aws_clients import aws
+from chalicelib.counters import TAG_COUNTER, TYPE_COUNTER, article_counters
+from chalicelib.tag_feed import scan_all_articles
+
+
+# One HOME_TABLE item per listing (a type, or a type and tag) holding the number set of its visible article SKs.
+# Page boundaries are offsets into that set sorted newest first, so ?page=N costs one Query at any page size.
+# The whole set is stored rather than the boundaries themselves: a publish shifts every boundary after it, while
+# adding or deleting one member is a single idempotent update that can join the article's transaction.
+PAGE_INDEX_SECTION = 'pages:{listing}'
+
+# A 13-digit millisecond SK takes about 8 bytes of a number set, so one listing's item stays under DynamoDB's 400 KB
+# item limit up to roughly 45,000 articles; rebuild warns well before that.
+PAGE_INDEX_MAX_MEMBERS = int(os.environ.get('PAGE_INDEX_MAX_MEMBERS', '30000'))
+
+# Listings whose members are kept in memory per container, keyed by content version.
+PAGE_INDEX_CACHE_SIZE = int(os.environ.get('PAGE_INDEX_CACHE_SIZE', '256'))
+
+
+def listing_name(article_type: str, tag: str = None) -> str:
+    """Listings are named like their counters: 'type:ARTICLE' or 'tag:ARTICLE:aws'."""
+    return TAG_COUNTER.format(article_type=article_type, tag=tag) if tag else TYPE_COUNTER.format(article_type=article_type)
+
+
+def _member_update(listing: str, sks: set, operation: str) -> dict:
+    # ADD/DELETE on a number set are atomic and idempotent; deleting the last member removes the attribute.
+    return dict(Key={'section': PAGE_INDEX_SECTION.format(listing=listing)},
+                UpdateExpression=f'{operation} #members :sks',
+                ExpressionAttributeNames={'#members': 'members'}, ExpressionAttributeValues={':sks': set(sks)})
+
+
+def page_index_actions(deltas: dict, sk) -> list:
+    """
+    TransactWriteItems actions moving article `sk` into or out of the listings its counter `deltas` say
+    it joined or left, so the index commits with the article.
+    """
+    table_name = os.environ['HOME_TABLE']
+    return [{'Update': dict(TableName=table_name, **_member_update(listing, {sk}, 'ADD' if delta > 0 else 'DELETE'))}
+            for listing, delta in sorted(deltas.items())]
+
+
+def apply_membership_changes(changes) -> int:
+    """
+    Apply [(deltas, sk)] in one ADD and one DELETE per listing, for writes that can't join a transaction
+    (batch imports). Returns the number of updates.
+    """
+    added, removed = collections.defaultdict(set), collections.defaultdict(set)
+    for deltas, sk in changes:
+        for listing, delta in deltas.items():
+            (added if delta > 0 else removed)[listing].add(sk)
+
+    table = aws.table(os.environ['HOME_TABLE'])
+    for operation, listings in (('ADD', added), ('DELETE', removed)):
+        for listing, sks in sorted(listings.items()):
+            table.update_item(**_member_update(listing, sks, operation))
+    return len(added) + len(removed)
+
+
+"""
+    READING
+"""
+@functools.lru_cache(maxsize=PAGE_INDEX_CACHE_SIZE)
+def _members(listing: str, version: int) -> tuple:
+    # `version` is only part of the cache key: every write that changes membership bumps it.
+    item = aws.table(os.environ['HOME_TABLE']).get_item(
+        Key={'section': PAGE_INDEX_SECTION.format(listing=listing)}, ProjectionExpression='#members',
+        ExpressionAttributeNames={'#members': 'members'}
+    ).get('Item', {})
+    return tuple(sorted(item.get('members', ()), reverse=True))
+
+
+def members(article_type: str, tag: str = None, version: int = 0) -> tuple:
+    """The listing's visible SKs, newest first, as of content `version` of `article_type`."""
+    return _members(listing_name(article_type, tag), version)
+
+
+def page_start_key(page: int, page_size: int, article_type: str, tag: str = None, version: int = 0) -> dict or None:
+    """
+    Where page `page` (1-based) of a listing starts: the key of the last article on the page before, as a base-table
+    (or tag index) key. The primary feed adds removed-index's key attribute when it queries the index.
+    None for the first page; past the end, the key after the oldest article (an empty page).
+    """
+    sks = members(article_type, tag, version)
+    if page <= 1 or not sks:
+        return None
+    boundary = sks[min((page - 1) * page_size, len(sks)) - 1]
+    return {'PK': tag or article_type, 'SK': boundary}
+
+
+def page_window(current: int, total: int, radius: int = 2) -> list:
+    """Page numbers to link: the first, the last and those around the current page."""
+    return sorted({1, total} | set(range(max(current - radius, 1), min(current + radius, total) + 1)))
+
+
+def invalidate():
+    """Forget cached members, e.g. after this container wrote an article."""
+    _members.cache_clear()
+
+
+def stats() -> dict:
+    info = _members.cache_info()
+    return dict(hits=info.hits, misses=info.misses, entries=info.currsize)
+
+
+"""
+    REBUILD
+"""
+def _sections(table) -> list:
+    kwargs = dict(ProjectionExpression='#section', ExpressionAttributeNames={'#section': 'section'})
+    sections = []
+    while True:
+        response = table.scan(**kwargs)
+        sections.extend(item['section'] for item in response['Items'])
+        if not response.get('LastEvaluatedKey'):
+            return sections
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def rebuild() -> dict:
+    """Rewrite every listing's members from a full scan of the articles table; returns {listing: member count}."""
+    listings = collections.defaultdict(set)
+    for article in scan_all_articles('#PK, #SK, tags, removed', {'#PK': 'PK', '#SK': 'SK'}):
+        for listing in article_counters(article):
+            listings[listing].add(article['SK'])
+
+    for listing, sks in sorted(listings.items()):
+        if len(sks) > PAGE_INDEX_MAX_MEMBERS:
+            print(f"Warning: {listing} has {len(sks)} members; its page index item nears the 400 KB item limit")
+
+    table = aws.table(os.environ['HOME_TABLE'])
+    sections = {PAGE_INDEX_SECTION.format(listing=listing): sks for listing, sks in listings.items()}
+    prefix = PAGE_INDEX_SECTION.format(listing='')
+    with table.batch_writer() as batch:
+        # Listings nothing is visible in any more.
+        for section in _sections(table):
+            if section.startswith(prefix) and section not in sections:
+                batch.delete_item(Key={'section': section})
+        for section, sks in sections.items():
+            batch.put_item(Item={'section': section, 'members': sks})
+    invalidate()
+    return {listing: len(sks) for listing, sks in sorted(listings.items())}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Maintain the listing page-boundary index.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('rebuild', help='recompute every listing from a full scan')
+    args = parser.parse_args()
+
+    sizes = rebuild()
+    print(f"[rebuild] {len(sizes)} listings, {sum(sizes.values())} entries")
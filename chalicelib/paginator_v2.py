@@ -4,9 +4,13 @@ import json
 import base64
 from decimal import Decimal
 from boto3.dynamodb.conditions import Key, Attr
-import boto3
 import functools
 
+from chalicelib.aws_clients import aws
+from chalicelib.metadata_snapshot import snapshot_page
+from chalicelib.page_fill import fill_page
+from chalicelib.tag_feed import multi_tag_page, parse_tags, tag_page
+
 
 PAGE_SIZE = 6
 
@@ -42,10 +46,9 @@ def _unb64(s: str or None) -> dict or None:
         print("Error decoding from base64:", e)
         return None
 
-dynamodb = boto3.resource('dynamodb')
+dynamodb = aws.resource('dynamodb')
 
 articles_db = dynamodb.Table(os.environ['ARTICLES_V2_TABLE'])
-tag_index = dynamodb.Table(os.environ['TAG_INDEX_TABLE'])
 
 
 def _encode_key(dynamo_key):
@@ -54,6 +57,15 @@ def _encode_key(dynamo_key):
 
 
 
+def _exclusive_start_key(start_key: dict, index: bool) -> dict:
+    """
+    A cursor or page boundary as the primary feed's ExclusiveStartKey. Page boundaries (and cursors from the other
+    query plan) are base-table keys; removed-index also needs its own key attribute.
+    """
+    key = {'PK': start_key['PK'], 'SK': start_key['SK']}
+    return dict(key, removed=False) if index else key
+
+
 def _query_primary_feed(page_size: int, projection_expression: str, expression_attribute_names: dict or None = None, start_key=None, article_type: str = 'ARTICLE'):
     # one‑time check: does this table have the GSI?
     functools.lru_cache(maxsize=1)
@@ -63,13 +75,9 @@ def _query_primary_feed(page_size: int, projection_expression: str, expression_a
         return any(i['IndexName'] == 'removed-index' for i in idxs)
 
     kwargs = {
-        'Limit': page_size,
         'ScanIndexForward': False         # newest first
     }
 
-    if start_key:
-        kwargs['ExclusiveStartKey'] = start_key
-
     if projection_expression:  # add only if supplied
         kwargs['ProjectionExpression'] = projection_expression
         # If you used aliases for reserved words, also pass:
@@ -79,65 +87,67 @@ def _query_primary_feed(page_size: int, projection_expression: str, expression_a
 
     if _has_removed_index():
         # Try the preferred plan: use the GSI
+        if start_key:
+            kwargs['ExclusiveStartKey'] = _exclusive_start_key(start_key, index=True)
         resp = articles_db.query(
             IndexName='removed-index',
             #KeyConditionExpression=Key('removed').eq(0),
             KeyConditionExpression=Key('removed').eq(False),
+            Limit=page_size,
             **kwargs
         )
+        return resp['Items'], resp.get('LastEvaluatedKey')
     else:
-        # GSI not present yet → fall back to base table + filter
-        resp = articles_db.query(
+        # GSI not present yet → fall back to base table + filter, reading on until the page is full
+        return fill_page(functools.partial(
+            articles_db.query,
             KeyConditionExpression=Key('PK').eq(article_type),
             FilterExpression=(Attr('removed').not_exists() | Attr('removed').eq(False)),
             **kwargs
-        )
-
-    return resp['Items'], resp.get('LastEvaluatedKey')
-
-
+        ), page_size, start_key and _exclusive_start_key(start_key, index=False))
 
-def tag_fetch(tag: str, start_key: dict = None, projection_expression: str = None, expression_attribute_names: dict = None, article_type: str = 'ARTICLE'):
-    # 1) get page of IDs for this tag
-    tag_kwargs = dict(
-        KeyConditionExpression=Key('PK').eq(tag),
-        FilterExpression=(Attr('removed').not_exists() | Attr('removed').eq(False)),
-        Limit=PAGE_SIZE,
-        ScanIndexForward=False
-    )
 
-    if start_key:
-        tag_kwargs['ExclusiveStartKey'] = start_key
 
+def tag_fetch(tag: str, start_key: dict = None, projection_expression: str = None, expression_attribute_names: dict = None, article_type: str = 'ARTICLE',
+              full_articles: bool = False, direction: str = 'older'):
+    # Order, cursor and (for listings) the items come from the tag index; full articles from the articles table.
     try:
-        resp = tag_index.query(**tag_kwargs)
-        ids = [item['uniqueId'] for item in resp['Items']]
+        if direction == 'newer' and start_key:
+            # Same semantics as paginate_backwards, read upwards through the tag's index entries.
+            items, newer_key = multi_tag_page([tag], 'or', PAGE_SIZE, start_key, projection_expression,
+                                              expression_attribute_names, article_type, full_articles=full_articles,
+                                              direction='newer')
+            return items, _b64(start_key), _b64(newer_key and {'PK': tag, **newer_key})
+        items, next_key = tag_page(tag, PAGE_SIZE, start_key, projection_expression, expression_attribute_names, article_type,
+                                   full_articles=full_articles)
+        prev_key = _b64(start_key) if start_key else None
     except Exception as e:
-        print("Error querying tag index:", e)
-        ids = []
+        print("Error fetching tag feed:", e)
+        items = []
+        next_key = None
+        prev_key = None
 
-    # 2) batch‑get the full docs
-    try:
-        batch = dynamodb.batch_get_item(
-            RequestItems={
-                'Articles': {
-                    'Keys': [{'PK': article_type, 'SK': uid} for uid in ids],
-                    'ProjectionExpression': projection_expression,
-                    'ExpressionAttributeNames': expression_attribute_names
-                }
-            }
-        )
-        items = batch['Responses']['Articles']
+    return items, _b64(next_key), prev_key
 
-        next_key = batch.get('LastEvaluatedKey')
-        prev_key = _b64(start_key) if start_key else None
+
+def multi_tag_fetch(tags: list, mode: str = 'or', start_key: dict = None, projection_expression: str = None,
+                    expression_attribute_names: dict = None, article_type: str = 'ARTICLE', full_articles: bool = False,
+                    direction: str = 'older'):
+    # Articles with any (or all) of the tags, merged from the per-tag streams of the tag index.
+    try:
+        items, key = multi_tag_page(tags, mode, PAGE_SIZE, start_key, projection_expression,
+                                    expression_attribute_names, article_type, full_articles=full_articles,
+                                    direction=direction)
+        if direction == 'newer' and start_key:
+            return items, _b64(start_key), _b64(key)
+        next_key, prev_key = key, start_key
     except Exception as e:
-        print("Error batch‑getting articles:", e)
+        print("Error fetching multi-tag feed:", e)
         items = []
         next_key = None
         prev_key = None
 
-    return items, _b64(next_key), prev_key
+    return items, _b64(next_key), _b64(prev_key)
 
 
 # same GSI or fallback logic as _query_primary_feed, but simplify:
@@ -146,18 +156,18 @@ def tag_fetch(tag: str, start_key: dict = None, projection_expression: str = Non
 
 def paginate_backwards(start_key, projection_expression, article_type: str = 'ARTICLE'):
     # 1) fetch everything **newer** than the cursor, but in ascending order
-    asc_kwargs = {"Limit": PAGE_SIZE + 1, "ScanIndexForward": True}
     try:
-        resp = articles_db.query(
+        items, last_key = fill_page(functools.partial(
+            articles_db.query,
             KeyConditionExpression=Key('PK').eq(article_type) & Key('SK').gte(start_key['SK']),
             FilterExpression=(Attr('removed').not_exists() | Attr('removed').eq(False)),
-            **asc_kwargs,
+            ScanIndexForward=True,
             ProjectionExpression=projection_expression,
             ExpressionAttributeNames=expression_attribute_names
-        )
+        ), PAGE_SIZE + 1)
 
         # 2) reverse so newest‑first
-        items = list(reversed(resp["Items"]))
+        items = list(reversed(items))
 
         if len(items) > PAGE_SIZE:
             # If we got more than PAGE_SIZE, it means there are still newer articles
@@ -170,20 +180,41 @@ def paginate_backwards(start_key, projection_expression, article_type: str = 'AR
         return [], None, None
 
     next_key = _b64(start_key) if start_key else None
-    prev_key = _b64(resp.get("LastEvaluatedKey"))
+    prev_key = _b64(last_key)
 
     return items, next_key, prev_key
 
-def list_articles(tag: str = None, start_key: dict = None, full_articles: bool = True, direction: str = 'older', article_type: str = 'ARTICLE'):
+def list_articles(tag: str = None, start_key: dict = None, full_articles: bool = True, direction: str = 'older', article_type: str = 'ARTICLE',
+                  tag_mode: str = 'or', min_version=None):
     """
     ?lastKey=...  → continue after this id
     ?tag=foo      → filter by tag
+    ?tag=foo,bar&mode=and|or → articles with all / any of the tags
+
+    Listing pages come from the in-memory metadata snapshot when it is current for `article_type`
+    (at least `min_version`, the request's `v`), and from DynamoDB otherwise.
     """
-    projection_expression = '#PK, #SK, content, tags, removed, date_created, description, slug, title, #url, thumbnail' \
-        if full_articles else '#PK, #SK, tags, removed, date_created, description, slug, title, #url, thumbnail'
+    projection_expression = '#PK, #SK, content, tags, removed, date_created, updatedAt, description, slug, title, #url, thumbnail' \
+        if full_articles else '#PK, #SK, tags, removed, date_created, updatedAt, description, slug, title, #url, thumbnail'
 
-    if tag:
-        return tag_fetch(tag=tag, start_key=start_key, projection_expression=projection_expression)
+    tags = parse_tags(tag)
+    if not full_articles:
+        try:
+            page = snapshot_page(article_type, PAGE_SIZE, tags, tag_mode, start_key, direction, min_version=min_version)
+            if page is not None:
+                items, next_key, prev_key = page
+                return items, _b64(next_key), _b64(prev_key)
+        except Exception as e:
+            print("Error serving listing from the metadata snapshot:", e)
+
+    if len(tags) > 1:
+        return multi_tag_fetch(tags, mode=tag_mode, start_key=start_key, projection_expression=projection_expression,
+                               expression_attribute_names=expression_attribute_names, article_type=article_type,
+                               full_articles=full_articles, direction=direction)
+    if tags:
+        return tag_fetch(tag=tags[0], start_key=start_key, projection_expression=projection_expression,
+                         expression_attribute_names=expression_attribute_names, article_type=article_type,
+                         full_articles=full_articles, direction=direction)
     else:
         # primary feed (not removed)
         try:
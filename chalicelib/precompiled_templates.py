@@ -0,0 +1,94 @@
+""""""
+import hashlib
+import json
+import os
+from os.path import dirname, join
+
+from jinja2 import Environment, BaseLoader, DictLoader, ModuleLoader
+from jinja2.meta import find_undeclared_variables
+
+from chalicelib.main import inject_threejs_version
+from chalicelib.utils import datetime_filter, url_to_descriptive, icon_to_descriptive
+
+
+TEMPLATES_DIR = join(dirname(dirname(__file__)), 'templates')
+COMPILED_DIR = join(dirname(__file__), 'compiled_templates')
+MANIFEST_PATH = join(COMPILED_DIR, 'manifest.json')
+
+# Templates shipped precompiled in the deployment artifact, with the same preprocessing
+# that get_s3_template applies before compiling them at runtime.
+PRECOMPILED_TEMPLATES = {
+    'index.html': inject_threejs_version,
+    'article.html': None,
+    'threejs.html': None,
+    'animation.html': inject_threejs_version,
+    '404.html': None,
+}
+
+TEMPLATE_FILTERS = dict(
+    datetime=datetime_filter,
+    url_to_descriptive=url_to_descriptive,
+    icon_to_descriptive=icon_to_descriptive,
+)
+
+
+def s3_key_for(template_name: str) -> str:
+    return f'frontend/{template_name}'
+
+
+def s3_etag_for(source: bytes) -> str:
+    """The ETag S3 assigns to a single-part upload is the quoted MD5 of the object."""
+    return f'"{hashlib.md5(source).hexdigest()}"'
+
+
+def load_manifest() -> dict:
+    """Return {s3_key: {'name': ..., 'etag': ..., 'variables': [...]}} for the templates compiled at deploy time."""
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    with open(MANIFEST_PATH, 'r') as f:
+        return json.load(f)
+
+
+def create_s3_env() -> Environment:
+    """
+    Build the Environment used for S3-hosted templates.
+    When a compiled bundle ships with the deployment it is loaded through a ModuleLoader,
+    otherwise we keep the plain BaseLoader and compile from S3 on demand.
+    """
+    loader = ModuleLoader(COMPILED_DIR) if load_manifest() else BaseLoader()
+    s3_env = Environment(loader=loader)
+    s3_env.filters.update(TEMPLATE_FILTERS)
+    return s3_env
+
+
+def compile_templates(templates_dir: str = TEMPLATES_DIR, target: str = COMPILED_DIR) -> dict:
+    """Compile PRECOMPILED_TEMPLATES to Python modules in `target` and write the manifest."""
+    sources = {}
+    manifest = {}
+    for name, preprocess in PRECOMPILED_TEMPLATES.items():
+        with open(join(templates_dir, name), 'rb') as f:
+            raw = f.read()
+        source = raw.decode('utf-8')
+        sources[name] = preprocess(source) if preprocess else source
+        manifest[s3_key_for(name)] = dict(name=name, etag=s3_etag_for(raw))
+
+    build_env = Environment(loader=DictLoader(sources))
+    build_env.filters.update(TEMPLATE_FILTERS)
+
+    # Compiled modules keep no source to inspect, so what each template references is recorded with it.
+    # Parsed by build_env: the filters have to be registered for the templates that use them to parse.
+    for name, source in sources.items():
+        manifest[s3_key_for(name)]['variables'] = sorted(find_undeclared_variables(build_env.parse(source)))
+
+    os.makedirs(target, exist_ok=True)
+    build_env.compile_templates(target, zip=None, log_function=print, ignore_errors=False)
+
+    with open(join(target, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=4)
+
+    return manifest
+
+
+if __name__ == '__main__':
+    compiled = compile_templates()
+    print(f"Compiled {len(compiled)} templates to {COMPILED_DIR}")
@@ -0,0 +1,126 @@
+""""""
+import argparse
+import base64
+import glob
+import hashlib
+import json
+import os
+from collections import defaultdict
+from os.path import dirname, join
+
+try:
+    import zstandard
+except ImportError:  # optional: without it we simply never offer dcz and fall back to br/gzip
+    zstandard = None
+
+
+DICTIONARY_PATH = join(dirname(__file__), 'dictionaries', 'site.dict')
+DICTIONARY_ROUTE = '/static/dictionaries/site.dict'
+TEMPLATES_DIR = join(dirname(dirname(__file__)), 'templates')
+
+# RFC 9842 dcz framing: a zstd skippable frame holding the SHA-256 of the dictionary.
+DCZ_MAGIC = b'\x5e\x2a\x4d\x18\x20\x00\x00\x00'
+
+DEFAULT_DICTIONARY_SIZE = 32 * 1024
+
+
+class SharedDictionary:
+    """
+    A raw-content compression dictionary built from our own boilerplate (navbar, importmaps, CSS, footer).
+
+    Clients that fetched it from DICTIONARY_ROUTE advertise it back with `Available-Dictionary` and
+    `Accept-Encoding: dcz`, and we answer with zstd compressed against it (Content-Encoding: dcz).
+    Python's Brotli bindings have no custom dictionary support, so dcb is not offered.
+    """
+    def __init__(self, data: bytes):
+        self.data = data
+        self.sha256 = hashlib.sha256(data).digest()
+        self.available_dictionary = f':{base64.b64encode(self.sha256).decode()}:'
+        self._zstd_dict = zstandard.ZstdCompressionDict(data, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+
+    def matches(self, available_dictionary: str or None) -> bool:
+        return bool(available_dictionary) and available_dictionary.strip() == self.available_dictionary
+
+    def compress_dcz(self, data: bytes, level: int) -> bytes:
+        # ZstdCompressor instances are not thread-safe, so build one per call (cheap next to compression itself).
+        compressor = zstandard.ZstdCompressor(level=level, dict_data=self._zstd_dict)
+        return DCZ_MAGIC + self.sha256 + compressor.compress(data)
+
+
+def load_shared_dictionary(path: str = DICTIONARY_PATH) -> SharedDictionary or None:
+    if zstandard is None or not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return SharedDictionary(f.read())
+
+
+shared_dictionary = load_shared_dictionary()
+
+
+"""
+    TRAINING (offline)
+"""
+def boilerplate_documents(templates_dir: str = TEMPLATES_DIR, pages_dir: str = None) -> dict:
+    """Templates, sample rendered pages, the threejs CSS/HTML snippets and the importmaps, keyed by name."""
+    from chalicelib import threejs_dict
+    from chalicelib.main import inject_threejs_version
+    from chalicelib.threejs_helpers import populate_importmaps
+
+    documents = {}
+    for path in sorted(glob.glob(join(templates_dir, '*.html')) + glob.glob(join(templates_dir, '*.css'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            documents[os.path.basename(path)] = inject_threejs_version(f.read())
+
+    if pages_dir:
+        for path in sorted(glob.glob(join(pages_dir, '*'))):
+            with open(path, 'r', encoding='utf-8') as f:
+                documents[f'page:{os.path.basename(path)}'] = f.read()
+
+    for name, value in vars(threejs_dict).items():
+        if name.isupper() and isinstance(value, str):
+            documents[f'threejs_dict.{name}'] = value
+
+    for animation in ('multiaxis', 'force3d'):
+        documents[f'importmap:{animation}'] = json.dumps(populate_importmaps(animation, '0.169.0'), indent=4)
+
+    return documents
+
+
+def train_dictionary(documents: dict, max_size: int = DEFAULT_DICTIONARY_SIZE) -> bytes:
+    """
+    Pick the lines worth the most bytes across documents: score = documents containing the line x its length.
+    Jinja expressions are skipped since they never appear verbatim in a response. The best lines go last,
+    closest to the data being compressed, where matches are cheapest to reference.
+    """
+    seen_in = defaultdict(set)
+    for name, text in documents.items():
+        for line in text.splitlines():
+            if len(line.strip()) < 8 or '{{' in line or '{%' in line:
+                continue
+            seen_in[line].add(name)
+
+    ranked = sorted(seen_in, key=lambda line: (len(seen_in[line]) * len(line), line), reverse=True)
+
+    chosen, size = [], 0
+    for line in ranked:
+        encoded = line.encode('utf-8') + b'\n'
+        if size + len(encoded) > max_size:
+            continue
+        chosen.append(encoded)
+        size += len(encoded)
+
+    return b''.join(reversed(chosen))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train the shared compression dictionary from templates/ and sample pages.')
+    parser.add_argument('--pages', help='directory of sample rendered pages to include')
+    parser.add_argument('--size', type=int, default=DEFAULT_DICTIONARY_SIZE, help='maximum dictionary size in bytes')
+    parser.add_argument('--output', default=DICTIONARY_PATH)
+    args = parser.parse_args()
+
+    dictionary = train_dictionary(boilerplate_documents(pages_dir=args.pages), max_size=args.size)
+    os.makedirs(dirname(args.output), exist_ok=True)
+    with open(args.output, 'wb') as f:
+        f.write(dictionary)
+    print(f"Wrote {len(dictionary)} byte dictionary to {args.output} (sha256 {hashlib.sha256(dictionary).hexdigest()})")
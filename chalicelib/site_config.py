@@ -0,0 +1,122 @@
+""""""
+import os
+import threading
+import time
+
+from chalicelib.counters import get_counters, tag_facets, tag_total, type_total
+from chalicelib.main import CONTENT_VERSION_ATTRIBUTE, content_version, get_menu_items, get_website_data
+from chalicelib.main import non_index_menu_items
+
+
+# How long (in seconds) website_data is served from memory before the next request reloads it from HOME_TABLE.
+SITE_CONFIG_TTL = int(os.environ.get('SITE_CONFIG_TTL', '60'))
+
+
+class SiteConfig:
+    """One loaded snapshot of the site configuration (and counters), with the menus derived from it computed once."""
+    def __init__(self, website_data: dict, menu: list, loaded_at: float, counts: dict = None):
+        self.website_data = website_data
+        self.counts = counts or {}
+        self.social = website_data.get('social', [])
+        self.menu = menu
+        self.non_index_menu = non_index_menu_items(menu)
+        self.loaded_at = loaded_at
+
+    def content_version(self, article_type: str = 'ARTICLE') -> int:
+        return content_version(self.website_data, article_type)
+
+    def total(self, article_type: str = 'ARTICLE', tags: list = ()) -> int or None:
+        """Visible articles of a type (or of a tag); None for several tags, whose overlap isn't counted."""
+        if len(tags) > 1:
+            return None
+        return tag_total(self.counts, article_type, tags[0]) if tags else type_total(self.counts, article_type)
+
+    def tag_facets(self, article_type: str = 'ARTICLE') -> list:
+        return tag_facets(self.counts, article_type)
+
+
+class SiteConfigCache:
+    """
+    Keeps website_data (with the menus and counters) in memory per container. app.py loads it at import (Lambda's init
+    phase; if that fails, the first request does); the first request after the TTL reloads it inline (Lambda freezes
+    background threads between invocations), while requests arriving meanwhile keep the current snapshot. A failed
+    reload keeps the last good snapshot.
+
+    Listing versions are checked explicitly: a request carrying a newer `v` than the snapshot knows about
+    (another container has already seen the publish) reloads synchronously.
+    """
+    def __init__(self, loader=None, ttl: int = SITE_CONFIG_TTL, counts_loader=None):
+        self.loader = loader or (lambda: get_website_data(os.environ['HOME_TABLE']))
+        # A custom website_data loader (tests, scripts) comes without counters unless it is given one too.
+        self.counts_loader = counts_loader or (dict if loader else lambda: get_counters(os.environ['HOME_TABLE']))
+        self.ttl = ttl
+        self._config = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self.counters = dict(hits=0, loads=0, refreshes=0, version_misses=0, errors=0)
+
+    def _load(self) -> SiteConfig:
+        config = SiteConfig(self.loader(), get_menu_items(), time.monotonic(), self.counts_loader())
+        with self._lock:
+            self._config = config
+            self.counters['loads'] += 1
+        return config
+
+    def refresh(self):
+        try:
+            self._load()
+            self.counters['refreshes'] += 1
+        except Exception as e:
+            self.counters['errors'] += 1
+            print(f"Error refreshing website data: {e}")
+            # Retry after another TTL rather than on every request.
+            with self._lock:
+                if self._config:
+                    self._config.loaded_at = time.monotonic()
+        finally:
+            self._refreshing = False
+
+    def _maybe_refresh(self, config: SiteConfig):
+        with self._lock:
+            if self._refreshing or time.monotonic() - config.loaded_at < self.ttl:
+                return
+            self._refreshing = True
+
+        self.refresh()
+
+    def get(self, article_type: str = 'ARTICLE', min_version=None) -> SiteConfig:
+        """
+        :param min_version: the `v` a listing request carries; if it is newer than the cached content version
+                            of `article_type`, the snapshot is reloaded before it is returned
+        """
+        config = self._config
+        if config is None:
+            return self._load()
+
+        if min_version is not None and str(min_version).isdigit() and int(min_version) > config.content_version(article_type):
+            self.counters['version_misses'] += 1
+            return self._load()
+
+        self.counters['hits'] += 1
+        self._maybe_refresh(config)
+        return self._config
+
+    def note_version(self, article_type: str, version: int):
+        """Record a version this container just bumped, so its own next listing links to it."""
+        config = self._config
+        if config and version > config.content_version(article_type):
+            website_data = dict(config.website_data, **{CONTENT_VERSION_ATTRIBUTE.format(article_type=article_type): version})
+            with self._lock:
+                self._config = SiteConfig(website_data, config.menu, config.loaded_at, config.counts)
+
+    def invalidate(self):
+        with self._lock:
+            self._config = None
+
+    def stats(self) -> dict:
+        config = self._config
+        age = None if config is None else round(time.monotonic() - config.loaded_at, 1)
+        return dict(self.counters, age=age)
+
+
+site_config = SiteConfigCache()
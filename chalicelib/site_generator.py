@@ -0,0 +1,322 @@
+""""""
+import argparse
+import datetime
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os.path import dirname, join
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+
+from boto3.dynamodb.conditions import Attr
+from jinja2 import Environment
+
+from chalicelib.article_render import get_article_html
+from chalicelib.aws_clients import aws
+from chalicelib.caching import cache_control_for, compress_body
+from chalicelib.invalidation import LISTING_ROUTES, SECTIONS_BY_TYPE
+from chalicelib.main import get_menu_items, get_website_data, non_index_menu_items
+from chalicelib.precompiled_templates import PRECOMPILED_TEMPLATES, TEMPLATES_DIR, TEMPLATE_FILTERS
+from chalicelib.threejs_helpers import create_threejs_data
+
+
+SITE_URL = 'https://www.darrenmackenzie.com'
+
+# Listing page titles per article type, as passed to fetch_paginated in app.py.
+LISTING_PAGE_NAMES = {
+    'ARTICLE': 'Blog',
+    'PROJECT': 'Projects',
+    'WORK': 'Past Work',
+}
+
+OUTPUT_ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+
+DEFAULT_WORKERS = int(os.environ.get('GENERATE_WORKERS', '8'))
+
+# Context passed to article.html for linking to the adjacent articles of the same type.
+NEIGHBOUR_VARIABLES = {'newer_article', 'older_article'}
+
+
+class GeneratedPage:
+    def __init__(self, path: str, body: bytes, content_type: str = 'text/html; charset=UTF-8'):
+        """
+        :param path: the URL path the page is served at, e.g. /blog/5-slug
+        """
+        self.path = path
+        self.body = body
+        self.content_type = content_type
+
+
+class StageTimer:
+    """Times each generation stage and prints one line per stage."""
+    def __init__(self):
+        self.stages = []
+
+    def run(self, name: str, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - start
+        count = len(result) if hasattr(result, '__len__') else ''
+        self.stages.append((name, count, elapsed))
+        print(f"[generate] {name:<16} {count!s:>6} {elapsed * 1000:>10.1f} ms")
+        return result
+
+    def total(self) -> float:
+        return sum(elapsed for _, _, elapsed in self.stages)
+
+
+def output_key(path: str) -> str:
+    """File/object key for a URL path: paths without an extension become <path>/index.html."""
+    path = path.strip('/')
+    if not path:
+        return 'index.html'
+    if '.' in path.rsplit('/', 1)[-1]:
+        return path
+    return f'{path}/index.html'
+
+
+def article_path(article: dict) -> str:
+    url = article.get('url') or ''
+    if url.startswith('/'):
+        return url
+    section = SECTIONS_BY_TYPE.get(article['PK'], ['articles'])[0]
+    return f"/{section}/{article['SK']}-{article.get('slug', '')}"
+
+
+def listing_page_path(base: str, page_number: int) -> str or None:
+    if page_number < 1:
+        return None
+    if page_number == 1:
+        return base
+    return f"{base.rstrip('/')}/page/{page_number}"
+
+
+def tag_path(tag: str) -> str:
+    return f'/tags/{quote(tag)}'
+
+
+def paginate(items: list, page_size: int) -> list:
+    """Split newest-first items into pages; an empty listing still gets its first page."""
+    return [items[i:i + page_size] for i in range(0, len(items), page_size)] or [[]]
+
+
+def newest_first(articles: list) -> list:
+    return sorted(articles, key=lambda article: article['SK'], reverse=True)
+
+
+def sitemap_date(milliseconds) -> str or None:
+    if milliseconds is None:
+        return None
+    return datetime.datetime.fromtimestamp(int(milliseconds) / 1_000.0, tz=datetime.timezone.utc).strftime('%Y-%m-%d')
+
+
+def is_listed(article: dict or None) -> bool:
+    return article is not None and not article.get('removed')
+
+
+def scan_articles(table, projection_expression: str = None, expression_attribute_names: dict = None) -> list:
+    """Every article in the table that isn't removed (removed is stored as 0/1 or a bool)."""
+    kwargs = dict(FilterExpression=Attr('removed').not_exists() | Attr('removed').eq(False) | Attr('removed').eq(0))
+    if projection_expression:
+        kwargs['ProjectionExpression'] = projection_expression
+        kwargs['ExpressionAttributeNames'] = expression_attribute_names
+    items = []
+    while True:
+        response = table.scan(**kwargs)
+        items.extend(response['Items'])
+        if not response.get('LastEvaluatedKey'):
+            return items
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def load_templates(templates_dir: str = TEMPLATES_DIR) -> dict:
+    """The same templates and preprocessing as the deployed site, compiled from the local sources."""
+    env = Environment()
+    env.filters.update(TEMPLATE_FILTERS)
+    templates = {}
+    for name, preprocess in PRECOMPILED_TEMPLATES.items():
+        with open(join(templates_dir, name), 'r', encoding='utf-8') as f:
+            source = f.read()
+        templates[name] = env.from_string(preprocess(source) if preprocess else source)
+    return templates
+
+
+def listings(articles: list) -> dict:
+    """{base path: (page name, newest-first articles)} for every type listing and tag listing."""
+    result = {}
+    for article_type, page_name in LISTING_PAGE_NAMES.items():
+        result[LISTING_ROUTES[article_type]] = (page_name, newest_first([a for a in articles if a['PK'] == article_type]))
+
+    tagged = {}
+    for article in articles:
+        for tag in article.get('tags', []):
+            tagged.setdefault(tag, []).append(article)
+    for tag, tag_articles in sorted(tagged.items()):
+        result[tag_path(tag)] = (tag, newest_first(tag_articles))
+    return result
+
+
+class SiteGenerator:
+    """
+    Renders the read-only part of the site ahead of time, with the same templates, filters and article HTML
+    as the Lambda routes. Pages are written as <path>/index.html, and listings are paginated by path
+    (/projects/page/2) rather than by cursor, so serving them only needs the CDN to route those paths
+    to the bucket and append index.html; Lambda is then left with the dynamic routes.
+    """
+    def __init__(self, templates: dict, website_data: dict, page_size: int, workers: int = DEFAULT_WORKERS):
+        self.templates = templates
+        self.website_data = website_data
+        self.page_size = page_size
+        self.workers = workers
+        self.menu = get_menu_items()
+        self.non_index_menu = non_index_menu_items(self.menu)
+        self.threejs_template_data = create_threejs_data('multiaxis', 'data')
+
+    def _map(self, fn, items) -> list:
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(fn, items))
+
+    def render_article(self, article: dict, newer_article: dict = None, older_article: dict = None) -> GeneratedPage:
+        path = article_path(article)
+        section = path.strip('/').split('/')[0]
+        html = self.templates['article.html'].render(section=section, article=article, menu=self.non_index_menu,
+                                                     newer_article=newer_article, older_article=older_article)
+        html = html.replace('___ARTICLE___', get_article_html(article))
+        return GeneratedPage(path, html.encode('utf-8'))
+
+    def render_listing(self, base: str, page_name: str, pages: list, page_number: int) -> GeneratedPage:
+        html = self.templates['index.html'].render(
+            social=self.website_data['social'],
+            articles=pages[page_number - 1],
+            menu=self.menu,
+            prev_url=listing_page_path(base, page_number - 1),
+            next_url=listing_page_path(base, page_number + 1) if page_number < len(pages) else None,
+            page_name=page_name,
+            **self.threejs_template_data
+        )
+        return GeneratedPage(listing_page_path(base, page_number), html.encode('utf-8'))
+
+    def listing_jobs(self, articles: list) -> list:
+        """(base path, page name, pages, page number) for every listing and tag page."""
+        jobs = []
+        for base, (page_name, items) in listings(articles).items():
+            pages = paginate(items, self.page_size)
+            jobs.extend((base, page_name, pages, n) for n in range(1, len(pages) + 1))
+        return jobs
+
+    def render_404(self) -> list:
+        html = self.templates['404.html'].render(menu=self.non_index_menu)
+        return [GeneratedPage('/404.html', html.encode('utf-8'))]
+
+    def render_sitemap(self, articles: list) -> list:
+        urls = [(f'{SITE_URL}{route}', None) for route in LISTING_ROUTES.values()]
+        for article in newest_first(articles):
+            urls.append((f'{SITE_URL}{article_path(article)}', sitemap_date(article.get('updatedAt') or article.get('createdAt'))))
+
+        lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">']
+        for loc, lastmod in urls:
+            lastmod_tag = f'<lastmod>{lastmod}</lastmod>' if lastmod else ''
+            lines.append(f'    <url><loc>{escape(loc)}</loc>{lastmod_tag}</url>')
+        lines.append('</urlset>')
+        return [GeneratedPage('/sitemap.xml', '\n'.join(lines).encode('utf-8'), content_type='application/xml')]
+
+    def generate(self, articles: list, writer, timer: StageTimer = None) -> list:
+        timer = timer or StageTimer()
+        pages = []
+        pages += timer.run('articles', self._map, self.render_article, articles)
+        pages += timer.run('listings', self._map, lambda job: self.render_listing(*job), self.listing_jobs(articles))
+        pages += timer.run('404', self.render_404)
+        pages += timer.run('sitemap', self.render_sitemap, articles)
+        timer.run('compress+write', self._map, writer.write, pages)
+        return pages
+
+
+def precompressed(page: GeneratedPage) -> dict:
+    """{suffix: (body, content encoding)} for the identity body and each precompressed variant."""
+    variants = {'': (page.body, None)}
+    for encoding, suffix in OUTPUT_ENCODINGS.items():
+        variants[suffix] = (compress_body(page.body, encoding, tier='static'), encoding)
+    return variants
+
+
+class DirectoryWriter:
+    def __init__(self, root: str):
+        self.root = root
+
+    def write(self, page: GeneratedPage) -> str:
+        key = output_key(page.path)
+        target = join(self.root, key)
+        os.makedirs(dirname(target), exist_ok=True)
+        for suffix, (body, _) in precompressed(page).items():
+            with open(target + suffix, 'wb') as f:
+                f.write(body)
+        return key
+
+    def delete(self, path: str):
+        target = join(self.root, output_key(path))
+        for suffix in [''] + list(OUTPUT_ENCODINGS.values()):
+            if os.path.exists(target + suffix):
+                os.remove(target + suffix)
+
+
+class S3Writer:
+    def __init__(self, bucket_name: str, prefix: str = ''):
+        self.bucket_name = bucket_name
+        self.prefix = prefix.strip('/')
+        self.s3 = aws.client('s3')
+
+    def key_for(self, path: str) -> str:
+        return '/'.join(filter(None, [self.prefix, output_key(path)]))
+
+    def write(self, page: GeneratedPage) -> str:
+        key = self.key_for(page.path)
+        for suffix, (body, encoding) in precompressed(page).items():
+            kwargs = dict(Bucket=self.bucket_name, Key=key + suffix, Body=body, ContentType=page.content_type,
+                          CacheControl=cache_control_for(page.content_type))
+            if encoding:
+                kwargs['ContentEncoding'] = encoding
+            self.s3.put_object(**kwargs)
+        return key
+
+    def delete(self, path: str):
+        key = self.key_for(path)
+        self.s3.delete_objects(Bucket=self.bucket_name, Delete={
+            'Objects': [{'Key': key + suffix} for suffix in [''] + list(OUTPUT_ENCODINGS.values())]
+        })
+
+
+def writer_for(output: str = None, s3_target: str = None):
+    """A DirectoryWriter for `output`, or an S3Writer for `s3_target` given as bucket[/prefix]."""
+    if output:
+        return DirectoryWriter(output)
+    bucket, _, prefix = s3_target.partition('/')
+    return S3Writer(bucket, prefix)
+
+
+def generate(writer, templates_dir: str = TEMPLATES_DIR, workers: int = DEFAULT_WORKERS, page_size: int = None) -> list:
+    from chalicelib.paginator_v2 import PAGE_SIZE
+
+    timer = StageTimer()
+    articles = timer.run('scan', scan_articles, aws.table(os.environ['ARTICLES_V2_TABLE']))
+    templates = timer.run('templates', load_templates, templates_dir)
+    website_data = get_website_data(os.environ['HOME_TABLE'])
+
+    generator = SiteGenerator(templates, website_data, page_size or PAGE_SIZE, workers=workers)
+    pages = generator.generate(articles, writer, timer)
+    print(f"[generate] {len(pages)} pages in {timer.total():.2f}s")
+    return pages
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pre-render the site to a directory or S3 prefix.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    generate_parser = commands.add_parser('generate', help='render every article, listing, tag page, 404 and sitemap')
+    target = generate_parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--output', help='directory to write to')
+    target.add_argument('--s3', help='bucket[/prefix] to upload to')
+    generate_parser.add_argument('--templates', default=TEMPLATES_DIR)
+    generate_parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    generate_parser.add_argument('--page-size', type=int)
+    args = parser.parse_args()
+
+    generate(writer_for(args.output, args.s3), templates_dir=args.templates, workers=args.workers, page_size=args.page_size)
@@ -0,0 +1,360 @@
+""""""
+import argparse
+import collections
+import functools
+import heapq
+import os
+import random
+import time
+
+from boto3.dynamodb.conditions import Attr, Key
+
+from chalicelib.aws_clients import aws
+from chalicelib.fanout import Call, fan_out
+from chalicelib.page_fill import PAGE_FILL_MAX_LIMIT, fill_page
+
+
+# BatchGetItem rejects requests with more keys than this.
+BATCH_GET_LIMIT = 100
+
+# TransactWriteItems rejects transactions with more actions than this.
+TRANSACTION_LIMIT = 100
+
+# UnprocessedKeys (throttling, 16 MB responses) are retried with exponential backoff and jitter.
+BATCH_GET_MAX_ATTEMPTS = int(os.environ.get('BATCH_GET_MAX_ATTEMPTS', '5'))
+BATCH_GET_BASE_DELAY = 0.05
+BATCH_GET_MAX_DELAY = 1.0
+
+# Article attributes copied onto every tag index entry, i.e. everything a listing page renders.
+LISTING_FIELDS = ('title', 'slug', 'description', 'thumbnail', 'url', 'date_created', 'createdAt', 'updatedAt', 'tags', 'removed')
+
+# Bump when LISTING_FIELDS changes: entries below it are served through the articles table until backfilled.
+TAG_PROJECTION_VERSION = 1
+
+# Stored as 0/1 or a bool.
+VISIBLE = Attr('removed').not_exists() | Attr('removed').eq(False) | Attr('removed').eq(0)
+
+
+def tag_index_item(tag: str, article: dict) -> dict:
+    """A tag index entry: partitioned by tag, newest first by the article's SK, carrying its listing fields."""
+    entry = {field: article[field] for field in LISTING_FIELDS if field in article}
+    entry.setdefault('removed', 0)
+    entry.update(PK=tag, SK=article['SK'], articleType=article['PK'], uniqueId=article['SK'],
+                 projectionVersion=TAG_PROJECTION_VERSION)
+    return entry
+
+
+def is_projected(entry: dict) -> bool:
+    return entry.get('projectionVersion', 0) >= TAG_PROJECTION_VERSION
+
+
+def feed_item(entry: dict) -> dict:
+    """A projected tag index entry in the shape of an article listing item."""
+    item = {field: entry[field] for field in LISTING_FIELDS if field in entry}
+    item.update(PK=entry['articleType'], SK=entry['uniqueId'])
+    return item
+
+
+def article_write_actions(doc: dict, previous_tags=(), extra_actions=()) -> list:
+    """
+    TransactWriteItems actions putting an article, its tag index entries, and dropping entries of removed tags,
+    followed by `extra_actions` (e.g. the counter update) that must commit with them.
+    """
+    articles_table, tag_table = os.environ['ARTICLES_V2_TABLE'], os.environ['TAG_INDEX_TABLE']
+    tags = list(dict.fromkeys(doc.get('tags', [])))
+
+    actions = [{'Put': {'TableName': articles_table, 'Item': doc}}]
+    actions += [{'Put': {'TableName': tag_table, 'Item': tag_index_item(tag, doc)}} for tag in tags]
+    actions += [{'Delete': {'TableName': tag_table, 'Key': {'PK': tag, 'SK': doc['SK']}}}
+                for tag in dict.fromkeys(previous_tags or ()) if tag not in tags]
+    actions += [action for action in extra_actions if action]
+
+    if len(actions) > TRANSACTION_LIMIT:
+        raise ValueError(f"Article {doc['SK']} has too many tags to write in one transaction ({len(actions)} actions)")
+    return actions
+
+
+def write_article(doc: dict, previous_tags=(), extra_actions=()):
+    """Write an article together with its tag index entries, so no tag page sees one without the other."""
+    # The resource's client serializes plain Python values, like Table methods do.
+    aws.resource('dynamodb').meta.client.transact_write_items(
+        TransactItems=article_write_actions(doc, previous_tags, extra_actions)
+    )
+
+
+def write_tag_entries(articles: list) -> int:
+    """(Re)write the tag index entries of `articles`, e.g. after an in-place update or for a backfill."""
+    count = 0
+    with aws.table(os.environ['TAG_INDEX_TABLE']).batch_writer(overwrite_by_pkeys=['PK', 'SK']) as batch:
+        for article in articles:
+            for tag in dict.fromkeys(article.get('tags', [])):
+                batch.put_item(Item=tag_index_item(tag, article))
+                count += 1
+    return count
+
+
+def chunked(items: list, size: int = BATCH_GET_LIMIT) -> list:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _backoff(attempt: int) -> float:
+    return min(BATCH_GET_BASE_DELAY * 2 ** attempt, BATCH_GET_MAX_DELAY) * random.uniform(0.5, 1.0)
+
+
+def _batch_get_chunk(table_name: str, keys: list, projection_expression: str = None,
+                     expression_attribute_names: dict = None, sleep=time.sleep) -> list:
+    request = {'Keys': keys}
+    if projection_expression:
+        request['ProjectionExpression'] = projection_expression
+    if expression_attribute_names:
+        request['ExpressionAttributeNames'] = expression_attribute_names
+
+    items = []
+    for attempt in range(BATCH_GET_MAX_ATTEMPTS):
+        response = aws.resource('dynamodb').batch_get_item(RequestItems={table_name: request})
+        items.extend(response.get('Responses', {}).get(table_name, []))
+
+        unprocessed = response.get('UnprocessedKeys', {}).get(table_name)
+        if not unprocessed:
+            return items
+        request = dict(request, Keys=unprocessed['Keys'])
+        if attempt + 1 < BATCH_GET_MAX_ATTEMPTS:
+            sleep(_backoff(attempt))
+
+    raise RuntimeError(f"{len(request['Keys'])} keys still unprocessed by {table_name} after {BATCH_GET_MAX_ATTEMPTS} attempts")
+
+
+def batch_get_ordered(table_name: str, keys: list, projection_expression: str = None,
+                      expression_attribute_names: dict = None, key_names=('PK', 'SK')) -> list:
+    """
+    Fetch `keys` with BatchGetItem, 100 keys per request and the requests in parallel, and return the items in
+    the order of `keys` (BatchGetItem answers in no particular order). Keys with no item are skipped.
+    """
+    if not keys:
+        return []
+
+    # Key attributes are needed to put the answers back in order.
+    if projection_expression:
+        names = dict(expression_attribute_names or {})
+        for name in key_names:
+            alias = f'#{name}'
+            names.setdefault(alias, name)
+            if alias not in projection_expression:
+                projection_expression += f', {alias}'
+        expression_attribute_names = names
+
+    chunks = chunked(keys)
+    if len(chunks) == 1:
+        # A single page of a feed: no need to hop to (and wait on) the shared pool.
+        fetched = [_batch_get_chunk(table_name, chunks[0], projection_expression, expression_attribute_names)]
+    else:
+        fetched = fan_out(**{
+            f'chunk{i}': Call(_batch_get_chunk, table_name, chunk, projection_expression, expression_attribute_names)
+            for i, chunk in enumerate(chunks)
+        }).values()
+
+    by_key = {tuple(item[name] for name in key_names): item for items in fetched for item in items}
+    ordered = (by_key.get(tuple(key[name] for name in key_names)) for key in keys)
+    return [item for item in ordered if item is not None]
+
+
+def query_tag_index(tag: str, limit: int, start_key: dict = None, from_sk=None) -> (list, dict or None):
+    """
+    One page of a tag's visible entries, newest first, and the cursor of the next page.
+    With `from_sk`, the entries from that SK upwards instead, oldest first (for "Newer" links).
+    """
+    condition = Key('PK').eq(tag)
+    if from_sk is not None:
+        condition &= Key('SK').gte(from_sk)
+    return fill_page(functools.partial(
+        aws.table(os.environ['TAG_INDEX_TABLE']).query,
+        KeyConditionExpression=condition,
+        FilterExpression=VISIBLE,
+        ScanIndexForward=from_sk is not None
+    ), limit, start_key)
+
+
+def of_type(entries: list, article_type: str) -> list:
+    # Entries written before articleType was recorded are assumed to be of the feed's type.
+    return [entry for entry in entries if entry.get('articleType', article_type) == article_type]
+
+
+def hydrate(entries: list, projection_expression: str = None, expression_attribute_names: dict = None,
+            article_type: str = 'ARTICLE', full_articles: bool = False) -> list:
+    """
+    Listing items for tag index entries, in order. Listings are served from the entries themselves; the articles
+    table is only read for full articles, or for entries written before the current projection and not yet backfilled.
+    """
+    missing = entries if full_articles else [entry for entry in entries if not is_projected(entry)]
+    fetched = {}
+    if missing:
+        keys = [{'PK': article_type, 'SK': entry.get('uniqueId', entry['SK'])} for entry in missing]
+        items = batch_get_ordered(os.environ['ARTICLES_V2_TABLE'], keys, projection_expression, expression_attribute_names)
+        fetched = {item['SK']: item for item in items}
+
+    page = []
+    for entry in entries:
+        unique_id = entry.get('uniqueId', entry['SK'])
+        item = fetched.get(unique_id) if full_articles or not is_projected(entry) else feed_item(entry)
+        if item:
+            page.append(item)
+    return page
+
+
+def tag_page(tag: str, page_size: int, start_key: dict = None, projection_expression: str = None,
+             expression_attribute_names: dict = None, article_type: str = 'ARTICLE',
+             full_articles: bool = False) -> (list, dict or None):
+    """A page of a tag feed, newest first, and the tag index key to continue from."""
+    entries, last_key = query_tag_index(tag, page_size, start_key)
+    entries = of_type(entries, article_type)
+    return hydrate(entries, projection_expression, expression_attribute_names, article_type, full_articles), last_key
+
+
+"""
+    MULTI-TAG FEEDS
+"""
+TAG_MODES = ('or', 'and')
+
+
+def parse_tags(tag: str or None) -> list:
+    """`?tag=aws,python` -> ['aws', 'python'] (deduplicated and sorted, so equivalent URLs share a cache entry)."""
+    return sorted({part.strip() for part in (tag or '').split(',') if part.strip()})
+
+
+class TagStream:
+    """
+    A tag's entries newest first, read lazily from the tag index in growing batches; or, given `from_sk`,
+    its entries from that SK upwards, oldest first.
+    """
+    def __init__(self, tag: str, after_sk=None, batch_size: int = 6, article_type: str = 'ARTICLE', from_sk=None):
+        self.tag = tag
+        self.article_type = article_type
+        self.batch_size = batch_size
+        self.from_sk = from_sk
+        self._cursor = {'PK': tag, 'SK': after_sk} if after_sk is not None else None
+        self._buffer = collections.deque()
+        self._exhausted = False
+
+    def order(self, sk):
+        """Sort key of `sk` in this stream's direction, smallest first."""
+        return sk if self.from_sk is not None else -sk
+
+    def head(self) -> dict or None:
+        while not self._buffer and not self._exhausted:
+            entries, self._cursor = query_tag_index(self.tag, self.batch_size, self._cursor, self.from_sk)
+            self._buffer.extend(of_type(entries, self.article_type))
+            self._exhausted = not self._cursor
+            self.batch_size = min(self.batch_size * 2, PAGE_FILL_MAX_LIMIT)
+        return self._buffer[0] if self._buffer else None
+
+    def pop(self) -> dict:
+        self.head()
+        return self._buffer.popleft()
+
+    def has_more_after(self, sk) -> bool:
+        """Whether entries past `sk` (in the stream's direction) may remain, without reading any more of the tag."""
+        return bool(self._buffer and self.order(self._buffer[-1]['SK']) > self.order(sk)) or not self._exhausted
+
+
+def merge_any(streams: list, page_size: int) -> (list, bool):
+    """k-way merge of sorted streams (union, duplicates collapsed); returns (entries, whether more may follow)."""
+    heads = [(i, stream.head()) for i, stream in enumerate(streams)]
+    heap = [(streams[i].order(entry['SK']), i) for i, entry in heads if entry]
+    heapq.heapify(heap)
+
+    merged = []
+    while heap and len(merged) < page_size:
+        _, i = heapq.heappop(heap)
+        entry = streams[i].pop()
+        if not merged or merged[-1]['SK'] != entry['SK']:
+            merged.append(entry)
+        # Once the page is full no stream is read any further.
+        following = streams[i].head() if len(merged) < page_size else None
+        if following:
+            heapq.heappush(heap, (streams[i].order(following['SK']), i))
+    return merged, bool(merged) and any(stream.has_more_after(merged[-1]['SK']) for stream in streams)
+
+
+def merge_all(streams: list, page_size: int) -> (list, bool):
+    """Intersection of sorted streams: every stream behind the furthest head is advanced until they agree."""
+    merged = []
+    while len(merged) < page_size:
+        heads = [stream.head() for stream in streams]
+        if any(head is None for head in heads):
+            return merged, False
+        target = max(stream.order(head['SK']) for stream, head in zip(streams, heads))
+        if all(stream.order(head['SK']) == target for stream, head in zip(streams, heads)):
+            merged.append(streams[0].pop())
+            for stream in streams[1:]:
+                stream.pop()
+            continue
+        for stream, head in zip(streams, heads):
+            if stream.order(head['SK']) < target:
+                stream.pop()
+    if not merged:
+        return merged, False
+    return merged, all(stream.has_more_after(merged[-1]['SK']) for stream in streams)
+
+
+def multi_tag_page(tags: list, mode: str, page_size: int, start_key: dict = None, projection_expression: str = None,
+                   expression_attribute_names: dict = None, article_type: str = 'ARTICLE',
+                   full_articles: bool = False, direction: str = 'older') -> (list, dict or None):
+    """
+    A page of articles tagged with any (`mode='or'`) or all (`mode='and'`) of `tags`, newest first.
+    Every tag's entries are sorted by SK, so the SK of the last article returned is all the cursor needs:
+    each stream resumes just below it, and only as many entries are read as the page takes.
+
+    direction='newer' reads upwards from start_key like the primary feed's paginate_backwards: the articles just
+    newer than it, newest first, and the SK to keep going upwards from (None once the newest has been reached).
+    """
+    merge = merge_all if mode == 'and' else merge_any
+    cursor_sk = start_key.get('SK') if start_key else None
+
+    if direction == 'newer' and cursor_sk is not None:
+        # One extra, as the cursor's own article is usually the first one read (and then dropped).
+        streams = [TagStream(tag, batch_size=page_size + 1, article_type=article_type, from_sk=cursor_sk) for tag in tags]
+        entries, more = merge(streams, page_size + 1)
+        continue_key = {'SK': entries[-1]['SK']} if more and entries else None
+        entries = entries[::-1]
+        if len(entries) > page_size:
+            entries = entries[:-1]
+    else:
+        streams = [TagStream(tag, cursor_sk, page_size, article_type) for tag in tags]
+        entries, more = merge(streams, page_size)
+        continue_key = {'SK': entries[-1]['SK']} if more and entries else None
+
+    items = hydrate(entries, projection_expression, expression_attribute_names, article_type, full_articles)
+    return items, continue_key
+
+
+def scan_all_articles(projection_expression: str = None, expression_attribute_names: dict = None) -> list:
+    """Every article, removed ones included, so their entries carry the removed flag too."""
+    table = aws.table(os.environ['ARTICLES_V2_TABLE'])
+    kwargs = {}
+    if projection_expression:
+        kwargs.update(ProjectionExpression=projection_expression, ExpressionAttributeNames=expression_attribute_names)
+    items = []
+    while True:
+        response = table.scan(**kwargs)
+        items.extend(response['Items'])
+        if not response.get('LastEvaluatedKey'):
+            return items
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def backfill():
+    """Rewrite every tag index entry with the current listing projection."""
+    names = {f'#{field}': field for field in ('PK', 'SK') + LISTING_FIELDS}
+    articles = scan_all_articles(', '.join(names), names)
+    count = write_tag_entries(articles)
+    print(f"[backfill] {count} tag index entries written for {len(articles)} articles")
+    return count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Maintain the tag index.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('backfill', help='copy the listing fields of every article onto its tag index entries')
+    args = parser.parse_args()
+
+    backfill()
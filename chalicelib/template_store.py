@@ -0,0 +1,139 @@
+""""""
+import os
+import time
+
+from botocore.exceptions import ClientError
+from jinja2 import TemplateNotFound
+from jinja2.meta import find_undeclared_variables
+
+from chalicelib.aws_clients import aws
+
+
+# How long (in seconds) a compiled template is trusted before we revalidate it against S3.
+TEMPLATE_CACHE_TTL = int(os.environ.get('TEMPLATE_CACHE_TTL', '60'))
+
+
+class CachedTemplate:
+    def __init__(self, template, etag: str, last_modified=None, checked_at: float = 0.0, variables: set = None):
+        """
+        :param template: the compiled jinja2.Template
+        :param etag: the S3 ETag of the source object the template was compiled from
+        :param last_modified: the S3 LastModified of the source object (datetime or None)
+        :param checked_at: monotonic time of the last fetch or revalidation attempt
+        :param variables: the undeclared variables the source references (None if unknown)
+        """
+        self.template = template
+        self.etag = etag
+        self.last_modified = last_modified
+        self.checked_at = checked_at
+        self.variables = variables
+
+
+def _is_not_modified(error: ClientError) -> bool:
+    code = str(error.response.get('Error', {}).get('Code', ''))
+    status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+    return code in ('304', 'NotModified') or status == 304
+
+
+class TemplateStore:
+    """
+    Process-wide cache of compiled Jinja templates hosted in S3.
+
+    Entries are keyed by (bucket, key) and remember the ETag they were compiled from.
+    Within the TTL a lookup is served from memory; after it, a conditional GET (IfNoneMatch)
+    revalidates the entry and we only recompile when S3 actually returns a new body.
+
+    Templates precompiled at deploy time (see chalicelib.precompiled_templates) are registered
+    with the ETag of the source they were built from, so a cold start loads them through the
+    environment's ModuleLoader and only goes back to S3 once that ETag turns out to be stale.
+    """
+    def __init__(self, ttl: int = TEMPLATE_CACHE_TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self._precompiled = {}
+        self.counters = dict(hits=0, misses=0, revalidations=0, not_modified=0, errors=0, precompiled=0)
+
+    def register_precompiled(self, bucket_name: str, manifest: dict):
+        """Register {s3_key: {'name': ..., 'etag': ...}} entries shipped with the deployment."""
+        for template_name, meta in manifest.items():
+            self._precompiled[(bucket_name, template_name)] = meta
+
+    def _load_precompiled(self, env, cache_key, now: float) -> CachedTemplate or None:
+        meta = self._precompiled.get(cache_key)
+        if not meta:
+            return None
+        try:
+            template = env.get_template(meta['name'])
+        except TemplateNotFound:
+            return None
+        self.counters['precompiled'] += 1
+        variables = set(meta['variables']) if 'variables' in meta else None
+        return CachedTemplate(template=template, etag=meta['etag'], checked_at=now, variables=variables)
+
+    def get_entry(self, env, bucket_name: str, template_name: str, preprocess=None) -> CachedTemplate:
+        """Return the cached entry for a template, fetching or revalidating it when needed."""
+        cache_key = (bucket_name, template_name)
+        entry = self._entries.get(cache_key)
+        now = time.monotonic()
+
+        if entry and now - entry.checked_at < self.ttl:
+            self.counters['hits'] += 1
+            return entry
+
+        if not entry:
+            entry = self._load_precompiled(env, cache_key, now)
+            if entry:
+                self._entries[cache_key] = entry
+                return entry
+
+        s3_object = aws.resource('s3').Object(bucket_name, template_name)
+
+        if entry:
+            self.counters['revalidations'] += 1
+            try:
+                response = s3_object.get(IfNoneMatch=entry.etag)
+            except ClientError as e:
+                if _is_not_modified(e):
+                    self.counters['not_modified'] += 1
+                    entry.checked_at = now
+                    return entry
+                # S3 hiccup: keep serving what we have for another TTL rather than failing (or retrying) every request.
+                self.counters['errors'] += 1
+                entry.checked_at = now
+                print(f"Error revalidating template {template_name}: {e}")
+                return entry
+        else:
+            self.counters['misses'] += 1
+            response = s3_object.get()
+
+        source = response['Body'].read().decode('utf-8')
+        if preprocess:
+            source = preprocess(source)
+
+        entry = CachedTemplate(
+            template=env.from_string(source),
+            etag=response.get('ETag'),
+            last_modified=response.get('LastModified'),
+            checked_at=now,
+            variables=find_undeclared_variables(env.parse(source))
+        )
+        self._entries[cache_key] = entry
+        return entry
+
+    def get_template(self, env, bucket_name: str, template_name: str, preprocess=None):
+        """Return the compiled jinja2.Template for an S3 key."""
+        return self.get_entry(env, bucket_name, template_name, preprocess=preprocess).template
+
+    def etag(self, bucket_name: str, template_name: str) -> str or None:
+        """Return the ETag of a cached template without touching S3."""
+        entry = self._entries.get((bucket_name, template_name))
+        return entry.etag if entry else None
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return dict(self.counters, entries=len(self._entries))
+
+
+template_store = TemplateStore()
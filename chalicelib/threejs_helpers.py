@@ -1,8 +1,11 @@
 """"""
+import json
 from collections import defaultdict
 
 from chalicelib.threejs_dict import ANIMATIONS_DICT
 
+THREEJS_VERSION = '0.169.0'
+
 
 def populate_importmaps(animation: str, threejs_version: str):
     default_importmap = {
@@ -74,3 +77,30 @@ def grouped_nav_items(nav_item_ordering):
 
     return ordered_grouped_nav_items
 
+
+def create_threejs_data(animation: str, data_selected: str, fullscreen: bool = False, navbar: bool = False):
+    viz = ANIMATIONS_DICT.get(animation, ANIMATIONS_DICT['multiaxis'])
+    print('viz', viz, 'multiaxis', ANIMATIONS_DICT)
+
+    threejs_version = viz.get('threejs_version', THREEJS_VERSION)
+
+    # TODO: Too many imports by default, need to fix this.
+    importmap = populate_importmaps(animation, threejs_version)
+
+    threejs_template_data = dict(
+        threejs_version=THREEJS_VERSION,
+        threejs_drawings=viz,
+        data_selected=data_selected,
+        importmap=json.dumps(importmap, indent=4),
+        fullscreen=fullscreen,
+    )
+
+    if navbar:
+        nav_item_ordering = ['Special', 'Educational', 'Quantitative', 'Spatial', 'World Building', 'Experimental',
+                             'Component', 'Attribution', 'Work in Progress', 'Local']
+        ordered_grouped_nav_items = grouped_nav_items(nav_item_ordering)
+        threejs_template_data['grouped_nav_items'] = ordered_grouped_nav_items
+    else:
+        threejs_template_data['grouped_nav_items'] = dict()
+
+    return threejs_template_data
@@ -1,7 +1,46 @@
 import os
+
+# boto3 clients are created at import time in chalicelib; give them a region so collection works offline.
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import importlib
+import sys
+
+import boto3
 import pytest
+from moto import mock_aws
 from unittest.mock import MagicMock, patch
 
+from chalicelib.aws_clients import aws
+
+
+@pytest.fixture(autouse=True)
+def fresh_aws_clients():
+    """The registry caches resources per container; drop them so each test's boto3 patch takes effect."""
+    aws.reset()
+    yield
+    aws.reset()
+
+@pytest.fixture
+def stream_app(monkeypatch):
+    """app.py as deployed with both DynamoDB streams configured (its import-time Stripe secrets come from moto)."""
+    for variable, value in dict(
+            ARTICLES_V2_TABLE='articles-v2', TAG_INDEX_TABLE='articles-v2-tagindex', HOME_TABLE='home', BUCKET_NAME='site',
+            ARTICLES_V2_STREAM_ARN='arn:aws:dynamodb:us-east-1:123456789012:table/articles-v2/stream/2024-01-01T00:00:00.000',
+            TAG_INDEX_STREAM_ARN='arn:aws:dynamodb:us-east-1:123456789012:table/articles-v2-tagindex/stream/2024-01-01T00:00:00.000',
+    ).items():
+        monkeypatch.setenv(variable, value)
+    monkeypatch.delitem(sys.modules, 'app', raising=False)
+    with mock_aws():
+        secrets = boto3.client('secretsmanager', region_name='us-east-1')
+        for name in ('STRIPE_RESTRICTED_KEY', 'STRIPE_WEBHOOK_SECRET'):
+            secrets.create_secret(Name=name, SecretString=f'{{"{name}": "test"}}')
+        app = importlib.import_module('app')
+    # Registered per import, so the next test gets a fresh app.
+    monkeypatch.delitem(sys.modules, 'app')
+    return app
+
+
 @pytest.fixture
 def mock_s3_resource():
     """Fixture for mocking S3 resource."""
@@ -0,0 +1,56 @@
+import markdown
+
+from chalicelib import article_render
+from chalicelib.article_render import RENDERER_VERSION, article_source, is_render_current
+from chalicelib.article_utils import build_article_doc
+
+
+ARTICLE = """# Lambda layers
+
+```python
+def handler(event, context):
+    return event
+```
+
+```mermaid
+graph TD
+    A --> B
+```
+"""
+
+
+def test_build_article_doc_renders_through_the_real_extensions():
+    doc = build_article_doc(1700000000000, ARTICLE, ['aws'])
+
+    assert doc['rendererVersion'] == RENDERER_VERSION
+    assert is_render_current(doc)
+    assert '<div class="codehilite">' in doc['html']
+    assert '<div class="mermaid">\ngraph TD\nA --> B\n</div>' in doc['html']
+    assert 'mermaid.initialize' in doc['html']
+    assert 'lambda-layers' in doc['toc']
+
+
+def test_mermaid_extension_leaves_documents_without_diagrams_alone():
+    text = "Plain *text*.\n\n```\ncode\n```\n"
+    extensions = ["fenced_code", "chalicelib.mermaid"]
+
+    assert markdown.markdown(text, extensions=extensions) == markdown.markdown(text, extensions=["fenced_code"])
+
+
+def test_render_failure_does_not_block_a_publish(monkeypatch):
+    def broken(md_content):
+        raise ValueError('bad extension')
+    monkeypatch.setattr(article_render, 'rendered_fields', broken)
+
+    doc = build_article_doc(1700000000000, ARTICLE, ['aws'])
+
+    # Stored without HTML; the read path renders it lazily.
+    assert doc['content'] == ARTICLE
+    assert 'html' not in doc and 'rendererVersion' not in doc
+    assert not is_render_current(doc)
+
+
+def test_article_source_prefers_the_content_the_write_paths_update():
+    assert article_source({'content': 'edited', 'body': 'legacy'}) == 'edited'
+    assert article_source({'body': 'legacy'}) == 'legacy'
+    assert article_source({}) == ''
@@ -0,0 +1,72 @@
+import gzip
+
+import brotli
+import pytest
+
+from chalicelib.assets import STATIC_ASSETS, AssetRegistry, StaticAsset
+from chalicelib.cache_policy import DEFAULT_POLICY_SET, cache_policies
+from chalicelib.invalidation import SURROGATE_KEY_HEADER
+
+
+CSS = b'body { margin: 0; padding: 0; }\n' * 50
+
+
+@pytest.fixture(autouse=True)
+def default_policies(monkeypatch):
+    # Keep Parameter Store out of it; the defaults are what an unconfigured deployment serves.
+    monkeypatch.setattr(cache_policies, 'loader', lambda: DEFAULT_POLICY_SET)
+
+
+def test_manifest_routes_and_names_are_unique():
+    assert len({entry['name'] for entry in STATIC_ASSETS}) == len(STATIC_ASSETS)
+    assert len({entry['route'] for entry in STATIC_ASSETS}) == len(STATIC_ASSETS)
+    for entry in STATIC_ASSETS:
+        assert entry.get('key') or entry.get('bundled_path')
+
+
+def test_favicon_is_served_uncompressed():
+    favicon = next(entry for entry in STATIC_ASSETS if entry['name'] == 'favicon')
+    asset = StaticAsset('favicon', favicon['content_type'], b'\x00\x00\x01\x00', compress=favicon['compress'])
+
+    response = asset.response({'Accept-Encoding': 'br, gzip'})
+
+    assert list(asset.variants) == ['identity']
+    assert 'Content-Encoding' not in response.headers
+    assert response.body == b'\x00\x00\x01\x00'
+
+
+@pytest.mark.parametrize('accept_encoding, encoding', [('br, gzip', 'br'), ('gzip', 'gzip'), (None, 'identity')])
+def test_css_variants_follow_accept_encoding(accept_encoding, encoding):
+    asset = StaticAsset('serve_css', 'text/css', CSS, route='/style.css')
+
+    response = asset.response({'Accept-Encoding': accept_encoding} if accept_encoding else {})
+
+    decode = {'br': brotli.decompress, 'gzip': gzip.decompress, 'identity': bytes}[encoding]
+    assert decode(response.body) == CSS
+    assert response.headers.get('Content-Encoding') == (None if encoding == 'identity' else encoding)
+    assert response.headers['Content-Type'] == 'text/css'
+    assert response.headers['Cache-Control'] == cache_policies.header_for('text/css', '/style.css')
+    assert response.headers[SURROGATE_KEY_HEADER]
+    assert 'Accept-Encoding' in response.headers['Vary']
+
+
+def test_registry_reads_each_asset_once(tmp_path):
+    (tmp_path / 'style.css').write_bytes(CSS)
+    registry = AssetRegistry([dict(name='serve_css', route='/style.css', key='frontend/style.css',
+                                   local_path='style.css', content_type='text/css',
+                                   headers={'X-Extra': '1'})], local=True, base_dir=str(tmp_path))
+
+    first = registry.response('serve_css', {'Accept-Encoding': 'gzip'})
+    (tmp_path / 'style.css').write_bytes(b'changed')
+    second = registry.response('serve_css', {'Accept-Encoding': 'gzip'})
+
+    assert gzip.decompress(second.body) == CSS
+    assert first.headers['ETag'] == second.headers['ETag']
+    assert second.headers['X-Extra'] == '1'
+
+
+def test_registry_turns_load_errors_into_500(tmp_path):
+    registry = AssetRegistry([dict(name='missing', route='/missing.css', key='x', local_path='missing.css',
+                                   content_type='text/css')], local=True, base_dir=str(tmp_path))
+
+    assert registry.response('missing').status_code == 500
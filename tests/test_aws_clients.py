@@ -0,0 +1,36 @@
+from unittest.mock import MagicMock, patch
+
+from chalicelib.aws_clients import CLIENT_CONFIG, AWSClients
+
+
+def test_resources_are_created_once_with_the_tuned_config():
+    registry = AWSClients()
+
+    with patch('boto3.resource') as mock_resource:
+        first = registry.table('articles')
+        second = registry.table('home')
+        s3 = registry.resource('s3')
+
+    assert mock_resource.call_count == 2
+    mock_resource.assert_any_call('dynamodb', config=CLIENT_CONFIG)
+    assert first is not None and second is not None and s3 is not None
+    assert registry.counters == dict(created=2, reused=1)
+
+
+def test_config_uses_adaptive_retries_and_keepalive():
+    assert CLIENT_CONFIG.retries['mode'] == 'adaptive'
+    assert CLIENT_CONFIG.tcp_keepalive is True
+    assert CLIENT_CONFIG.max_pool_connections >= 10
+
+
+def test_stats_report_pool_reuse():
+    pool = MagicMock(num_requests=10, num_connections=2)
+    client = MagicMock()
+    client._endpoint.http_session._manager.pools.keys.return_value = ['pool']
+    client._endpoint.http_session._manager.pools.__getitem__.return_value = pool
+    registry = AWSClients()
+
+    with patch('boto3.client', return_value=client):
+        registry.client('cloudfront')
+
+    assert registry.stats()['pools'] == {'client:cloudfront': dict(requests=10, connections=2, reused=8)}
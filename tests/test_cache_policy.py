@@ -0,0 +1,103 @@
+import pytest
+
+from chalicelib.cache_policy import LISTING_CURSOR_PAGE, LISTING_FIRST_PAGE, CachePolicy, CachePolicyEngine
+from chalicelib.cache_policy import build_policy_set, parse_policy
+
+
+def test_parse_named_duration_matches_previous_headers():
+    assert parse_policy('DAY').header() == 'public, s-maxage=86400, max-age=86400'
+    assert parse_policy('minute').header() == 'public, s-maxage=60, max-age=60'
+
+
+def test_parse_directives():
+    policy = parse_policy('max-age=60, s-maxage=HOUR, stale-while-revalidate=86400, stale-if-error=604800')
+
+    assert policy == CachePolicy(max_age=60, s_maxage=3600, stale_while_revalidate=86400, stale_if_error=604800)
+    assert policy.header() == 'public, s-maxage=3600, max-age=60, stale-while-revalidate=86400, stale-if-error=604800'
+
+
+@pytest.mark.parametrize('value', ['', 'FORTNIGHT', 's-maxage=60', 'max-age=60, immutable'])
+def test_parse_rejects_invalid_values(value):
+    with pytest.raises(ValueError):
+        parse_policy(value)
+
+
+def test_route_rules_win_over_content_type():
+    policies = build_policy_set(dict(html='MINUTE'), routes={'/threejs/*': 'WEEK', '/{section}/{article}': 'HOUR'})
+
+    assert policies.lookup('text/html; charset=UTF-8').max_age == 60
+    assert policies.lookup('text/html; charset=UTF-8', '/{section}/{article}').max_age == 3600
+    assert policies.lookup('text/html; charset=UTF-8', '/threejs/{animation}').max_age == 604800
+    assert policies.lookup('image/x-icon').max_age == 60  # fallback default
+
+
+def test_invalid_values_fall_back_to_defaults():
+    policies = build_policy_set(dict(html='nonsense'), routes={'/': 'also nonsense'})
+
+    assert policies.lookup('text/html').max_age == 86400
+    assert '/' not in policies.routes
+
+
+def test_engine_refreshes_after_ttl_and_keeps_last_good_policies_on_error():
+    calls = []
+
+    def loader():
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError('ssm unavailable')
+        return build_policy_set(dict(html='HOUR' if len(calls) == 1 else 'MINUTE'))
+
+    engine = CachePolicyEngine(loader=loader, ttl=0)
+
+    assert engine.policy_for('text/html').max_age == 3600
+    assert engine.policy_for('text/html').max_age == 3600  # refresh failed, previous policies kept
+    assert engine.policy_for('text/html').max_age == 60
+    assert engine.counters == dict(refreshes=2, errors=1)
+
+
+def test_engine_does_not_reload_within_ttl():
+    calls = []
+    engine = CachePolicyEngine(loader=lambda: calls.append(1) or build_policy_set({}), ttl=3600)
+
+    for _ in range(3):
+        engine.header_for('text/css')
+
+    assert len(calls) == 1
+
+
+def test_engine_reloads_inline_once_the_ttl_has_passed(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('chalicelib.cache_policy.time.monotonic', lambda: now[0])
+    durations = iter(['HOUR', 'MINUTE'])
+    engine = CachePolicyEngine(loader=lambda: build_policy_set(dict(html=next(durations))), ttl=30)
+
+    assert engine.policy_for('text/html').max_age == 3600
+    now[0] += 29
+    assert engine.policy_for('text/html').max_age == 3600
+    now[0] += 1
+    # The request that finds the policies stale gets the reloaded ones, with no thread left behind.
+    assert engine.policy_for('text/html').max_age == 60
+    assert engine.stats()['age'] == 0
+
+
+def test_listing_pages_default_to_short_first_page_and_long_cursor_pages():
+    policies = build_policy_set({})
+
+    first = policies.lookup('text/html', LISTING_FIRST_PAGE)
+    cursor = policies.lookup('text/html', LISTING_CURSOR_PAGE)
+
+    assert first.stale_while_revalidate > 0
+    assert cursor.s_maxage > first.s_maxage
+    assert build_policy_set({}, routes={LISTING_CURSOR_PAGE: 'HOUR'}).lookup('text/html', LISTING_CURSOR_PAGE).s_maxage == 3600
+
+
+def test_policies_are_loaded_when_the_app_is_imported(monkeypatch, request):
+    from chalicelib.cache_policy import DEFAULT_POLICY_SET, cache_policies
+    loaded = build_policy_set(dict(html='HOUR'))
+    monkeypatch.setattr(cache_policies, 'loader', lambda: loaded)
+    monkeypatch.setattr(cache_policies, '_policies', DEFAULT_POLICY_SET)
+    monkeypatch.setattr(cache_policies, '_loaded_at', None)
+
+    request.getfixturevalue('stream_app')
+
+    assert cache_policies._policies is loaded and cache_policies.stats()['age'] is not None
@@ -0,0 +1,150 @@
+import gzip
+
+import pytest
+
+from chalicelib.assets import StaticAsset
+from chalicelib.cache_policy import DEFAULT_POLICY_SET, cache_policies
+from chalicelib.caching import create_compressed_response, fingerprint_etag, is_not_modified, negotiate_encoding
+from chalicelib.caching import representation_etag
+
+
+ETAG = fingerprint_etag('article', 'ARTICLE', 1700000000000, '"template"', '1')
+LAST_MODIFIED = 'Tue, 14 Nov 2023 22:13:20 GMT'
+
+
+@pytest.fixture(autouse=True)
+def default_policies(monkeypatch):
+    monkeypatch.setattr(cache_policies, 'loader', lambda: DEFAULT_POLICY_SET)
+
+
+def test_fingerprint_etag_is_deterministic_and_input_sensitive():
+    assert ETAG == fingerprint_etag('article', 'ARTICLE', 1700000000000, '"template"', '1')
+    assert ETAG != fingerprint_etag('article', 'ARTICLE', 1700000000001, '"template"', '1')
+
+
+def test_representation_etag_differs_per_encoding():
+    opaque = ETAG.strip('"')
+
+    assert representation_etag(ETAG, 'identity') == ETAG
+    assert representation_etag(ETAG, 'br') == f'"{opaque}-br"'
+    assert representation_etag(ETAG, 'gzip') == f'"{opaque}-gzip"'
+    assert representation_etag(f'W/{ETAG}', 'dcz') == f'W/"{opaque}-dcz"'
+    assert representation_etag(None, 'br') is None
+
+
+@pytest.mark.parametrize('if_none_match, expected', [
+    (ETAG, True),
+    (f'"other", {ETAG}', True),
+    (f'W/{ETAG}', True),
+    ('*', True),
+    ('"other"', False),
+    (representation_etag(ETAG, 'gzip'), False),
+])
+def test_if_none_match(if_none_match, expected):
+    assert is_not_modified({'If-None-Match': if_none_match}, ETAG) is expected
+
+
+def test_if_none_match_takes_precedence_over_if_modified_since():
+    headers = {'If-None-Match': '"other"', 'If-Modified-Since': LAST_MODIFIED}
+
+    assert not is_not_modified(headers, ETAG, LAST_MODIFIED)
+
+
+@pytest.mark.parametrize('if_modified_since, expected', [
+    (LAST_MODIFIED, True),
+    ('Wed, 15 Nov 2023 00:00:00 GMT', True),
+    ('Mon, 13 Nov 2023 00:00:00 GMT', False),
+    ('not a date', False),
+])
+def test_if_modified_since(if_modified_since, expected):
+    assert is_not_modified({'if-modified-since': if_modified_since}, ETAG, LAST_MODIFIED) is expected
+
+
+def test_unconditional_requests_are_modified():
+    assert not is_not_modified({}, ETAG, LAST_MODIFIED)
+    assert not is_not_modified(None, ETAG)
+
+
+def test_compressed_response_sends_the_etag_of_its_encoding():
+    gzipped = create_compressed_response('<p>hi</p>', etag=ETAG, request_headers={'Accept-Encoding': 'gzip'})
+    plain = create_compressed_response('<p>hi</p>', etag=ETAG, request_headers={})
+    uncached = create_compressed_response('<p>hi</p>', skip_caching=True, etag=ETAG,
+                                          request_headers={'Accept-Encoding': 'br'})
+
+    assert gzipped.headers['ETag'] == representation_etag(ETAG, 'gzip')
+    assert gzip.decompress(gzipped.body) == b'<p>hi</p>'
+    assert plain.headers['ETag'] == ETAG
+    assert uncached.headers['ETag'] == representation_etag(ETAG, 'br')
+
+
+def test_static_asset_answers_304_only_for_the_negotiated_representation():
+    asset = StaticAsset('serve_css', 'text/css', b'body { margin: 0; }\n' * 20, route='/style.css')
+    fresh = asset.response({'Accept-Encoding': 'br'})
+
+    revalidated = asset.response({'Accept-Encoding': 'br', 'If-None-Match': fresh.headers['ETag']})
+    other_encoding = asset.response({'Accept-Encoding': 'gzip', 'If-None-Match': fresh.headers['ETag']})
+
+    assert fresh.status_code == 200 and fresh.headers['ETag'] == representation_etag(asset.etag, 'br')
+    assert revalidated.status_code == 304 and revalidated.body == ''
+    assert revalidated.headers['ETag'] == fresh.headers['ETag']
+    assert revalidated.headers['Cache-Control'] == fresh.headers['Cache-Control']
+    assert other_encoding.status_code == 200 and other_encoding.headers['Content-Encoding'] == 'gzip'
+
+
+@pytest.mark.parametrize('accept_encoding, expected', [
+    ('gzip, deflate, br', 'br'),
+    ('br;q=0.5, gzip', 'gzip'),
+    ('gzip;q=0.8, br;q=0.8', 'br'),
+    ('br;q=0, gzip;q=0.1', 'gzip'),
+    ('br;q=0, gzip;q=0', 'identity'),
+    ('*', 'br'),
+    ('*;q=0.5, br;q=0', 'gzip'),
+    ('identity', 'identity'),
+    ('deflate', 'identity'),
+    ('BR;Q=1', 'br'),
+    ('br;q=oops, gzip', 'gzip'),
+    ('', 'identity'),
+    (None, 'identity'),
+])
+def test_negotiate_encoding(accept_encoding, expected):
+    assert negotiate_encoding(accept_encoding) == expected
+
+
+def test_negotiate_encoding_only_offers_available_codings():
+    assert negotiate_encoding('br, gzip', available=('gzip',)) == 'gzip'
+    assert negotiate_encoding('br', available=()) == 'identity'
+
+
+class _Config:
+    social, menu = [], []
+
+    def content_version(self, article_type):
+        return 3
+
+    def total(self, article_type, tags):
+        return None
+
+    def tag_facets(self, article_type):
+        return []
+
+
+class _Template:
+    def render(self, **data):
+        return '<p>listing</p>'
+
+
+def test_listing_revalidation_is_answered_before_the_page_is_read(stream_app, monkeypatch):
+    monkeypatch.setattr(stream_app.site_config, 'get', lambda article_type, min_version=None: _Config())
+    monkeypatch.setattr(stream_app.template_store, 'etag', lambda bucket_name, template_name: '"template"')
+    monkeypatch.setattr(stream_app, 'fan_out', lambda **calls: dict(template=_Template(), page=([], None, None)))
+    stream_app.app.current_request = type('Request', (), dict(headers={'Accept-Encoding': 'gzip'}))()
+    fresh = stream_app.fetch_paginated(None, None, None, {})
+
+    def unreachable(**calls):
+        raise AssertionError('a revalidation read the page')
+    monkeypatch.setattr(stream_app, 'fan_out', unreachable)
+    stream_app.app.current_request.headers = {'Accept-Encoding': 'gzip', 'If-None-Match': fresh.headers['ETag']}
+    revalidated = stream_app.fetch_paginated(None, None, None, {})
+
+    assert fresh.status_code == 200
+    assert revalidated.status_code == 304 and revalidated.headers['ETag'] == fresh.headers['ETag']
@@ -0,0 +1,61 @@
+import boto3
+import pytest
+from moto import mock_aws
+
+from chalicelib.counters import counter_deltas, counter_update_action, get_counters, reconcile, tag_facets
+from chalicelib.tag_feed import write_article
+
+
+@pytest.fixture
+def tables(monkeypatch):
+    monkeypatch.setenv('ARTICLES_V2_TABLE', 'articles')
+    monkeypatch.setenv('TAG_INDEX_TABLE', 'tagindex')
+    monkeypatch.setenv('HOME_TABLE', 'home')
+
+    with mock_aws():
+        dynamodb = boto3.resource('dynamodb')
+        for name, keys in (('articles', [('PK', 'S'), ('SK', 'N')]), ('tagindex', [('PK', 'S'), ('SK', 'N')]),
+                           ('home', [('section', 'S')])):
+            dynamodb.create_table(
+                TableName=name, BillingMode='PAY_PER_REQUEST',
+                KeySchema=[{'AttributeName': key, 'KeyType': kind} for (key, _), kind in zip(keys, ('HASH', 'RANGE'))],
+                AttributeDefinitions=[{'AttributeName': key, 'AttributeType': kind} for key, kind in keys],
+            )
+        yield dynamodb
+
+
+def _article(sk, tags, removed=0, article_type='ARTICLE'):
+    return {'PK': article_type, 'SK': sk, 'title': f'Article {sk}', 'tags': tags, 'removed': removed}
+
+
+def test_deltas_cover_publishing_retagging_and_removal():
+    assert counter_deltas(None, _article(1, ['aws', 'aws'])) == {'type:ARTICLE': 1, 'tag:ARTICLE:aws': 1}
+    assert counter_deltas(_article(1, ['aws', 'go']), _article(1, ['aws', 'python'])) == \
+        {'tag:ARTICLE:go': -1, 'tag:ARTICLE:python': 1}
+    assert counter_deltas(_article(1, ['aws']), _article(1, ['aws'], removed=1)) == {'type:ARTICLE': -1, 'tag:ARTICLE:aws': -1}
+    assert counter_deltas(_article(1, ['aws'], removed=1), _article(1, ['go'], removed=1)) == {}
+    assert counter_update_action({}) is None
+
+
+def test_counters_are_written_with_the_article(tables):
+    writes = [(None, _article(1, ['aws', 'python'])), (None, _article(2, ['aws'], article_type='PROJECT')),
+              (_article(1, ['aws', 'python']), _article(1, ['aws']))]
+    for previous, doc in writes:
+        write_article(doc, previous and previous['tags'], [counter_update_action(counter_deltas(previous, doc))])
+
+    counts = get_counters('home')
+    assert counts == {'type:ARTICLE': 1, 'tag:ARTICLE:aws': 1, 'tag:ARTICLE:python': 0, 'type:PROJECT': 1,
+                      'tag:PROJECT:aws': 1}
+    assert tag_facets(counts, 'ARTICLE') == [('aws', 1)]
+
+
+def test_reconcile_recounts_from_a_scan(tables):
+    for doc in (_article(1, ['aws']), _article(2, ['aws', 'go']), _article(3, ['go'], removed=1)):
+        tables.Table('articles').put_item(Item=doc)
+    tables.Table('home').put_item(Item={'section': 'counters', 'type:ARTICLE': 5, 'tag:ARTICLE:aws': 2})
+
+    drift = reconcile()
+
+    assert drift == {'type:ARTICLE': (5, 2), 'tag:ARTICLE:go': (0, 1)}
+    assert get_counters('home') == {'type:ARTICLE': 2, 'tag:ARTICLE:aws': 2, 'tag:ARTICLE:go': 1}
+    assert reconcile() == {}
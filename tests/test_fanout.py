@@ -0,0 +1,48 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from chalicelib import fanout
+from chalicelib.fanout import Call, FanOutTimeout, fan_out
+
+
+def _slow(value, seconds=0.2):
+    time.sleep(seconds)
+    return value
+
+
+def test_calls_run_concurrently_and_results_are_keyed_by_name():
+    start = time.perf_counter()
+
+    results = fan_out(a=Call(_slow, 1), b=Call(_slow, 2), c=Call(_slow, value=3))
+
+    assert results == dict(a=1, b=2, c=3)
+    assert time.perf_counter() - start < 0.5
+
+
+def test_missed_deadline_raises_with_the_call_name():
+    with pytest.raises(FanOutTimeout) as excinfo:
+        fan_out(fast=Call(_slow, 1, seconds=0), slow=Call(_slow, 2, seconds=1, timeout=0.05))
+
+    assert excinfo.value.name == 'slow'
+
+
+def test_failures_are_raised_to_the_caller():
+    def fail():
+        raise ValueError('boom')
+
+    with pytest.raises(ValueError, match='boom'):
+        fan_out(ok=Call(_slow, 1, seconds=0), broken=Call(fail))
+
+
+def test_fan_out_from_a_pool_thread_runs_inline(monkeypatch):
+    # One worker: a nested fan-out that queued its calls behind the running one would wait out its deadline.
+    monkeypatch.setattr(fanout, '_executor', ThreadPoolExecutor(max_workers=1, initializer=fanout._mark_worker))
+    inline_before = fanout.stats()['inline']
+
+    def outer():
+        return fan_out(a=Call(_slow, 1, seconds=0), b=Call(_slow, 2, seconds=0))
+
+    assert fan_out(outer=Call(outer, timeout=1)) == dict(outer=dict(a=1, b=2))
+    assert fanout.stats()['inline'] == inline_before + 1
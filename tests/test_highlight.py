@@ -0,0 +1,61 @@
+import markdown
+
+from chalicelib.highlight import HighlightCache, highlight_cache
+
+EXTENSIONS = ["fenced_code", "codehilite", "tables", "toc"]
+
+ARTICLE = """# Title
+
+Intro paragraph.
+
+```python
+def add(a, b):
+    return a + b  # <sum>
+```
+
+```hl_lines="1"
+plain & text
+```
+
+``` { .js }
+var x = 1;
+```
+"""
+
+
+def test_cached_highlight_matches_codehilite_output():
+    expected = markdown.markdown(ARTICLE, extensions=EXTENSIONS)
+    actual = markdown.markdown(ARTICLE, extensions=EXTENSIONS + ["chalicelib.highlight"])
+
+    assert actual == expected
+
+
+def test_cached_highlight_reuses_blocks_across_renders():
+    markdown.markdown(ARTICLE, extensions=EXTENSIONS + ["chalicelib.highlight"])
+    hits_before = highlight_cache.counters['hits']
+    misses_before = highlight_cache.counters['misses']
+
+    edited = ARTICLE.replace('Intro paragraph.', 'An edited intro paragraph.')
+    markdown.markdown(edited, extensions=EXTENSIONS + ["chalicelib.highlight"])
+
+    assert highlight_cache.counters['misses'] == misses_before
+    assert highlight_cache.counters['hits'] == hits_before + 2
+
+
+def test_highlight_cache_key_depends_on_language_code_and_style():
+    key = HighlightCache.key('python', 'x = 1', {'style': 'default'})
+
+    assert key == HighlightCache.key('python', 'x = 1', {'style': 'default'})
+    assert key != HighlightCache.key('js', 'x = 1', {'style': 'default'})
+    assert key != HighlightCache.key('python', 'x = 2', {'style': 'default'})
+    assert key != HighlightCache.key('python', 'x = 1', {'style': 'monokai'})
+
+
+def test_highlight_cache_is_bounded():
+    cache = HighlightCache(max_entries=2)
+    cache.put('a', '<a>')
+    cache.put('b', '<b>')
+    cache.put('c', '<c>')
+
+    assert cache.get('a') is None
+    assert cache.get('c') == '<c>'
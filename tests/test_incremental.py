@@ -0,0 +1,147 @@
+import boto3
+from boto3.dynamodb.types import TypeSerializer
+from moto import mock_aws
+
+from chalicelib import incremental
+from chalicelib.incremental import coalesce_records, plan_regeneration, regenerate
+from chalicelib.invalidation import LocalInvalidator
+from chalicelib.precompiled_templates import PRECOMPILED_TEMPLATES
+from chalicelib.site_generator import DirectoryWriter, SiteGenerator, listings, load_templates
+from chalicelib.template_store import CachedTemplate, template_store
+
+ARTICLES_ARN = 'arn:aws:dynamodb:us-east-1:123456789012:table/articles-v2/stream/2024-01-01T00:00:00.000'
+TAGS_ARN = 'arn:aws:dynamodb:us-east-1:123456789012:table/articles-v2-tagindex/stream/2024-01-01T00:00:00.000'
+
+_serializer = TypeSerializer()
+
+
+def _image(item: dict or None) -> dict or None:
+    return {k: _serializer.serialize(v) for k, v in item.items()} if item else None
+
+
+def _record(event_name: str, old: dict = None, new: dict = None, arn: str = ARTICLES_ARN, keys=('PK', 'SK')) -> dict:
+    """A raw stream record as Lambda delivers it (NEW_AND_OLD_IMAGES)."""
+    item = new or old
+    stream = {'Keys': _image({k: item[k] for k in keys})}
+    if old:
+        stream['OldImage'] = _image(old)
+    if new:
+        stream['NewImage'] = _image(new)
+    return {'eventName': event_name, 'eventSourceARN': arn, 'dynamodb': stream}
+
+
+def _article(sk: int, article_type: str = 'ARTICLE', tags=('aws',), **fields) -> dict:
+    article = dict(PK=article_type, SK=sk, title=f'Article {sk}', slug=f'article-{sk}', url=f'/blog/{sk}-article-{sk}',
+                   tags=list(tags), removed=0, description='', thumbnail='', html=f'<p>{sk}</p>', rendererVersion='1')
+    return {**article, **fields}
+
+
+def _plan(records, articles, page_size=2, uses_neighbours=False):
+    article_changes, tag_changes = coalesce_records(records, 'articles-v2', 'articles-v2-tagindex')
+    return plan_regeneration(article_changes, tag_changes, listings(articles), page_size, uses_neighbours)
+
+
+def test_burst_of_edits_is_coalesced_into_one_change():
+    first, second, third = _article(5, title='a'), _article(5, title='b'), _article(5, title='c')
+    records = [_record('MODIFY', first, second), _record('MODIFY', second, third)]
+
+    article_changes, _ = coalesce_records(records, 'articles-v2', 'articles-v2-tagindex')
+
+    assert len(article_changes) == 1
+    assert article_changes[0].old['title'] == 'a' and article_changes[0].new['title'] == 'c'
+
+
+def test_edit_in_place_only_renders_the_article_and_the_pages_listing_it():
+    articles = [_article(sk) for sk in range(1, 8)]  # newest first: 7 6 | 5 4 | 3 2 | 1
+    records = [_record('MODIFY', _article(4, title='old'), _article(4, title='new'))]
+
+    assert _plan(records, articles) == {
+        ('article', ('ARTICLE', 4)),
+        ('listing', '/', 2),
+        ('listing', '/tags/aws', 2),
+    }
+
+
+def test_publish_shifts_every_later_page_and_adds_a_trailing_one():
+    articles = [_article(sk) for sk in range(1, 6)] + [_article(10, tags=['new'])]  # 10 5 | 4 3 | 2 1
+    records = [_record('INSERT', new=_article(10, tags=['new']))]
+
+    assert _plan(records, articles) == {
+        ('article', ('ARTICLE', 10)),
+        ('listing', '/', 1), ('listing', '/', 2), ('listing', '/', 3),
+        ('listing', '/tags/new', 1),
+        ('sitemap',),
+    }
+
+
+def test_removal_deletes_pages_that_no_longer_exist():
+    articles = [_article(sk) for sk in range(1, 5)]  # 4 3 | 2 1 (5 was on page 1 with 4)
+    records = [_record('MODIFY', _article(5), _article(5, removed=1))]
+
+    plan = _plan(records, articles, uses_neighbours=True)
+
+    assert ('delete', '/blog/5-article-5') in plan
+    assert ('delete', '/page/3') in plan and ('delete', '/tags/aws/page/3') in plan
+    assert {('listing', '/', 1), ('listing', '/', 2)} <= plan
+    assert ('article', ('ARTICLE', 4)) in plan  # neighbour
+    assert ('article', ('ARTICLE', 5)) not in plan
+
+
+def test_tag_index_record_touches_only_that_tag_listing():
+    articles = [_article(sk, tags=['python']) for sk in range(1, 4)]
+    records = [_record('MODIFY', {'tag': 'python', 'uniqueId': 3}, {'tag': 'python', 'uniqueId': 3},
+                       arn=TAGS_ARN, keys=('tag', 'uniqueId'))]
+
+    assert _plan(records, articles) == {('listing', '/tags/python', 1)}
+
+
+def test_regenerate_writes_planned_outputs(tmp_path):
+    articles = [_article(sk) for sk in range(1, 4)]
+    nodes = {('article', ('ARTICLE', 3)), ('listing', '/', 1), ('sitemap',), ('delete', '/blog/9-gone')}
+    generator = SiteGenerator(load_templates(), dict(social=[]), page_size=2, workers=2)
+    by_key = {(a['PK'], a['SK']): a for a in articles}
+
+    paths = regenerate(nodes, generator, DirectoryWriter(str(tmp_path)), listings(articles), by_key.get, articles)
+
+    assert sorted(paths) == ['/', '/blog/3-article-3', '/blog/9-gone', '/sitemap.xml']
+    assert (tmp_path / 'blog/3-article-3/index.html.br').exists()
+    assert not (tmp_path / 'page/2/index.html').exists()
+
+
+def test_deployed_templates_come_from_s3_without_a_bundle(monkeypatch):
+    monkeypatch.setattr(incremental, 'load_manifest', lambda: {})
+    template_store.clear()
+    with mock_aws():
+        s3 = boto3.client('s3')
+        s3.create_bucket(Bucket='site')
+        for name in PRECOMPILED_TEMPLATES:
+            with open(f'templates/{name}', 'rb') as f:
+                s3.put_object(Bucket='site', Key=f'frontend/{name}', Body=f.read())
+        s3.put_object(Bucket='site', Key='frontend/article.html', Body=b'{{ article.title }} {{ older_article.url }}')
+
+        templates = incremental.deployed_templates('site')
+
+    template_store.clear()
+    assert set(templates) == set(PRECOMPILED_TEMPLATES)
+    assert templates['article.html'].template.render(article=dict(title='T'), older_article=dict(url='/u')) == 'T /u'
+    assert incremental.uses_neighbours(templates['article.html'])
+    assert not incremental.uses_neighbours(CachedTemplate(None, '"x"', variables={'article', 'menu'}))
+
+
+def test_stream_handlers_are_lambda_entry_points(stream_app, monkeypatch):
+    """Lambda calls app.<handler name>(event, context), so those names must be the Chalice wrappers."""
+    received = []
+    monkeypatch.setattr(stream_app, 'regenerate_from_stream', received.append)
+    record = _record('INSERT', new=_article(7))
+    # The rest of what Lambda delivers, which Chalice's DynamoDBRecord reads.
+    record.update(eventID='1', eventVersion='1.1', eventSource='aws:dynamodb', awsRegion='us-east-1')
+    record['dynamodb'].update(ApproximateCreationDateTime=1700000000, SequenceNumber='1', SizeBytes=100,
+                              StreamViewType='NEW_AND_OLD_IMAGES')
+
+    stream_app.regenerate_articles_v2({'Records': [record]}, None)
+    stream_app.regenerate_tag_index({'Records': [dict(record, eventSourceARN=TAGS_ARN)]}, None)
+
+    assert [records[0]['eventSourceARN'] for records in received] == [ARTICLES_ARN, TAGS_ARN]
+    assert received[0][0]['dynamodb'] == record['dynamodb']
+    assert {(source.name, source.handler_string) for source in stream_app.app.event_sources} >= {
+        ('regenerate_articles_v2', 'app.regenerate_articles_v2'), ('regenerate_tag_index', 'app.regenerate_tag_index')}
@@ -0,0 +1,133 @@
+import boto3
+import pytest
+from moto import mock_aws
+
+from chalicelib import article_utils
+from chalicelib.counters import get_counters
+from chalicelib.ingest import ingest, parse_markdown, read_source
+from chalicelib.invalidation import LocalInvalidator
+from chalicelib.metadata_snapshot import GENERATION_ATTRIBUTE, load_snapshot, Snapshot
+
+
+ARTICLE = """---
+title: Lambda layers
+tags: [aws, python]
+description: Sharing code between functions
+---
+
+# Lambda layers
+"""
+
+
+@pytest.fixture
+def tables(monkeypatch):
+    monkeypatch.setenv('ARTICLES_V2_TABLE', 'articles')
+    monkeypatch.setenv('TAG_INDEX_TABLE', 'tagindex')
+    monkeypatch.setenv('HOME_TABLE', 'home')
+    monkeypatch.setenv('BUCKET_NAME', 'bucket')
+    # Rendering is covered elsewhere; keep it out of the write path under test.
+    monkeypatch.setattr(article_utils, 'try_rendered_fields', lambda content: {'html': content, 'toc': '', 'rendererVersion': '1'})
+
+    with mock_aws():
+        dynamodb = boto3.resource('dynamodb')
+        for name, keys in (('articles', [('PK', 'S'), ('SK', 'N')]), ('tagindex', [('PK', 'S'), ('SK', 'N')]),
+                           ('home', [('section', 'S')])):
+            dynamodb.create_table(
+                TableName=name, BillingMode='PAY_PER_REQUEST',
+                KeySchema=[{'AttributeName': key, 'KeyType': kind} for (key, _), kind in zip(keys, ('HASH', 'RANGE'))],
+                AttributeDefinitions=[{'AttributeName': key, 'AttributeType': kind} for key, kind in keys],
+            )
+        dynamodb.Table('home').put_item(Item={'section': 'website_data', 'social': []})
+        boto3.client('s3').create_bucket(Bucket='bucket')
+        yield dynamodb
+
+
+def test_parse_markdown_reads_front_matter_and_filename():
+    article = parse_markdown(ARTICLE, '42-lambda-layers.md')
+
+    assert article['unique_id'] == 42 and article['slug'] == 'lambda-layers'
+    assert article['tags'] == ['aws', 'python']
+    assert article['content'].startswith('# Lambda layers')
+
+
+def test_reruns_only_write_what_changed(tables, tmp_path):
+    for unique_id in (1, 2, 3):
+        (tmp_path / f'{unique_id}-article.md').write_text(ARTICLE)
+
+    first = ingest(read_source(str(tmp_path)), workers=2, invalidator=LocalInvalidator()).summary()
+    created_at = tables.Table('articles').get_item(Key={'PK': 'ARTICLE', 'SK': 2})['Item']['createdAt']
+
+    assert (first['written'], first['tag_entries']) == (3, 6)
+    assert tables.Table('tagindex').get_item(Key={'PK': 'aws', 'SK': 2})['Item']['title'] == 'Lambda layers'
+
+    (tmp_path / '2-article.md').write_text(ARTICLE.replace('[aws, python]', '[aws]'))
+    second = ingest(read_source(str(tmp_path)), invalidator=LocalInvalidator()).summary()
+
+    assert (second['unchanged'], second['written'], second['tag_entries_deleted']) == (2, 1, 1)
+    assert 'Item' not in tables.Table('tagindex').get_item(Key={'PK': 'python', 'SK': 2})
+    assert tables.Table('articles').get_item(Key={'PK': 'ARTICLE', 'SK': 2})['Item']['createdAt'] == created_at
+    assert tables.Table('home').get_item(Key={'section': 'website_data'})['Item']['contentVersion_ARTICLE'] == 2
+    assert get_counters('home') == {'type:ARTICLE': 3, 'tag:ARTICLE:aws': 3, 'tag:ARTICLE:python': 2}
+
+
+def test_jsonl_source(tmp_path):
+    source = tmp_path / 'articles.jsonl'
+    source.write_text('{"unique_id": 7, "content": "# Seven", "tags": ["go"]}\n\n{"unique_id": 8, "content": "# Eight"}\n')
+
+    assert [article['unique_id'] for article in read_source(str(source))] == [7, 8]
+
+
+def test_a_changed_date_created_is_written(tables):
+    article = {'unique_id': 5, 'content': '# Five', 'date_created': '2020-01-01'}
+    ingest([article], invalidator=LocalInvalidator())
+
+    rerun = ingest([dict(article, date_created='2021-06-30')], invalidator=LocalInvalidator()).summary()
+
+    assert (rerun['unchanged'], rerun['written']) == (0, 1)
+    assert tables.Table('articles').get_item(Key={'PK': 'ARTICLE', 'SK': 5})['Item']['date_created'] == '2021-06-30'
+
+
+def test_failed_share_is_reported_and_left_for_the_next_run(tables, monkeypatch):
+    from chalicelib import ingest as ingest_module
+    articles = [{'unique_id': unique_id, 'content': f'# {unique_id}', 'tags': ['aws']} for unique_id in (1, 2, 3)]
+    tag_index_item = ingest_module.tag_index_item
+
+    def failing(tag, doc):
+        if doc['SK'] == 2:
+            raise RuntimeError('throttled')
+        return tag_index_item(tag, doc)
+    monkeypatch.setattr(ingest_module, 'tag_index_item', failing)
+
+    # Two workers: [1, 3] and [2].
+    report = ingest(articles, workers=2, invalidator=LocalInvalidator())
+
+    assert (report.counters['written'], report.counters['failed'], report.failed) == (2, 1, [['ARTICLE', 2]])
+    assert 'Item' not in tables.Table('articles').get_item(Key={'PK': 'ARTICLE', 'SK': 2})
+    assert get_counters('home') == {'type:ARTICLE': 2, 'tag:ARTICLE:aws': 2}
+
+    monkeypatch.setattr(ingest_module, 'tag_index_item', tag_index_item)
+    rerun = ingest(articles, workers=2, invalidator=LocalInvalidator()).summary()
+
+    assert (rerun['unchanged'], rerun['written'], rerun['failed']) == (2, 1, 0)
+    assert get_counters('home') == {'type:ARTICLE': 3, 'tag:ARTICLE:aws': 3}
+    assert tables.Table('home').get_item(Key={'section': 'website_data'})['Item']['contentVersion_ARTICLE'] == 2
+
+
+def test_import_publishes_a_snapshot_at_its_bumped_version(tables, monkeypatch):
+    from chalicelib import ingest as ingest_module
+    write_docs = ingest_module.write_docs
+    builds = []
+
+    def write_then_build(docs, previous, report):
+        written = write_docs(docs, previous, report)
+        # The rebuild the writes' stream records trigger, before the import bumps the version.
+        builds.append(ingest_module.build_metadata_snapshot())
+        return written
+    monkeypatch.setattr(ingest_module, 'write_docs', write_then_build)
+
+    ingest([{'unique_id': 1, 'content': '# One'}], invalidator=LocalInvalidator())
+
+    website_data = tables.Table('home').get_item(Key={'section': 'website_data'})['Item']
+    snapshot = Snapshot.decode(load_snapshot(website_data[GENERATION_ATTRIBUTE]))
+    assert builds == [1] and snapshot.generation == 2
+    assert snapshot.is_current('ARTICLE', website_data['contentVersion_ARTICLE'])
@@ -0,0 +1,61 @@
+from unittest.mock import MagicMock
+
+from chalicelib.invalidation import CloudFrontInvalidator, LocalInvalidator, minimal_paths, plan_article_invalidation
+from chalicelib.invalidation import run_invalidation, surrogate_key_header
+
+
+def test_plan_covers_article_tags_and_first_listing_pages():
+    plan = plan_article_invalidation('ARTICLE', 42, tags=['aws', 'machine learning'], previous_tags=['python'],
+                                     cursor_queries=['after=abc%3D&v=6'])
+
+    assert plan.paths == [
+        '/',
+        '/?after=abc%3D&v=6',
+        '/?tag=aws',
+        '/?tag=machine%20learning',
+        '/?tag=python',
+        '/articles/42-*',
+        '/blog/42-*',
+    ]
+    assert plan.keys == {'article:ARTICLE:42', 'listing:ARTICLE', 'tag:aws', 'tag:machine learning', 'tag:python'}
+
+
+def test_plan_for_type_without_listing_only_touches_the_article():
+    plan = plan_article_invalidation('SERVICE', 7, tags=['consulting'])
+
+    assert plan.paths == ['/services/7-*']
+
+
+def test_minimal_paths_drops_paths_covered_by_wildcards():
+    assert minimal_paths(['/blog/1-*', '/blog/1-slug', '/blog/1-*', '/']) == ['/', '/blog/1-*']
+
+
+def test_surrogate_key_header_is_space_separated_and_deduped():
+    assert surrogate_key_header(['tag:machine learning', None, 'listing:ARTICLE', 'listing:ARTICLE']) == \
+        'tag:machine%20learning listing:ARTICLE'
+
+
+def test_plan_is_sent_as_a_single_batch():
+    invalidator = LocalInvalidator()
+    plan = plan_article_invalidation('PROJECT', 3, tags=['threejs'])
+
+    assert run_invalidation(plan, invalidator) == 'local-1'
+    assert invalidator.batches == [['/projects', '/projects/3-*', '/projects?tag=threejs']]
+
+
+def test_cloudfront_invalidator_batches_paths():
+    client = MagicMock()
+    client.create_invalidation.return_value = {'Invalidation': {'Id': 'I123'}}
+
+    assert CloudFrontInvalidator('E123', client=client).invalidate(['/', '/blog/1-*']) == 'I123'
+
+    batch = client.create_invalidation.call_args.kwargs['InvalidationBatch']
+    assert client.create_invalidation.call_count == 1
+    assert batch['Paths'] == {'Quantity': 2, 'Items': ['/', '/blog/1-*']}
+
+
+def test_failed_invalidation_does_not_raise():
+    invalidator = MagicMock()
+    invalidator.invalidate.side_effect = RuntimeError('throttled')
+
+    assert run_invalidation(plan_article_invalidation('ARTICLE', 1), invalidator) is None
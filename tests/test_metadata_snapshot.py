@@ -0,0 +1,193 @@
+import boto3
+import pytest
+from moto import mock_aws
+
+from chalicelib import article_utils, metadata_snapshot
+from chalicelib.main import content_version, get_website_data
+from chalicelib.metadata_snapshot import GENERATION_ATTRIBUTE, SNAPSHOT_KEY, Snapshot, SnapshotCache, build, encode
+from chalicelib.metadata_snapshot import load_snapshot
+
+
+def _article(sk, tags=(), removed=0, article_type='ARTICLE'):
+    return {'PK': article_type, 'SK': sk, 'title': f'Article {sk}', 'tags': list(tags), 'removed': removed, 'content': '...'}
+
+
+ARTICLES = [_article(sk, ['aws'] if sk % 2 else ['go']) for sk in range(1, 11)] + \
+           [_article(11, ['aws'], removed=1), _article(12, ['aws', 'go'], article_type='PROJECT')]
+
+
+def _snapshot(generation=1, versions=None):
+    return Snapshot.decode(encode(ARTICLES, versions or {'ARTICLE': 3}, generation))
+
+
+def test_snapshot_keeps_listing_fields_of_visible_articles():
+    snapshot = _snapshot()
+
+    assert [item['SK'] for item in snapshot.items['ARTICLE']] == list(range(10, 0, -1))
+    assert 'content' not in snapshot.items['ARTICLE'][0]
+    assert snapshot.is_current('ARTICLE', 3) and not snapshot.is_current('ARTICLE', 4)
+
+
+def test_pages_follow_the_listing_cursors_in_both_directions():
+    snapshot = _snapshot()
+
+    items, next_key, prev_key = snapshot.page('ARTICLE', 4)
+    assert [item['SK'] for item in items] == [10, 9, 8, 7] and next_key == {'PK': 'ARTICLE', 'SK': 7} and prev_key is None
+
+    items, next_key, prev_key = snapshot.page('ARTICLE', 4, start_key=next_key)
+    assert [item['SK'] for item in items] == [6, 5, 4, 3] and prev_key == {'PK': 'ARTICLE', 'SK': 7}
+
+    items, next_key, prev_key = snapshot.page('ARTICLE', 4, start_key={'PK': 'ARTICLE', 'SK': 3}, direction='newer')
+    assert [item['SK'] for item in items] == [7, 6, 5, 4] and prev_key == {'PK': 'ARTICLE', 'SK': 7}
+
+
+def test_tag_pages_come_from_posting_lists():
+    snapshot = _snapshot()
+
+    items, next_key, _ = snapshot.page('ARTICLE', 3, ['aws'])
+    assert [item['SK'] for item in items] == [9, 7, 5] and next_key == {'PK': 'aws', 'SK': 5}
+
+    items, next_key, _ = snapshot.page('ARTICLE', 3, ['aws'], start_key=next_key)
+    assert [item['SK'] for item in items] == [3, 1] and next_key is None
+
+    assert [item['SK'] for item in snapshot.page('ARTICLE', 20, ['aws', 'go'], 'or')[0]] == list(range(10, 0, -1))
+    assert snapshot.page('ARTICLE', 20, ['aws', 'go'], 'and')[0] == []
+    assert [item['SK'] for item in snapshot.page('PROJECT', 20, ['aws', 'go'], 'and')[0]] == [12]
+
+
+def test_cache_reloads_only_for_a_newer_generation():
+    loads = []
+
+    def loader(generation):
+        loads.append(generation)
+        return encode(ARTICLES, {'ARTICLE': 3}, generation)
+
+    cache = SnapshotCache(loader=loader)
+
+    assert cache.get(None) is None
+    assert cache.get(1).generation == 1
+    assert cache.get('1').generation == 1
+    assert cache.get(2).generation == 2
+    assert loads == [1, 2]
+
+
+def test_build_uploads_a_generation_then_publishes_it(monkeypatch):
+    monkeypatch.setenv('ARTICLES_V2_TABLE', 'articles')
+    monkeypatch.setenv('HOME_TABLE', 'home')
+    monkeypatch.setenv('BUCKET_NAME', 'bucket')
+
+    with mock_aws():
+        dynamodb = boto3.resource('dynamodb')
+        for name, keys in (('articles', [('PK', 'S'), ('SK', 'N')]), ('home', [('section', 'S')])):
+            dynamodb.create_table(
+                TableName=name, BillingMode='PAY_PER_REQUEST',
+                KeySchema=[{'AttributeName': key, 'KeyType': kind} for (key, _), kind in zip(keys, ('HASH', 'RANGE'))],
+                AttributeDefinitions=[{'AttributeName': key, 'AttributeType': kind} for key, kind in keys],
+            )
+        boto3.client('s3').create_bucket(Bucket='bucket')
+        dynamodb.Table('home').put_item(Item={'section': 'website_data', 'contentVersion_ARTICLE': 5})
+        for article in ARTICLES:
+            dynamodb.Table('articles').put_item(Item=article)
+
+        assert build() == 1
+
+        assert dynamodb.Table('home').get_item(Key={'section': 'website_data'})['Item'][GENERATION_ATTRIBUTE] == 1
+        body = boto3.client('s3').get_object(Bucket='bucket', Key=SNAPSHOT_KEY.format(generation=1))['Body'].read()
+        snapshot = Snapshot.decode(body)
+        assert snapshot.versions['ARTICLE'] == 5 and len(snapshot.items['ARTICLE']) == 10
+
+
+def test_rebuild_handler_is_a_lambda_entry_point(stream_app, monkeypatch):
+    builds = []
+    monkeypatch.setattr(stream_app, 'build_metadata_snapshot', lambda: builds.append(1))
+
+    stream_app.rebuild_metadata_snapshot({'Records': []}, None)
+
+    assert builds == [1]
+    assert ('rebuild_metadata_snapshot', 'app.rebuild_metadata_snapshot') in \
+        {(source.name, source.handler_string) for source in stream_app.app.event_sources}
+
+
+@pytest.fixture
+def site(monkeypatch):
+    for variable, value in dict(ARTICLES_V2_TABLE='articles', TAG_INDEX_TABLE='tagindex', HOME_TABLE='home',
+                                BUCKET_NAME='bucket').items():
+        monkeypatch.setenv(variable, value)
+    monkeypatch.setattr(article_utils, 'try_rendered_fields', lambda content: {})
+
+    with mock_aws():
+        dynamodb = boto3.resource('dynamodb')
+        for name, keys in (('articles', [('PK', 'S'), ('SK', 'N')]), ('tagindex', [('PK', 'S'), ('SK', 'N')]),
+                           ('home', [('section', 'S')])):
+            dynamodb.create_table(
+                TableName=name, BillingMode='PAY_PER_REQUEST',
+                KeySchema=[{'AttributeName': key, 'KeyType': kind} for (key, _), kind in zip(keys, ('HASH', 'RANGE'))],
+                AttributeDefinitions=[{'AttributeName': key, 'AttributeType': kind} for key, kind in keys],
+            )
+        dynamodb.Table('home').put_item(Item={'section': 'website_data', 'social': []})
+        boto3.client('s3').create_bucket(Bucket='bucket')
+        yield dynamodb
+
+
+def _published():
+    website_data = get_website_data('home')
+    snapshot = Snapshot.decode(load_snapshot(website_data[GENERATION_ATTRIBUTE]))
+    return snapshot, content_version(website_data, 'ARTICLE')
+
+
+def test_rebuild_triggered_by_a_write_sees_its_version_bump(site, monkeypatch):
+    write_article = article_utils.write_article
+
+    def write_then_build(*args, **kwargs):
+        write_article(*args, **kwargs)
+        # The stream record's rebuild, running before add_article_to_v2 returns.
+        build()
+    monkeypatch.setattr(article_utils, 'write_article', write_then_build)
+
+    article_utils.add_article_to_v2(1, '# One', ['aws'])
+    snapshot, version = _published()
+    assert version == 1 and snapshot.is_current('ARTICLE', version) and len(snapshot.items['ARTICLE']) == 1
+
+    article_utils.update_article_content(1, '# One, edited')
+    assert _published()[1] == 2 and not _published()[0].is_current('ARTICLE', 2)
+    build()
+    assert _published()[0].is_current('ARTICLE', 2)
+
+
+def test_write_during_a_build_leaves_it_stale_until_its_own_rebuild(site, monkeypatch):
+    article_utils.add_article_to_v2(1, '# One', [])
+    scan_all_articles = metadata_snapshot.scan_all_articles
+
+    def scan_racing_a_write(*args):
+        monkeypatch.setattr(metadata_snapshot, 'scan_all_articles', scan_all_articles)
+        article_utils.add_article_to_v2(2, '# Two', [])
+        return scan_all_articles(*args)
+    monkeypatch.setattr(metadata_snapshot, 'scan_all_articles', scan_racing_a_write)
+
+    assert build() == 1
+    snapshot, version = _published()
+    # Read version 1 before the scan: it holds article 2 but doesn't claim version 2.
+    assert version == 2 and not snapshot.is_current('ARTICLE', version)
+
+    assert build() == 2
+    assert _published()[0].is_current('ARTICLE', 2)
+
+
+def test_superseded_build_starts_over(site, monkeypatch):
+    article_utils.add_article_to_v2(1, '# One', [])
+    scan_all_articles = metadata_snapshot.scan_all_articles
+
+    def scan_racing_a_build(*args):
+        monkeypatch.setattr(metadata_snapshot, 'scan_all_articles', scan_all_articles)
+        # A build that started before article 1 was written publishes generation 1 first.
+        boto3.client('s3').put_object(Bucket='bucket', Key=SNAPSHOT_KEY.format(generation=1),
+                                      Body=encode([], {'ARTICLE': 0}, 1))
+        site.Table('home').update_item(Key={'section': 'website_data'}, UpdateExpression='SET #generation = :one',
+                                       ExpressionAttributeNames={'#generation': GENERATION_ATTRIBUTE},
+                                       ExpressionAttributeValues={':one': 1})
+        return scan_all_articles(*args)
+    monkeypatch.setattr(metadata_snapshot, 'scan_all_articles', scan_racing_a_build)
+
+    assert build() == 2
+    snapshot, version = _published()
+    assert snapshot.is_current('ARTICLE', version) and len(snapshot.items['ARTICLE']) == 1
@@ -0,0 +1,48 @@
+from chalicelib.page_cache import CachedPage, PageCache
+
+
+def _page(size: int) -> CachedPage:
+    return CachedPage(b'x' * size, {}, 200)
+
+
+def test_page_cache_hit_and_miss():
+    cache = PageCache(max_bytes=1024)
+    key = ('ARTICLE', 1, 1000, '"etag"')
+
+    assert cache.get(key) is None
+    cache.put(key, _page(10))
+
+    assert cache.get(key).body == b'x' * 10
+    assert cache.counters['misses'] == 1
+    assert cache.counters['hits'] == 1
+
+
+def test_page_cache_evicts_least_recently_used_by_bytes():
+    cache = PageCache(max_bytes=100)
+    cache.put('a', _page(40))
+    cache.put('b', _page(40))
+    cache.get('a')  # 'b' is now the least recently used
+    cache.put('c', _page(40))
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.get('c') is not None
+    assert cache.current_bytes == 80
+    assert cache.counters['evictions'] == 1
+
+
+def test_page_cache_skips_pages_larger_than_budget():
+    cache = PageCache(max_bytes=50)
+    cache.put('a', _page(10))
+    cache.put('huge', _page(500))
+
+    assert cache.get('huge') is None
+    assert cache.get('a') is not None
+
+
+def test_page_cache_new_version_is_a_new_key():
+    cache = PageCache(max_bytes=1024)
+    cache.put(('ARTICLE', 1, 1000, '"v1"'), _page(10))
+
+    assert cache.get(('ARTICLE', 1, 2000, '"v1"')) is None
+    assert cache.get(('ARTICLE', 1, 1000, '"v2"')) is None
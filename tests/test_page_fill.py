@@ -0,0 +1,63 @@
+from chalicelib.page_fill import PageFillStats, fill_page, next_limit
+
+
+def _query_over(items, visible=lambda item: not item.get('removed')):
+    """A fake filtered Query: Limit applies to items read, the filter runs afterwards."""
+    calls = []
+
+    def query(Limit, ExclusiveStartKey=None):
+        calls.append(Limit)
+        start = 0
+        if ExclusiveStartKey:
+            start = next(i for i, item in enumerate(items) if item['SK'] == ExclusiveStartKey['SK']) + 1
+        window = items[start:start + Limit]
+        response = {'Items': [item for item in window if visible(item)], 'ScannedCount': len(window)}
+        if start + Limit < len(items):
+            response['LastEvaluatedKey'] = {'PK': 'ARTICLE', 'SK': window[-1]['SK']}
+        return response
+    return query, calls
+
+
+def _items(removed_every: int, count: int = 40):
+    return [{'PK': 'ARTICLE', 'SK': sk, 'removed': int(sk % removed_every != 0)} for sk in range(count, 0, -1)]
+
+
+def test_sparse_filter_still_fills_the_page():
+    query, calls = _query_over(_items(removed_every=4))  # only every fourth article is visible
+
+    items, cursor = fill_page(query, 3)
+
+    assert [item['SK'] for item in items] == [40, 36, 32]
+    assert cursor == {'PK': 'ARTICLE', 'SK': 32}
+    assert len(calls) < 4 and calls[1] > calls[0]  # the second read was widened
+
+
+def test_cursor_resumes_exactly_after_the_last_returned_item():
+    query, _ = _query_over(_items(removed_every=2))
+
+    first, cursor = fill_page(query, 4)
+    second, _ = fill_page(query, 4, start_key=cursor)
+
+    assert [item['SK'] for item in first + second] == list(range(40, 24, -2))
+
+
+def test_exhausted_partition_returns_a_short_page_and_no_cursor():
+    query, _ = _query_over(_items(removed_every=10, count=25))
+
+    items, cursor = fill_page(query, 6)
+
+    assert [item['SK'] for item in items] == [20, 10]
+    assert cursor is None
+
+
+def test_limit_follows_observed_selectivity():
+    assert next_limit(6, 0, 0) == 6
+    assert next_limit(4, 6, 2) == 12
+    assert next_limit(6, 6, 0) == 12
+
+
+def test_stats_report_reads_per_item():
+    stats = PageFillStats()
+    stats.record(queries=2, read=12, returned=3)
+
+    assert stats.stats()['read_per_item'] == 4.0
@@ -0,0 +1,91 @@
+import boto3
+import pytest
+from moto import mock_aws
+
+from chalicelib import page_index
+from chalicelib.counters import counter_deltas
+from chalicelib.page_index import apply_membership_changes, members, page_index_actions, page_start_key, page_window
+from chalicelib.tag_feed import write_article
+
+
+@pytest.fixture
+def tables(monkeypatch):
+    monkeypatch.setenv('ARTICLES_V2_TABLE', 'articles')
+    monkeypatch.setenv('TAG_INDEX_TABLE', 'tagindex')
+    monkeypatch.setenv('HOME_TABLE', 'home')
+    page_index.invalidate()
+
+    with mock_aws():
+        dynamodb = boto3.resource('dynamodb')
+        for name, keys in (('articles', [('PK', 'S'), ('SK', 'N')]), ('tagindex', [('PK', 'S'), ('SK', 'N')]),
+                           ('home', [('section', 'S')])):
+            dynamodb.create_table(
+                TableName=name, BillingMode='PAY_PER_REQUEST',
+                KeySchema=[{'AttributeName': key, 'KeyType': kind} for (key, _), kind in zip(keys, ('HASH', 'RANGE'))],
+                AttributeDefinitions=[{'AttributeName': key, 'AttributeType': kind} for key, kind in keys],
+            )
+        yield dynamodb
+
+
+def _article(sk, tags, removed=0):
+    return {'PK': 'ARTICLE', 'SK': sk, 'title': f'Article {sk}', 'tags': tags, 'removed': removed}
+
+
+def test_writes_keep_listing_members_in_the_same_transaction(tables):
+    writes = [(None, _article(sk, ['aws'] if sk % 2 else ['go'])) for sk in range(1, 8)]
+    writes += [(_article(3, ['aws']), _article(3, ['aws'], removed=1)), (_article(4, ['go']), _article(4, ['aws']))]
+    for version, (previous, doc) in enumerate(writes):
+        write_article(doc, previous and previous['tags'], page_index_actions(counter_deltas(previous, doc), doc['SK']))
+
+    assert members('ARTICLE', version=1) == (7, 6, 5, 4, 2, 1)
+    assert members('ARTICLE', 'aws', version=1) == (7, 5, 4, 1)
+    assert members('ARTICLE', 'go', version=1) == (6, 2)
+
+
+def test_page_numbers_translate_into_start_keys(tables):
+    apply_membership_changes([({'type:ARTICLE': 1, 'tag:ARTICLE:aws': 1}, sk) for sk in range(1, 15)])
+
+    assert page_start_key(1, 6, 'ARTICLE', version=1) is None
+    assert page_start_key(2, 6, 'ARTICLE', version=1) == {'PK': 'ARTICLE', 'SK': 9}
+    assert page_start_key(3, 6, 'ARTICLE', 'aws', version=1) == {'PK': 'aws', 'SK': 3}
+    assert page_start_key(9, 6, 'ARTICLE', version=1) == {'PK': 'ARTICLE', 'SK': 1}
+
+    # Cached per content version: a later write is only seen under the version it bumped.
+    apply_membership_changes([({'type:ARTICLE': 1}, 15)])
+    assert page_start_key(2, 6, 'ARTICLE', version=1) == {'PK': 'ARTICLE', 'SK': 9}
+    assert page_start_key(2, 6, 'ARTICLE', version=2) == {'PK': 'ARTICLE', 'SK': 10}
+
+
+def test_rebuild_recomputes_every_listing(tables):
+    for doc in (_article(1, ['aws']), _article(2, ['aws', 'go']), _article(3, ['go'], removed=1)):
+        tables.Table('articles').put_item(Item=doc)
+    apply_membership_changes([({'tag:ARTICLE:rust': 1}, 9)])
+
+    assert page_index.rebuild() == {'tag:ARTICLE:aws': 2, 'tag:ARTICLE:go': 1, 'type:ARTICLE': 2}
+    assert members('ARTICLE', 'rust', version=1) == ()
+    assert page_window(7, 20) == [1, 5, 6, 7, 8, 9, 20]
+
+
+class _Feed:
+    def __init__(self, indexes):
+        self.global_secondary_indexes = indexes
+        self.start_keys = []
+
+    def query(self, **kwargs):
+        self.start_keys.append(kwargs.get('ExclusiveStartKey'))
+        return {'Items': []}
+
+
+@pytest.mark.parametrize('indexes, expected', [
+    ([{'IndexName': 'removed-index'}], {'PK': 'ARTICLE', 'SK': 9, 'removed': False}),
+    (None, {'PK': 'ARTICLE', 'SK': 9}),
+])
+def test_page_boundaries_resume_either_primary_feed_query(tables, monkeypatch, indexes, expected):
+    from chalicelib import paginator_v2
+    apply_membership_changes([({'type:ARTICLE': 1}, sk) for sk in range(1, 15)])
+    feed = _Feed(indexes)
+    monkeypatch.setattr(paginator_v2, 'articles_db', feed)
+
+    paginator_v2._query_primary_feed(6, None, start_key=page_start_key(2, 6, 'ARTICLE', version=1))
+
+    assert feed.start_keys[0] == expected
@@ -0,0 +1,13 @@
+import json
+
+from chalicelib.precompiled_templates import PRECOMPILED_TEMPLATES, compile_templates, s3_key_for
+
+
+def test_the_repo_templates_compile_with_their_manifest(tmp_path):
+    manifest = compile_templates(target=str(tmp_path))
+
+    assert set(manifest) == {s3_key_for(name) for name in PRECOMPILED_TEMPLATES}
+    assert json.loads((tmp_path / 'manifest.json').read_text()) == manifest
+    assert 'articles' in manifest[s3_key_for('index.html')]['variables']
+    for entry in manifest.values():
+        assert entry['etag'].startswith('"') and isinstance(entry['variables'], list)
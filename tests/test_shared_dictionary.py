@@ -0,0 +1,77 @@
+import base64
+import hashlib
+
+import pytest
+import zstandard
+
+from chalicelib import caching
+from chalicelib.shared_dictionary import DCZ_MAGIC, SharedDictionary, load_shared_dictionary, train_dictionary
+
+
+DICTIONARY = b'<nav class="navbar navbar-expand-lg">\n<footer class="site-footer">\n' * 20
+PAGE = b'<html><nav class="navbar navbar-expand-lg"><p>Hello</p><footer class="site-footer"></footer></html>'
+
+
+@pytest.fixture
+def dictionary(monkeypatch):
+    dictionary = SharedDictionary(DICTIONARY)
+    monkeypatch.setattr(caching, 'shared_dictionary', dictionary)
+    return dictionary
+
+
+def test_dcz_body_is_framed_with_the_dictionary_hash(dictionary):
+    body = dictionary.compress_dcz(PAGE, level=6)
+
+    assert body[:len(DCZ_MAGIC)] == DCZ_MAGIC
+    assert body[len(DCZ_MAGIC):len(DCZ_MAGIC) + 32] == hashlib.sha256(DICTIONARY).digest()
+
+    zstd_dict = zstandard.ZstdCompressionDict(DICTIONARY, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+    decompressor = zstandard.ZstdDecompressor(dict_data=zstd_dict)
+    assert decompressor.decompress(body[len(DCZ_MAGIC) + 32:]) == PAGE
+
+
+def test_available_dictionary_is_the_structured_field_hash(dictionary):
+    advertised = f':{base64.b64encode(hashlib.sha256(DICTIONARY).digest()).decode()}:'
+
+    assert dictionary.matches(advertised)
+    assert dictionary.matches(f' {advertised} ')
+    assert not dictionary.matches(f':{base64.b64encode(hashlib.sha256(b"other").digest()).decode()}:')
+    assert not dictionary.matches(None)
+
+
+def test_dcz_is_negotiated_only_for_a_matching_dictionary(dictionary):
+    matching = {'Accept-Encoding': 'dcz, br, gzip', 'Available-Dictionary': dictionary.available_dictionary}
+    stale = dict(matching, **{'Available-Dictionary': ':AAAA:'})
+
+    assert caching.negotiate_request_encoding(matching) == 'dcz'
+    assert caching.negotiate_request_encoding(stale) == 'br'
+    assert caching.negotiate_request_encoding({'Accept-Encoding': 'dcz, gzip'}) == 'gzip'
+    assert caching.negotiate_request_encoding({'Accept-Encoding': 'br', 'Available-Dictionary':
+                                               dictionary.available_dictionary}) == 'br'
+
+
+def test_dcz_round_trips_through_compress_for_request(dictionary):
+    headers = {'Accept-Encoding': 'dcz, br', 'Available-Dictionary': dictionary.available_dictionary}
+
+    body, encoding = caching.compress_for_request(PAGE, 'text/html; charset=UTF-8', headers)
+
+    assert encoding == 'dcz'
+    assert body.startswith(DCZ_MAGIC + dictionary.sha256)
+
+
+def test_without_a_dictionary_br_and_gzip_are_used(monkeypatch):
+    monkeypatch.setattr(caching, 'shared_dictionary', None)
+    headers = {'Accept-Encoding': 'dcz, gzip', 'Available-Dictionary': ':AAAA:'}
+
+    assert caching.negotiate_request_encoding(headers) == 'gzip'
+    assert load_shared_dictionary('/nonexistent/site.dict') is None
+
+
+def test_train_dictionary_keeps_shared_lines_within_the_size_limit():
+    documents = {'a': 'x' * 40 + '\n{{ title }} is skipped\nshort\n', 'b': 'x' * 40 + '\nonly in b, long enough\n'}
+
+    dictionary = train_dictionary(documents, max_size=64)
+
+    assert len(dictionary) <= 64
+    assert dictionary.endswith(b'x' * 40 + b'\n')
+    assert b'{{' not in dictionary and b'short' not in dictionary
@@ -0,0 +1,84 @@
+from chalicelib.site_config import SiteConfigCache
+
+
+def _loader(items):
+    calls = []
+
+    def load():
+        calls.append(1)
+        item = items[min(len(calls), len(items)) - 1]
+        if isinstance(item, Exception):
+            raise item
+        return item
+    return load, calls
+
+
+def test_website_data_is_loaded_once_within_ttl_and_menus_are_precomputed():
+    load, calls = _loader([dict(social=[{'url': 'u', 'icon': 'i'}], contentVersion_ARTICLE=3)])
+    cache = SiteConfigCache(loader=load, ttl=3600)
+
+    for _ in range(3):
+        config = cache.get()
+
+    assert len(calls) == 1
+    assert config.social == [{'url': 'u', 'icon': 'i'}]
+    assert config.content_version('ARTICLE') == 3
+    assert config.non_index_menu[0] == dict(title='Home', url='/index.html/')
+
+
+def test_newer_requested_version_reloads_synchronously():
+    load, calls = _loader([dict(social=[], contentVersion_ARTICLE=3), dict(social=[], contentVersion_ARTICLE=4)])
+    cache = SiteConfigCache(loader=load, ttl=3600)
+    cache.get()
+
+    assert cache.get(min_version='3').content_version() == 3
+    assert cache.get(min_version='4').content_version() == 4
+    assert cache.get(min_version='not-a-number').content_version() == 4
+    assert len(calls) == 2 and cache.counters['version_misses'] == 1
+
+
+def test_failed_refresh_keeps_last_good_snapshot():
+    load, calls = _loader([dict(social=['a']), RuntimeError('throttled'), dict(social=['b'])])
+    cache = SiteConfigCache(loader=load, ttl=0)
+
+    assert cache.get().social == ['a']
+    assert cache.get().social == ['a']  # refresh failed
+    assert cache.get().social == ['b']
+    assert cache.counters['errors'] == 1
+
+
+def test_note_version_updates_the_cached_snapshot():
+    load, _ = _loader([dict(social=[], contentVersion_PROJECT=1)])
+    cache = SiteConfigCache(loader=load, ttl=3600)
+    cache.get()
+
+    cache.note_version('PROJECT', 2)
+
+    assert cache.get().content_version('PROJECT') == 2
+
+
+def test_stale_snapshot_is_reloaded_by_the_request_that_finds_it(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('chalicelib.site_config.time.monotonic', lambda: now[0])
+    load, calls = _loader([dict(social=['a']), dict(social=['b'])])
+    cache = SiteConfigCache(loader=load, ttl=60)
+
+    assert cache.get().social == ['a']
+    now[0] += 59
+    assert cache.get().social == ['a']
+    now[0] += 1
+    assert cache.get().social == ['b']
+    assert len(calls) == 2 and cache.stats()['age'] == 0
+
+
+def test_website_data_is_loaded_when_the_app_is_imported(monkeypatch, request):
+    from chalicelib.site_config import site_config
+    load, calls = _loader([dict(social=['a'], contentVersion_ARTICLE=5)])
+    monkeypatch.setattr(site_config, 'loader', load)
+    monkeypatch.setattr(site_config, 'counts_loader', dict)
+    monkeypatch.setattr(site_config, '_config', None)
+
+    request.getfixturevalue('stream_app')
+
+    assert len(calls) == 1
+    assert site_config.get().content_version() == 5 and len(calls) == 1
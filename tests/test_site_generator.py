@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+from chalicelib.site_generator import DirectoryWriter, SiteGenerator, article_path, listing_page_path, load_templates
+from chalicelib.site_generator import output_key, paginate
+
+
+def _article(sk: int, article_type: str = 'ARTICLE', tags=('aws',)) -> dict:
+    return dict(PK=article_type, SK=sk, title=f'Article {sk}', slug=f'article-{sk}', url=f'/blog/{sk}-article-{sk}',
+                tags=list(tags), description='', thumbnail='', updatedAt=1704330000000,
+                html=f'<p>body {sk}</p>', toc='', rendererVersion='1')
+
+
+@pytest.mark.parametrize('path, key', [
+    ('/', 'index.html'),
+    ('/projects', 'projects/index.html'),
+    ('/page/2', 'page/2/index.html'),
+    ('/blog/5-slug', 'blog/5-slug/index.html'),
+    ('/sitemap.xml', 'sitemap.xml'),
+])
+def test_output_key(path, key):
+    assert output_key(path) == key
+
+
+def test_listing_paths_and_pages():
+    assert listing_page_path('/', 1) == '/'
+    assert listing_page_path('/', 2) == '/page/2'
+    assert listing_page_path('/projects', 0) is None
+    assert paginate([1, 2, 3], 2) == [[1, 2], [3]]
+    assert paginate([], 2) == [[]]
+    assert article_path(dict(PK='PROJECT', SK=3, slug='x')) == '/projects/3-x'
+
+
+def test_generate_writes_every_page_precompressed(tmp_path):
+    articles = [_article(sk) for sk in range(1, 4)] + [_article(10, 'PROJECT', tags=['threejs'])]
+    website_data = dict(social=[dict(url='https://github.com/x', icon='fa-github')])
+    generator = SiteGenerator(load_templates(), website_data, page_size=2, workers=2)
+
+    pages = generator.generate(articles, DirectoryWriter(str(tmp_path)))
+    paths = {page.path for page in pages}
+
+    assert {'/blog/1-article-1', '/blog/2-article-2', '/blog/3-article-3', '/blog/10-article-10',
+            '/', '/page/2', '/projects', '/work', '/tags/aws', '/tags/aws/page/2', '/tags/threejs',
+            '/404.html', '/sitemap.xml'} == paths
+    for suffix in ('', '.br', '.gz'):
+        assert os.path.exists(tmp_path / f'page/2/index.html{suffix}')
+
+    first_page = (tmp_path / 'index.html').read_text()
+    assert 'href="/page/2"' in first_page
+    assert 'Article 3' in first_page and 'Article 1' not in first_page
+    assert '<p>body 2</p>' in (tmp_path / 'blog/2-article-2/index.html').read_text()
+    assert '<loc>https://www.darrenmackenzie.com/blog/3-article-3</loc><lastmod>2024-01-04</lastmod>' in \
+        (tmp_path / 'sitemap.xml').read_text()
@@ -0,0 +1,200 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from chalicelib import tag_feed
+from chalicelib.tag_feed import article_write_actions, batch_get_ordered, chunked, multi_tag_page, parse_tags
+from chalicelib.tag_feed import tag_index_item, tag_page
+
+
+@pytest.fixture
+def dynamodb(monkeypatch):
+    monkeypatch.setenv('ARTICLES_V2_TABLE', 'articles')
+    monkeypatch.setenv('TAG_INDEX_TABLE', 'tags')
+    monkeypatch.setattr(tag_feed, '_backoff', lambda attempt: 0)
+    resource = MagicMock()
+    with patch('boto3.resource', return_value=resource):
+        yield resource
+
+
+def _article(sk):
+    return {'PK': 'ARTICLE', 'SK': sk, 'title': f'Article {sk}'}
+
+
+def test_chunks_respect_the_batch_get_limit():
+    assert [len(chunk) for chunk in chunked(list(range(250)))] == [100, 100, 50]
+
+
+def test_unprocessed_keys_are_retried_and_order_is_restored(dynamodb):
+    keys = [{'PK': 'ARTICLE', 'SK': sk} for sk in (9, 7, 5)]
+    dynamodb.batch_get_item.side_effect = [
+        {'Responses': {'articles': [_article(5)]}, 'UnprocessedKeys': {'articles': {'Keys': keys[:2]}}},
+        {'Responses': {'articles': [_article(7), _article(9)]}, 'UnprocessedKeys': {}},
+    ]
+
+    items = batch_get_ordered('articles', keys, '#PK, #SK, title', {'#PK': 'PK', '#SK': 'SK'})
+
+    assert [item['SK'] for item in items] == [9, 7, 5]
+    assert dynamodb.batch_get_item.call_args_list[1].kwargs['RequestItems']['articles']['Keys'] == keys[:2]
+
+
+def test_large_key_sets_are_fetched_in_parallel_chunks(dynamodb):
+    keys = [{'PK': 'ARTICLE', 'SK': sk} for sk in range(250, 0, -1)]
+    dynamodb.batch_get_item.side_effect = lambda RequestItems: {
+        'Responses': {'articles': [_article(key['SK']) for key in reversed(RequestItems['articles']['Keys'])]}
+    }
+
+    items = batch_get_ordered('articles', keys)
+
+    assert dynamodb.batch_get_item.call_count == 3
+    assert [item['SK'] for item in items] == list(range(250, 0, -1))
+
+
+def test_keys_left_unprocessed_after_every_attempt_raise(dynamodb):
+    keys = [{'PK': 'ARTICLE', 'SK': 1}]
+    dynamodb.batch_get_item.return_value = {'Responses': {}, 'UnprocessedKeys': {'articles': {'Keys': keys}}}
+
+    with pytest.raises(RuntimeError):
+        batch_get_ordered('articles', keys)
+
+
+def test_tag_page_cursor_comes_from_the_tag_index_query(dynamodb):
+    table = dynamodb.Table.return_value
+    table.query.return_value = {
+        'Items': [{'PK': 'aws', 'SK': 8, 'articleType': 'ARTICLE', 'uniqueId': 8},
+                  {'PK': 'aws', 'SK': 6, 'articleType': 'PROJECT', 'uniqueId': 6},
+                  {'PK': 'aws', 'SK': 3}],
+        'LastEvaluatedKey': {'PK': 'aws', 'SK': 3}
+    }
+    dynamodb.batch_get_item.return_value = {'Responses': {'articles': [_article(3), _article(8)]}}
+
+    items, next_key = tag_page('aws', 3)
+
+    assert [item['SK'] for item in items] == [8, 3]
+    assert next_key == {'PK': 'aws', 'SK': 3}
+    assert table.query.call_args.kwargs['ScanIndexForward'] is False
+
+
+def test_projected_entries_are_served_without_reading_articles(dynamodb):
+    article = dict(_article(8), PK='ARTICLE', slug='eight', url='/blog/8-eight', tags=['aws'], content='# not copied')
+    entry = tag_index_item('aws', article)
+    dynamodb.Table.return_value.query.return_value = {'Items': [entry]}
+
+    items, _ = tag_page('aws', 6)
+
+    assert items == [{'PK': 'ARTICLE', 'SK': 8, 'title': 'Article 8', 'slug': 'eight', 'url': '/blog/8-eight',
+                      'tags': ['aws'], 'removed': 0}]
+    dynamodb.batch_get_item.assert_not_called()
+
+
+def test_article_and_tag_entries_are_written_in_one_transaction(monkeypatch):
+    monkeypatch.setenv('ARTICLES_V2_TABLE', 'articles')
+    monkeypatch.setenv('TAG_INDEX_TABLE', 'tags')
+    doc = dict(_article(8), tags=['aws', 'python', 'aws'], content='...')
+
+    actions = article_write_actions(doc, previous_tags=['aws', 'go'])
+
+    assert [list(action) for action in actions] == [['Put'], ['Put'], ['Put'], ['Delete']]
+    assert actions[0]['Put']['Item'] is doc
+    assert {action['Put']['Item']['PK'] for action in actions[1:3]} == {'aws', 'python'}
+    assert 'content' not in actions[1]['Put']['Item']
+    assert actions[3]['Delete']['Key'] == {'PK': 'go', 'SK': 8}
+
+
+def _tag_index(dynamodb, partitions):
+    """
+    Serve {tag: [SK, ...]} as projected tag index entries, honouring Limit, ExclusiveStartKey, ScanIndexForward
+    and an SK >= condition.
+    """
+    reads = []
+
+    def query(KeyConditionExpression, Limit, ExclusiveStartKey=None, ScanIndexForward=True, **kwargs):
+        expression = KeyConditionExpression.get_expression()
+        if expression['operator'] == 'AND':
+            (_, tag), (_, from_sk) = (condition.get_expression()['values'] for condition in expression['values'])
+        else:
+            tag, from_sk = expression['values'][1], None
+        sks = sorted((sk for sk in partitions[tag] if from_sk is None or sk >= from_sk), reverse=not ScanIndexForward)
+        if ExclusiveStartKey:
+            sks = [sk for sk in sks if (sk > ExclusiveStartKey['SK'] if ScanIndexForward else sk < ExclusiveStartKey['SK'])]
+        page = sks[:Limit]
+        reads.append((tag, len(page)))
+        response = {'Items': [tag_index_item(tag, dict(_article(sk), tags=[tag])) for sk in page]}
+        if len(sks) > Limit:
+            response['LastEvaluatedKey'] = {'PK': tag, 'SK': page[-1]}
+        return response
+
+    dynamodb.Table.return_value.query.side_effect = query
+    return reads
+
+
+def test_tags_are_normalised():
+    assert parse_tags(' python,aws,,python ') == ['aws', 'python']
+    assert parse_tags(None) == []
+
+
+def test_any_mode_merges_tags_newest_first_without_duplicates(dynamodb):
+    _tag_index(dynamodb, {'aws': [9, 7, 4, 2], 'python': [8, 7, 3]})
+
+    items, next_key = multi_tag_page(['aws', 'python'], 'or', 4)
+    assert [item['SK'] for item in items] == [9, 8, 7, 4]
+    assert next_key == {'SK': 4}
+
+    items, next_key = multi_tag_page(['aws', 'python'], 'or', 4, next_key)
+    assert [item['SK'] for item in items] == [3, 2]
+    assert next_key is None
+
+
+def test_all_mode_intersects_tags_and_resumes_every_stream(dynamodb):
+    _tag_index(dynamodb, {'aws': [10, 9, 7, 5, 3, 1], 'python': [9, 8, 5, 3], 'go': [9, 5, 4, 3, 2]})
+
+    items, next_key = multi_tag_page(['aws', 'go', 'python'], 'and', 2)
+    assert [item['SK'] for item in items] == [9, 5]
+
+    items, next_key = multi_tag_page(['aws', 'go', 'python'], 'and', 2, next_key)
+    assert [item['SK'] for item in items] == [3]
+    assert next_key is None
+
+
+def test_merge_reads_only_what_the_page_needs(dynamodb):
+    reads = _tag_index(dynamodb, {'aws': list(range(100, 0, -1)), 'python': list(range(99, 0, -2))})
+
+    items, next_key = multi_tag_page(['aws', 'python'], 'or', 6)
+
+    assert [item['SK'] for item in items] == [100, 99, 98, 97, 96, 95]
+    assert reads == [('aws', 6), ('python', 6)]
+    dynamodb.batch_get_item.assert_not_called()
+
+
+def test_all_mode_with_an_empty_page_size_returns_nothing(dynamodb):
+    _tag_index(dynamodb, {'aws': [3, 2], 'python': [3, 1]})
+
+    assert multi_tag_page(['aws', 'python'], 'and', 0) == ([], None)
+
+
+@pytest.mark.parametrize('mode, partitions, pages', [
+    # Union 9 8 7 4 3 2 1.
+    ('or', {'aws': [9, 7, 4, 2], 'python': [8, 7, 3, 1]}, [(2, [7, 4, 3], 7), (7, [9, 8, 7], None)]),
+    # Intersection 9 7 5 3 1.
+    ('and', {'aws': [10, 9, 7, 5, 3, 1], 'python': [9, 8, 7, 5, 3, 1]}, [(1, [7, 5, 3], 7), (7, [9, 7], None)]),
+])
+def test_newer_pages_read_upwards_like_the_primary_feed(dynamodb, mode, partitions, pages):
+    """The articles just newer than the cursor, newest first, and where to keep going up (as in paginate_backwards)."""
+    _tag_index(dynamodb, partitions)
+
+    for cursor, expected, newer in pages:
+        items, newer_key = multi_tag_page(sorted(partitions), mode, 3, {'SK': cursor}, direction='newer')
+        assert [item['SK'] for item in items] == expected
+        assert newer_key == (newer and {'SK': newer})
+
+
+def test_newer_tag_feed_pages_carry_the_tag_in_their_cursors(dynamodb, monkeypatch):
+    from chalicelib import paginator_v2
+    monkeypatch.setattr(paginator_v2, 'PAGE_SIZE', 2)
+    _tag_index(dynamodb, {'aws': [6, 5, 4, 3, 2, 1]})
+
+    items, next_key, prev_key = paginator_v2.tag_fetch('aws', {'PK': 'aws', 'SK': 2}, direction='newer')
+
+    assert [item['SK'] for item in items] == [4, 3]
+    assert paginator_v2._unb64(prev_key) == {'PK': 'aws', 'SK': 4}
+    assert paginator_v2._unb64(next_key) == {'PK': 'aws', 'SK': 2}
@@ -0,0 +1,137 @@
+from unittest.mock import MagicMock, patch
+
+from botocore.exceptions import ClientError
+from jinja2 import Environment, BaseLoader, DictLoader
+
+from chalicelib.template_store import TemplateStore
+
+
+def _s3_with_body(body: bytes, etag: str = '"v1"'):
+    mock_s3 = MagicMock()
+    mock_obj = MagicMock()
+    mock_body = MagicMock()
+    mock_s3.Object.return_value = mock_obj
+    mock_obj.get.return_value = {'Body': mock_body, 'ETag': etag}
+    mock_body.read.return_value = body
+    return mock_s3, mock_obj
+
+
+def test_template_store_serves_hits_within_ttl():
+    env = Environment(loader=BaseLoader())
+    store = TemplateStore(ttl=60)
+    mock_s3, mock_obj = _s3_with_body(b'Hello {{ name }}')
+
+    with patch('boto3.resource', return_value=mock_s3):
+        first = store.get_template(env, 'bucket', 'frontend/index.html')
+        second = store.get_template(env, 'bucket', 'frontend/index.html')
+
+    assert first is second
+    assert first.render(name='World') == 'Hello World'
+    assert mock_obj.get.call_count == 1
+    assert store.counters['misses'] == 1
+    assert store.counters['hits'] == 1
+    assert store.etag('bucket', 'frontend/index.html') == '"v1"'
+
+
+def test_template_store_revalidates_with_if_none_match():
+    env = Environment(loader=BaseLoader())
+    store = TemplateStore(ttl=0)
+    mock_s3, mock_obj = _s3_with_body(b'Hello')
+
+    with patch('boto3.resource', return_value=mock_s3):
+        first = store.get_template(env, 'bucket', 'frontend/404.html')
+
+        not_modified = ClientError({'Error': {'Code': '304', 'Message': 'Not Modified'}}, 'GetObject')
+        mock_obj.get.side_effect = not_modified
+        second = store.get_template(env, 'bucket', 'frontend/404.html')
+
+    assert first is second
+    mock_obj.get.assert_called_with(IfNoneMatch='"v1"')
+    assert store.counters['revalidations'] == 1
+    assert store.counters['not_modified'] == 1
+
+
+def test_template_store_recompiles_when_etag_changes():
+    env = Environment(loader=BaseLoader())
+    store = TemplateStore(ttl=0)
+    mock_s3, mock_obj = _s3_with_body(b'old')
+
+    with patch('boto3.resource', return_value=mock_s3):
+        first = store.get_template(env, 'bucket', 'frontend/article.html')
+
+        new_body = MagicMock()
+        new_body.read.return_value = b'new'
+        mock_obj.get.return_value = {'Body': new_body, 'ETag': '"v2"'}
+        second = store.get_template(env, 'bucket', 'frontend/article.html')
+
+    assert first.render() == 'old'
+    assert second.render() == 'new'
+    assert store.etag('bucket', 'frontend/article.html') == '"v2"'
+
+
+def test_template_store_applies_preprocess():
+    env = Environment(loader=BaseLoader())
+    store = TemplateStore(ttl=60)
+    mock_s3, _ = _s3_with_body(b'three@__THREEJS_VERSION__')
+
+    with patch('boto3.resource', return_value=mock_s3):
+        template = store.get_template(env, 'bucket', 'frontend/index.html',
+                                      preprocess=lambda s: s.replace('__THREEJS_VERSION__', '0.172.0'))
+
+    assert template.render() == 'three@0.172.0'
+
+
+def test_template_store_prefers_precompiled_until_stale():
+    from jinja2 import DictLoader
+
+    env = Environment(loader=DictLoader({'404.html': 'deployed'}))
+    store = TemplateStore(ttl=0)
+    store.register_precompiled('bucket', {'frontend/404.html': {'name': '404.html', 'etag': '"deployed"'}})
+    mock_s3, mock_obj = _s3_with_body(b'from s3', etag='"newer"')
+
+    with patch('boto3.resource', return_value=mock_s3):
+        first = store.get_template(env, 'bucket', 'frontend/404.html')
+        assert mock_obj.get.call_count == 0
+
+        # The deployed ETag no longer matches S3, so the next revalidation compiles the S3 copy.
+        second = store.get_template(env, 'bucket', 'frontend/404.html')
+
+    assert first.render() == 'deployed'
+    assert second.render() == 'from s3'
+    mock_obj.get.assert_called_with(IfNoneMatch='"deployed"')
+    assert store.counters['precompiled'] == 1
+
+
+def test_template_store_keeps_serving_for_a_ttl_after_a_failed_revalidation():
+    env = Environment(loader=BaseLoader())
+    store = TemplateStore(ttl=60)
+    mock_s3, mock_obj = _s3_with_body(b'cached')
+
+    with patch('boto3.resource', return_value=mock_s3), patch('chalicelib.template_store.time.monotonic') as clock:
+        clock.return_value = 0
+        first = store.get_template(env, 'bucket', 'frontend/index.html')
+
+        mock_obj.get.side_effect = ClientError({'Error': {'Code': 'SlowDown', 'Message': 'Slow Down'}}, 'GetObject')
+        clock.return_value = 61
+        second = store.get_template(env, 'bucket', 'frontend/index.html')
+        clock.return_value = 62
+        third = store.get_template(env, 'bucket', 'frontend/index.html')
+
+    assert first is second is third
+    assert mock_obj.get.call_count == 2
+    assert store.counters['errors'] == 1
+
+
+def test_template_store_records_the_variables_a_template_references():
+    store = TemplateStore(ttl=60)
+    mock_s3, _ = _s3_with_body(b'{% set x = 1 %}{{ newer_article.title }} {{ x }}')
+    env = Environment(loader=DictLoader({'article.html': 'compiled'}))
+    store.register_precompiled('bucket', {'frontend/article.html': dict(name='article.html', etag='"v0"',
+                                                                       variables=['older_article'])})
+
+    with patch('boto3.resource', return_value=mock_s3):
+        from_s3 = store.get_entry(Environment(loader=BaseLoader()), 'bucket', 'frontend/index.html')
+    precompiled = store.get_entry(env, 'bucket', 'frontend/article.html')
+
+    assert from_s3.variables == {'newer_article'}
+    assert precompiled.variables == {'older_article'}